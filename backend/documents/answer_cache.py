@@ -0,0 +1,90 @@
+# documents/answer_cache.py
+"""Cache of ask_question results.
+
+Answers are stored in the ANSWER_CACHE_ALIAS cache. Size and lifetime come
+from that cache's MAX_ENTRIES and TIMEOUT. A key combines the document id,
+the document's ``generation``, the normalised question (lowercased, with
+whitespace collapsed), the number of chunks, the page filter and the
+retrieval mode.
+
+``Document.generation`` is bumped in the database whenever what a question
+can retrieve changes: when the document's inverted index is saved (which
+processing, incremental updates and index rebuilds all do), when its vectors
+are stored, when its file is replaced and when boilerplate detection links
+its chunks (``bump_generation``). Keys of older generations are
+never looked up again and age out of the cache. Because the generation
+lives in the database, a document reprocessed by an ingestion worker in
+another process invalidates the answers cached by every web process. A
+deleted document has no generation, so its answers are never served.
+
+Hit and miss counts are kept per process; see ``cache_stats`` and
+``reset_stats`` (GET and DELETE /api/ask/cache/).
+"""
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import Document
+
+_counts = {'hits': 0, 'misses': 0}
+_counts_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    return ' '.join(question.lower().split())
+
+
+def cache_key(document_id: int, generation: int, question: str, num_chunks: int,
+              page_number: Optional[int], mode: str) -> str:
+    # Hashed so any question fits the backend's key length limit (250 characters for memcached)
+    digest = hashlib.sha256(normalize_question(question).encode()).hexdigest()
+    return f"answer:{document_id}:{generation}:{mode}:{num_chunks}:{page_number or 0}:{digest}"
+
+
+def document_generation(document_id: int) -> Optional[int]:
+    return Document.objects.filter(id=document_id).values_list('generation', flat=True).first()
+
+
+def bump_generation(document_id: int):
+    """Invalidate every cached answer about the document"""
+    Document.objects.filter(id=document_id).update(generation=F('generation') + 1)
+
+
+def _count(outcome: str):
+    with _counts_lock:
+        _counts[outcome] += 1
+
+
+def get_answer(key: str) -> Optional[Dict[str, Any]]:
+    answer = caches[settings.ANSWER_CACHE_ALIAS].get(key)
+    _count('hits' if answer is not None else 'misses')
+    return answer
+
+
+def store_answer(key: str, answer: Dict[str, Any]):
+    caches[settings.ANSWER_CACHE_ALIAS].set(key, answer)
+
+
+def cache_stats() -> Dict[str, Any]:
+    """This process's hit and miss counts and the cache's configured limits"""
+    with _counts_lock:
+        hits, misses = _counts['hits'], _counts['misses']
+    config = settings.CACHES[settings.ANSWER_CACHE_ALIAS]
+    return {
+        'enabled': settings.ANSWER_CACHE_ENABLED,
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'backend': config['BACKEND'],
+        'max_entries': config.get('OPTIONS', {}).get('MAX_ENTRIES'),
+        'timeout': config.get('TIMEOUT'),
+    }
+
+
+def reset_stats():
+    with _counts_lock:
+        _counts.update(hits=0, misses=0)
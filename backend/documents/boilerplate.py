@@ -0,0 +1,141 @@
+# documents/boilerplate.py
+"""Boilerplate chunk detection.
+
+Chunks repeated across documents (disclaimers, headers, legal footers) are
+recognised by MinHash signature. Known boilerplate is stored once in
+``BoilerplateChunk`` rows. Ingestion looks every new chunk up in an in-memory
+LSH index of their signatures; a match is stored as a link to the boilerplate
+row without its own text and is left out of retrieval. ``detect_boilerplate``
+finds new boilerplate among the stored chunks (``manage.py detect_boilerplate``).
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from . import minhash
+from .answer_cache import bump_generation
+from .chunking import content_hash
+from .embeddings import discard_boilerplate_vectors
+from .inverted_index import index_stored_document
+from .models import BoilerplateChunk, DocumentChunk
+from .pipeline import batched
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_boilerplate_index() -> minhash.MinHashLSH:
+    """LSH index of known boilerplate signatures, rebuilt when boilerplate rows change"""
+    global _index, _index_version
+    version = BoilerplateChunk.objects.aggregate(count=Count('id'), latest=Max('id'))
+    version = (version['count'], version['latest'], settings.MINHASH_NUM_PERM)
+    with _index_lock:
+        if _index is None or version != _index_version:
+            index = minhash.MinHashLSH()
+            for pk, data in BoilerplateChunk.objects.values_list('id', 'minhash'):
+                signature = minhash.from_bytes(data)
+                if len(signature) == settings.MINHASH_NUM_PERM:
+                    index.add(pk, signature)
+            _index, _index_version = index, version
+        return _index
+
+
+def backfill_chunk_signatures(recompute: bool, batch_size: int) -> int:
+    """Compute missing (or, with ``recompute``, all) signatures of non-boilerplate chunks"""
+    chunks = DocumentChunk.objects.filter(boilerplate__isnull=True)
+    if not recompute:
+        chunks = chunks.filter(minhash__isnull=True)
+    updated = 0
+    for batch in batched(chunks.only('id', 'chunk_text').iterator(chunk_size=batch_size), batch_size):
+        for chunk in batch:
+            chunk.minhash = minhash.to_bytes(minhash.signature(chunk.chunk_text))
+        DocumentChunk.objects.bulk_update(batch, ['minhash'])
+        updated += len(batch)
+    return updated
+
+
+def _link(boilerplate_id: int, chunk_ids) -> int:
+    linked = 0
+    for ids in batched(chunk_ids, 500):
+        linked += DocumentChunk.objects.filter(id__in=ids).update(boilerplate_id=boilerplate_id, chunk_text='')
+    return linked
+
+
+def detect_boilerplate(min_documents: Optional[int] = None, threshold: Optional[float] = None,
+                       recompute: bool = False, batch_size: int = 1000) -> Dict[str, Any]:
+    """Link stored chunks to known boilerplate and promote new near-duplicate clusters.
+
+    Chunks are clustered greedily: each chunk joins the first cluster whose
+    leader it matches through LSH, otherwise it leads a new cluster. Clusters
+    spanning at least ``min_documents`` documents become boilerplate; the
+    leader's text is kept once and every member is linked to it. Documents
+    that gained boilerplate links are re-indexed without those chunks, and
+    the linked chunks' vectors are dropped.
+    """
+    min_documents = min_documents or settings.BOILERPLATE_MIN_DOCUMENTS
+    threshold = settings.BOILERPLATE_SIMILARITY if threshold is None else threshold
+    stats = {'signatures_computed': backfill_chunk_signatures(recompute, batch_size)}
+
+    known = get_boilerplate_index()
+    known_matches = defaultdict(list)
+    leaders = minhash.MinHashLSH(threshold)
+    members = defaultdict(list)  # leader chunk id -> [(chunk id, document id)]
+
+    chunks = (
+        DocumentChunk.objects.filter(boilerplate__isnull=True, minhash__isnull=False)
+        .order_by('id')
+        .values_list('id', 'document_id', 'minhash')
+    )
+    scanned = 0
+    for chunk_id, document_id, data in chunks.iterator(chunk_size=batch_size):
+        scanned += 1
+        signature = minhash.from_bytes(data)
+        if len(signature) != settings.MINHASH_NUM_PERM:
+            continue
+        boilerplate_id = known.match(signature) if len(known) else None
+        if boilerplate_id is not None:
+            known_matches[boilerplate_id].append((chunk_id, document_id))
+            continue
+        leader = leaders.match(signature)
+        if leader is None:
+            leaders.add(chunk_id, signature)
+            leader = chunk_id
+        members[leader].append((chunk_id, document_id))
+
+    linked = 0
+    affected = set()
+    for boilerplate_id, matches in known_matches.items():
+        linked += _link(boilerplate_id, [chunk_id for chunk_id, _ in matches])
+        affected.update(document_id for _, document_id in matches)
+
+    created = 0
+    for leader, cluster in members.items():
+        document_count = len({document_id for _, document_id in cluster})
+        if document_count < min_documents:
+            continue
+        text = DocumentChunk.objects.get(id=leader).chunk_text
+        with transaction.atomic():
+            boilerplate = BoilerplateChunk.objects.create(
+                chunk_text=text,
+                content_hash=content_hash(text),
+                minhash=minhash.to_bytes(leaders.signatures[leader]),
+                document_count=document_count
+            )
+            linked += _link(boilerplate.pk, [chunk_id for chunk_id, _ in cluster])
+        affected.update(document_id for _, document_id in cluster)
+        created += 1
+
+    for document_id in affected:
+        with transaction.atomic():
+            # Linked chunks lost their text; cached answers may quote it
+            bump_generation(document_id)
+            index_stored_document(document_id)
+        discard_boilerplate_vectors(document_id)
+
+    stats.update({'chunks_scanned': scanned, 'boilerplate_created': created, 'chunks_linked': linked})
+    return stats
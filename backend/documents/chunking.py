@@ -0,0 +1,256 @@
+# documents/chunking.py
+"""Paragraph-based, token-aware text chunking.
+
+The chunker works on an iterator of paragraphs so the same boundary logic serves
+in-memory text, files streamed from disk in fixed-size blocks, and extracted
+pages. Paragraphs and chunks carry their character offsets into the source.
+Chunks hold at most CHUNK_SIZE tokens and consecutive chunks share up to
+CHUNK_OVERLAP tokens of trailing paragraphs. Paragraphs longer than a chunk are
+split at sentence boundaries, and only sentences longer than a chunk are cut
+into token windows.
+"""
+import hashlib
+import re
+import unicodedata
+from itertools import groupby
+from typing import Iterable, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from django.conf import settings
+
+from .sentences import sentence_spans
+from .tokens import get_tokenizer
+
+PARAGRAPH_SEPARATOR = '\n\n'
+
+# Characters read from disk per block when streaming
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+# (text, start_char, end_char) of a stripped paragraph
+Paragraph = Tuple[str, int, int]
+
+# (page_number, paragraph)
+PageParagraph = Tuple[int, Paragraph]
+
+# Control characters other than tab and newline, e.g. NULs left by PDF extraction
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b-\x1f\x7f]')
+
+
+class TextChunk(NamedTuple):
+    text: str
+    start_char: int  # Offset of the first character in the source text
+    end_char: int  # Offset just past the last character in the source text
+    page_number: int = 1
+    token_count: Optional[int] = None
+
+
+class _Piece(NamedTuple):
+    text: str
+    start: int
+    end: int
+    tokens: int
+    joiner: str = PARAGRAPH_SEPARATOR  # Put before the piece when it follows another one in a chunk
+    joiner_tokens: Optional[int] = None  # Tokens in ``joiner``; None means the paragraph separator's
+
+
+def _scan_paragraphs(buffer: str, base: int, final: bool, search_from: int = 0) -> Tuple[List[Paragraph], int]:
+    """Find the complete paragraphs in ``buffer``.
+
+    Returns the paragraphs (offsets shifted by ``base``) and the position where
+    the unfinished tail starts. With ``final`` the tail is emitted as well.
+    ``buffer[:search_from]`` is known to hold no separator and is not searched.
+    """
+    paragraphs = []
+    sep_len = len(PARAGRAPH_SEPARATOR)
+    pos = 0
+    while True:
+        idx = buffer.find(PARAGRAPH_SEPARATOR, max(pos, search_from))
+        if idx == -1:
+            if not final:
+                break
+            idx = len(buffer)
+        raw = buffer[pos:idx]
+        para = raw.strip()
+        if para:
+            start = base + pos + len(raw) - len(raw.lstrip())
+            paragraphs.append((para, start, start + len(para)))
+        pos = idx + sep_len
+        if pos > len(buffer):
+            break
+    return paragraphs, pos
+
+
+def split_paragraphs(text: str, offset: int = 0) -> Iterator[Paragraph]:
+    """Yield the non-empty, stripped paragraphs of an in-memory string"""
+    paragraphs, _ = _scan_paragraphs(text, offset, final=True)
+    yield from paragraphs
+
+
+def iter_paragraphs(stream: TextIO, block_size: int = STREAM_BLOCK_SIZE) -> Iterator[Paragraph]:
+    """Yield the same paragraphs as ``split_paragraphs`` while reading ``stream`` incrementally.
+
+    Only the unfinished tail of the previous block is carried over, so memory is
+    bounded by the block size plus the longest paragraph. The tail is kept as a
+    list of blocks holding no separator and is only joined and scanned once a
+    block completes it, so a long run of text without separators costs linear
+    time.
+    """
+    tail: List[str] = []
+    tail_len = 0
+    base = 0
+    overlap = len(PARAGRAPH_SEPARATOR) - 1  # Characters of a separator that may end the previous block
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        edge = tail[-1][-overlap:] if tail else ''
+        if PARAGRAPH_SEPARATOR not in edge + block:
+            tail.append(block)
+            tail_len += len(block)
+            continue
+        buffer = ''.join(tail) + block
+        paragraphs, pos = _scan_paragraphs(buffer, base, final=False, search_from=max(0, tail_len - overlap))
+        yield from paragraphs
+        tail = [buffer[pos:]]
+        tail_len = len(buffer) - pos
+        base += pos
+
+    paragraphs, _ = _scan_paragraphs(''.join(tail), base, final=True, search_from=max(0, tail_len - overlap))
+    yield from paragraphs
+
+
+def _token_windows(text: str, start: int, tokenizer, chunk_size: int, chunk_overlap: int) -> List[_Piece]:
+    """Cut text longer than ``chunk_size`` tokens into overlapping token windows"""
+    token_starts = tokenizer.token_starts(text)
+    num_tokens = len(token_starts)
+    step = max(1, chunk_size - chunk_overlap)
+    pieces = []
+    for first in range(0, num_tokens, step):
+        last = min(first + chunk_size, num_tokens)
+        raw = text[token_starts[first]:token_starts[last] if last < num_tokens else len(text)]
+        piece_text = raw.strip()
+        if piece_text:
+            piece_start = start + token_starts[first] + len(raw) - len(raw.lstrip())
+            pieces.append(_Piece(piece_text, piece_start, piece_start + len(piece_text), last - first))
+        if last == num_tokens:
+            break
+    return pieces
+
+
+def _split_long_paragraph(para: str, start: int, tokenizer, chunk_size: int, chunk_overlap: int) -> List[_Piece]:
+    """Split a paragraph longer than ``chunk_size`` tokens into sentence pieces.
+
+    Sentences keep the whitespace that preceded them in the paragraph as their
+    joiner, so a chunk made of consecutive sentences reproduces the source text.
+    """
+    pieces = []
+    previous_end = None
+    for sentence_start, sentence_end in sentence_spans(para):
+        sentence = para[sentence_start:sentence_end]
+        tokens = tokenizer.count(sentence)
+        if tokens > chunk_size:
+            pieces.extend(_token_windows(sentence, start + sentence_start, tokenizer, chunk_size, chunk_overlap))
+        elif previous_end is None:
+            pieces.append(_Piece(sentence, start + sentence_start, start + sentence_end, tokens))
+        else:
+            joiner = para[previous_end:sentence_start]
+            pieces.append(_Piece(sentence, start + sentence_start, start + sentence_end, tokens,
+                                 joiner, tokenizer.count(joiner)))
+        previous_end = sentence_end
+    return pieces
+
+
+def iter_chunks(paragraphs: Iterable[Paragraph], page_number: int = 1,
+                chunk_size: Optional[int] = None, chunk_overlap: Optional[int] = None,
+                tokenizer=None) -> Iterator[TextChunk]:
+    """Pack paragraphs into chunks of at most ``chunk_size`` tokens.
+
+    Each paragraph is tokenized once. When a chunk is full, its trailing
+    paragraphs totalling at most ``chunk_overlap`` tokens open the next chunk.
+    Paragraphs longer than ``chunk_size`` are packed sentence by sentence in the
+    same way. Runs in time linear in the input.
+    """
+    chunk_size = chunk_size or settings.CHUNK_SIZE
+    chunk_overlap = settings.CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    chunk_overlap = min(chunk_overlap, chunk_size - 1)
+    tokenizer = tokenizer or get_tokenizer()
+    sep_tokens = tokenizer.count(PARAGRAPH_SEPARATOR)
+
+    window = []  # _Piece list of the chunk being built
+    window_tokens = 0  # Tokens in the window, including separators
+
+    def joiner_tokens(piece):
+        return sep_tokens if piece.joiner_tokens is None else piece.joiner_tokens
+
+    def make_chunk():
+        text = window[0].text + ''.join(piece.joiner + piece.text for piece in window[1:])
+        return TextChunk(text, window[0].start, window[-1].end, page_number, window_tokens)
+
+    for para, para_start, para_end in paragraphs:
+        tokens = tokenizer.count(para)
+        if tokens > chunk_size:
+            pieces = _split_long_paragraph(para, para_start, tokenizer, chunk_size, chunk_overlap)
+        else:
+            pieces = [_Piece(para, para_start, para_end, tokens)]
+
+        for piece in pieces:
+            if window and window_tokens + joiner_tokens(piece) + piece.tokens > chunk_size:
+                yield make_chunk()
+
+                # Carry trailing pieces that fit in the overlap budget and leave room for this piece
+                carried = []
+                carried_tokens = 0
+                for previous in reversed(window):
+                    cost = previous.tokens + (joiner_tokens(carried[-1]) if carried else 0)
+                    if carried_tokens + cost > chunk_overlap:
+                        break
+                    carried.append(previous)
+                    carried_tokens += cost
+                carried.reverse()
+                while carried and carried_tokens + joiner_tokens(piece) + piece.tokens > chunk_size:
+                    dropped = carried.pop(0)
+                    carried_tokens -= dropped.tokens + (joiner_tokens(carried[0]) if carried else 0)
+                window = carried
+                window_tokens = carried_tokens
+
+            window_tokens += piece.tokens + (joiner_tokens(piece) if window else 0)
+            window.append(piece)
+
+    if window:
+        yield make_chunk()
+
+
+def normalize_paragraph(paragraph: Paragraph) -> Paragraph:
+    """NFC-normalise a paragraph's text and drop control characters; offsets still refer to the source"""
+    text, start, end = paragraph
+    if not text.isascii():
+        text = unicodedata.normalize('NFC', text)
+    return CONTROL_CHARS_RE.sub('', text), start, end
+
+
+def iter_page_paragraphs(pages: Iterable[str]) -> Iterator[PageParagraph]:
+    """Tag the paragraphs of extracted pages with their page number.
+
+    Offsets refer to the pages joined with ``PARAGRAPH_SEPARATOR``.
+    """
+    offset = 0
+    for page_number, page_text in enumerate(pages, start=1):
+        for paragraph in split_paragraphs(page_text, offset):
+            yield page_number, paragraph
+        offset += len(page_text) + len(PARAGRAPH_SEPARATOR)
+
+
+def chunk_page_paragraphs(paragraphs: Iterable[PageParagraph]) -> Iterator[TextChunk]:
+    """Chunk page-tagged paragraphs so no chunk spans a page boundary"""
+    for page_number, group in groupby(paragraphs, key=lambda item: item[0]):
+        yield from iter_chunks((paragraph for _, paragraph in group), page_number)
+
+
+def stream_file_chunks(file_path: str, block_size: int = STREAM_BLOCK_SIZE) -> Iterator[TextChunk]:
+    """Yield chunks of a UTF-8 text file without reading it into memory"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        yield from iter_chunks(iter_paragraphs(file, block_size))
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of a chunk's text, used to detect unchanged chunks"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
@@ -0,0 +1,199 @@
+# documents/compression.py
+"""Per-row compression of chunk text at rest.
+
+Every stored value is a self-describing frame: one codec byte, a 4-byte
+dictionary id for the dictionary codecs, then the payload. Frames written with
+any codec or dictionary stay readable after CHUNK_TEXT_CODEC changes or a new
+dictionary is trained, so rows never need rewriting in lockstep.
+
+zstd needs the optional ``zstandard`` package; without it zlib is used.
+Dictionaries are trained per corpus (``manage.py train_compression_dictionary``)
+and stored in ``CompressionDictionary`` rows, which are never modified.
+"""
+import struct
+import threading
+import zlib
+from collections import Counter
+from functools import lru_cache
+from typing import Callable, Iterable, Optional, Tuple
+
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAW = 0
+ZLIB = 1
+ZSTD = 2
+ZLIB_DICT = 3
+ZSTD_DICT = 4
+
+DICT_ID = struct.Struct('>I')
+
+# zlib only looks back 32KB, so a larger preset dictionary is wasted
+ZLIB_MAX_DICT_SIZE = 32 * 1024
+
+DEFAULT_LEVELS = {'zlib': 6, 'zstd': 3}
+
+# (dictionary id, dictionary bytes)
+Dictionary = Tuple[int, bytes]
+
+_zstd_local = threading.local()  # zstandard (de)compressors are not thread-safe
+
+
+class CompressedText(bytes):
+    """A stored frame as loaded from the database; ``str()`` decompresses it"""
+
+    def __str__(self):
+        return decompress(self)
+
+
+@lru_cache(maxsize=None)
+def get_codec() -> str:
+    codec = settings.CHUNK_TEXT_CODEC
+    if codec == 'zstd' and zstandard is None:
+        print("Compression: zstandard is not installed; compressing chunk text with zlib")
+        return 'zlib'
+    return codec
+
+
+def get_level(codec: str) -> int:
+    return settings.CHUNK_TEXT_COMPRESSION_LEVEL or DEFAULT_LEVELS[codec]
+
+
+def _zstd_compressor(level: int, dictionary: Optional[Dictionary]):
+    cache = _zstd_local.__dict__.setdefault('compressors', {})
+    key = (level, dictionary[0] if dictionary else None)
+    if key not in cache:
+        dict_data = zstandard.ZstdCompressionDict(dictionary[1]) if dictionary else None
+        cache[key] = zstandard.ZstdCompressor(level=level, dict_data=dict_data)
+    return cache[key]
+
+
+def _zstd_decompressor(dictionary: Optional[Dictionary]):
+    cache = _zstd_local.__dict__.setdefault('decompressors', {})
+    key = dictionary[0] if dictionary else None
+    if key not in cache:
+        dict_data = zstandard.ZstdCompressionDict(dictionary[1]) if dictionary else None
+        cache[key] = zstandard.ZstdDecompressor(dict_data=dict_data)
+    return cache[key]
+
+
+def encode(text: str, codec: str, level: Optional[int] = None, dictionary: Optional[Dictionary] = None,
+           min_size: int = 0) -> bytes:
+    """Frame ``text`` with an explicit codec and optional dictionary.
+
+    Text shorter than ``min_size`` bytes, or that does not shrink, is stored raw.
+    """
+    data = text.encode('utf-8')
+    if codec == 'none' or len(data) < min_size:
+        return bytes([RAW]) + data
+
+    level = level or DEFAULT_LEVELS[codec]
+    if codec == 'zlib':
+        if dictionary:
+            compressor = zlib.compressobj(level, zdict=dictionary[1])
+            frame = bytes([ZLIB_DICT]) + DICT_ID.pack(dictionary[0]) + compressor.compress(data) + compressor.flush()
+        else:
+            frame = bytes([ZLIB]) + zlib.compress(data, level)
+    elif codec == 'zstd':
+        payload = _zstd_compressor(level, dictionary).compress(data)
+        if dictionary:
+            frame = bytes([ZSTD_DICT]) + DICT_ID.pack(dictionary[0]) + payload
+        else:
+            frame = bytes([ZSTD]) + payload
+    else:
+        raise ValueError(f"Unknown chunk text codec: {codec}")
+
+    if len(frame) > len(data):
+        return bytes([RAW]) + data
+    return frame
+
+
+def decode(frame: bytes, load_dictionary: Optional[Callable[[int], bytes]] = None) -> str:
+    """Decompress a frame written by ``encode``"""
+    frame = memoryview(frame)
+    codec = frame[0]
+    if codec == RAW:
+        return str(frame[1:], 'utf-8')
+    if codec == ZLIB:
+        return str(zlib.decompress(frame[1:]), 'utf-8')
+
+    if codec in (ZLIB_DICT, ZSTD_DICT):
+        dict_id = DICT_ID.unpack_from(frame, 1)[0]
+        dictionary = (dict_id, (load_dictionary or load_stored_dictionary)(dict_id))
+        payload = frame[1 + DICT_ID.size:]
+    else:
+        dictionary = None
+        payload = frame[1:]
+
+    if codec == ZLIB_DICT:
+        return str(zlib.decompressobj(zdict=dictionary[1]).decompress(payload), 'utf-8')
+    if codec in (ZSTD, ZSTD_DICT):
+        if zstandard is None:
+            raise RuntimeError('Chunk text was stored with zstd; install the zstandard package to read it')
+        return str(_zstd_decompressor(dictionary).decompress(payload), 'utf-8')
+    raise ValueError(f"Unknown chunk text frame type: {codec}")
+
+
+def compress(text: str) -> bytes:
+    """Frame ``text`` according to the CHUNK_TEXT_* settings"""
+    codec = get_codec()
+    dictionary = get_active_dictionary(codec) if settings.CHUNK_TEXT_USE_DICTIONARY and codec != 'none' else None
+    return encode(text, codec, get_level(codec) if codec != 'none' else None, dictionary,
+                  settings.CHUNK_TEXT_MIN_COMPRESS_SIZE)
+
+
+def decompress(frame: bytes) -> str:
+    return decode(frame)
+
+
+@lru_cache(maxsize=16)
+def load_stored_dictionary(dict_id: int) -> bytes:
+    from .models import CompressionDictionary
+
+    return bytes(CompressionDictionary.objects.values_list('data', flat=True).get(id=dict_id))
+
+
+@lru_cache(maxsize=None)
+def get_active_dictionary(codec: str) -> Optional[Dictionary]:
+    """Newest trained dictionary for ``codec``, cached for the life of the process"""
+    from .models import CompressionDictionary
+
+    latest = CompressionDictionary.objects.filter(codec=codec).order_by('-id').values_list('id', 'data').first()
+    if latest is None:
+        return None
+    return latest[0], bytes(latest[1])
+
+
+def clear_dictionary_cache():
+    get_active_dictionary.cache_clear()
+
+
+def train_dictionary(samples: Iterable[str], codec: str, size: int) -> bytes:
+    """Build a shared dictionary from sample chunk texts.
+
+    zstd uses its own trainer. zlib takes a preset dictionary of raw content, so
+    the most frequent word trigrams are packed in, most frequent last because
+    zlib encodes nearer matches more cheaply.
+    """
+    samples = [text.encode('utf-8') for text in samples]
+    if codec == 'zstd':
+        return zstandard.train_dictionary(size, samples).as_bytes()
+
+    size = min(size, ZLIB_MAX_DICT_SIZE)
+    trigrams = Counter()
+    for sample in samples:
+        words = sample.split()
+        trigrams.update(b' '.join(words[i:i + 3]) for i in range(len(words) - 2))
+
+    selected = []
+    used = 0
+    for trigram, count in trigrams.most_common():
+        if count < 2 or used + len(trigram) + 1 > size:
+            break
+        selected.append(trigram)
+        used += len(trigram) + 1
+    return b' '.join(reversed(selected))
@@ -0,0 +1,108 @@
+# documents/embedding_cache.py
+"""On-disk cache of chunk embeddings, keyed by encoder name and content hash.
+
+Re-uploads, re-chunking runs and boilerplate-like paragraphs shared by many
+documents hand the encoder byte-identical text again and again. The cache
+maps ``(encoder name, SHA-256 of the text)`` to the float32 vector. The
+ingestion paths look up every chunk first and encode only the misses, in one
+batched call. A warm cache makes re-ingesting an unchanged corpus cost
+almost no encoder time.
+
+Entries live in a SQLite file at EMBEDDING_CACHE_PATH. The file is separate
+from the application database, and every thread opens its own connection.
+WAL mode lets the web process and the ingestion worker processes read
+while another process writes. Entries are never invalidated: a key names
+both the text and the encoder that produced the vector. Delete the file to
+empty the cache.
+
+Cache errors are reported and treated as misses, so a broken cache file
+never stops ingestion.
+"""
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+from django.conf import settings
+
+from .pipeline import batched
+
+# Stays under SQLite's default limit of 999 bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._counts_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS embeddings ('
+                'model TEXT NOT NULL, content_hash TEXT NOT NULL, vector BLOB NOT NULL, '
+                'PRIMARY KEY (model, content_hash))'
+            )
+            self._local.connection = connection
+        return connection
+
+    def _count(self, hits: int, misses: int):
+        with self._counts_lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get_many(self, model: str, dimension: int, hashes: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Cached vectors of the given hashes; vectors of another size are treated as missing"""
+        found: Dict[str, np.ndarray] = {}
+        try:
+            connection = self._connection()
+            for keys in batched(list(dict.fromkeys(hashes)), LOOKUP_BATCH_SIZE):
+                rows = connection.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({','.join('?' * len(keys))})",
+                    [model, *keys],
+                )
+                for digest, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    if vector.size == dimension:
+                        found[digest] = vector
+        except sqlite3.Error as e:
+            print(f"Embedding cache: lookup failed ({e}); encoding every chunk")
+            found = {}
+        self._count(sum(1 for digest in hashes if digest in found), sum(1 for digest in hashes if digest not in found))
+        return found
+
+    def set_many(self, model: str, hashes: Sequence[str], vectors: np.ndarray):
+        try:
+            connection = self._connection()
+            with connection:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO embeddings (model, content_hash, vector) VALUES (?, ?, ?)',
+                    [(model, digest, np.ascontiguousarray(vector, dtype=np.float32).tobytes())
+                     for digest, vector in zip(hashes, vectors)],
+                )
+        except sqlite3.Error as e:
+            print(f"Embedding cache: store failed ({e})")
+
+    def stats(self) -> Dict[str, Any]:
+        """This process's hit and miss counts and the number of cached vectors per encoder"""
+        entries = dict(self._connection().execute('SELECT model, COUNT(*) FROM embeddings GROUP BY model').fetchall())
+        with self._counts_lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+
+
+@lru_cache(maxsize=None)
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """The shared cache, or None when EMBEDDING_CACHE_ENABLED is off"""
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    return EmbeddingCache(settings.EMBEDDING_CACHE_PATH)
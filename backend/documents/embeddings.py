@@ -0,0 +1,275 @@
+# documents/embeddings.py
+"""Dense chunk embeddings for semantic retrieval.
+
+Chunks are encoded in batches of EMBEDDING_BATCH_SIZE during ingestion (the
+pipeline's embed stage) and upserted into the vector store in bulk once the
+chunks are committed. Vectors are L2-normalised, so a dot product is a
+cosine similarity. ``Document.embedding_model`` names the encoder whose
+vectors of the document are in the store. Questions about a document whose
+vectors are missing (still being processed, or processed before embeddings
+existed) or come from another encoder fall back to lexical retrieval until
+its ingestion job or ``manage.py embed_documents`` embeds it.
+
+EMBEDDING_ENCODER selects the encoder:
+
+- 'sentence-transformers' loads EMBEDDING_MODEL.
+- 'hashing' is a small deterministic stand-in that needs no model download.
+  It hashes words and their character trigrams into signed buckets. It only
+  captures surface overlap, but it lets ingestion and semantic retrieval run
+  offline and in tests.
+- 'auto' uses sentence-transformers when the model loads and the stand-in
+  otherwise.
+
+Chunk text goes through ``encode_chunks``, which serves repeated text from
+the on-disk embedding cache (see documents/embedding_cache.py). Questions
+are encoded directly.
+"""
+import re
+import zlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .chunking import content_hash
+from .embedding_cache import get_embedding_cache
+from .hnsw import forget_document_vectors, index_vectors, search_chunks
+from .models import Document, DocumentChunk
+from .vector_store import Match, get_vector_store
+
+WORD_RE = re.compile(r'\w+')
+
+
+class HashingEncoder:
+    """Deterministic bag of words and character trigrams, feature-hashed into ``dimension`` signed buckets"""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.name = f"hashing-{dimension}"
+
+    @lru_cache(maxsize=1 << 16)
+    def _features(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Buckets and signed weights of a word and its trigrams"""
+        padded = f" {word} "
+        grams = [padded[i:i + 3] for i in range(len(padded) - 2)]
+        hashes = np.array([zlib.crc32(feature.encode()) for feature in [word] + grams], dtype=np.int64)
+        weights = np.where(hashes & (1 << 31), -1.0, 1.0)
+        weights[1:] *= 1 / len(grams)  # The trigrams of a word together weigh as much as the word
+        return hashes % self.dimension, weights
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float64)
+        for row, text in enumerate(texts):
+            features = [self._features(word) for word in WORD_RE.findall(text.lower())]
+            if features:
+                buckets = np.concatenate([bucket for bucket, _ in features])
+                weights = np.concatenate([weight for _, weight in features])
+                vectors[row] = np.bincount(buckets, weights=weights, minlength=self.dimension)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.where(norms > 0, norms, 1)).astype(np.float32)
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name: str, device: Optional[str] = None):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_name, device=device)
+        self.name = model_name
+        self.dimension = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(
+            list(texts), batch_size=settings.EMBEDDING_BATCH_SIZE, normalize_embeddings=True,
+            convert_to_numpy=True, show_progress_bar=False
+        )
+        return vectors.astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    encoder = settings.EMBEDDING_ENCODER
+    if encoder == 'hashing':
+        return HashingEncoder(settings.EMBEDDING_HASHING_DIMENSION)
+    try:
+        return SentenceTransformerEncoder(settings.EMBEDDING_MODEL, settings.EMBEDDING_DEVICE)
+    except Exception as e:
+        if encoder != 'auto':
+            raise
+        print(f"Embeddings: {settings.EMBEDDING_MODEL} unavailable ({e}); using the hashing stand-in encoder")
+        return HashingEncoder(settings.EMBEDDING_HASHING_DIMENSION)
+
+
+def get_store():
+    """The vector store of the configured encoder"""
+    return get_vector_store(get_encoder().name)
+
+
+def embeddings_enabled() -> bool:
+    """Whether ingestion should embed chunks"""
+    return settings.EMBED_ON_INGEST and get_store() is not None
+
+
+def encode_texts(texts: Sequence[str]) -> np.ndarray:
+    """Embed texts in batches of EMBEDDING_BATCH_SIZE"""
+    encoder = get_encoder()
+    if not texts:
+        return np.zeros((0, encoder.dimension), dtype=np.float32)
+    batch_size = settings.EMBEDDING_BATCH_SIZE
+    return np.concatenate([encoder.encode(texts[start:start + batch_size]) for start in range(0, len(texts), batch_size)])
+
+
+def encode_chunks(texts: Sequence[str]) -> np.ndarray:
+    """Embed chunk texts, taking cached vectors where the embedding cache has them.
+
+    Texts the cache misses are encoded in one ``encode_texts`` call, each
+    distinct text once, and added to the cache.
+    """
+    cache = get_embedding_cache()
+    if cache is None or not texts:
+        return encode_texts(texts)
+    encoder = get_encoder()
+    hashes = [content_hash(text) for text in texts]
+    found = cache.get_many(encoder.name, encoder.dimension, hashes)
+    missing = {digest: text for digest, text in zip(hashes, texts) if digest not in found}
+    if missing:
+        encoded = encode_texts(list(missing.values()))
+        cache.set_many(encoder.name, list(missing), encoded)
+        found.update(zip(missing, encoded))
+    return np.stack([found[digest] for digest in hashes])
+
+
+def _metadata(document_id: int, chunk_index: int, page_number: Optional[int]) -> Dict[str, Any]:
+    metadata = {'document_id': document_id, 'chunk_index': chunk_index}
+    if page_number is not None:
+        metadata['page_number'] = page_number
+    return metadata
+
+
+class DocumentVectors:
+    """Vector changes of one document, applied to the store after its chunks are committed.
+
+    With ``replace`` the document's stored vectors are dropped first.
+    """
+
+    def __init__(self, document_id: int, replace: bool = True):
+        self.document_id = document_id
+        self.replace = replace
+        self.ids: List[str] = []
+        self.vectors: List[np.ndarray] = []
+        self.metadatas: List[Dict[str, Any]] = []
+        self.moved: Dict[str, Dict[str, Any]] = {}
+        self.deleted: List[str] = []
+
+    def add(self, embedding_id: str, vector: np.ndarray, chunk_index: int, page_number: Optional[int]):
+        self.ids.append(embedding_id)
+        self.vectors.append(vector)
+        self.metadatas.append(_metadata(self.document_id, chunk_index, page_number))
+
+    def move(self, embedding_id: str, chunk_index: int, page_number: Optional[int]):
+        self.moved[embedding_id] = _metadata(self.document_id, chunk_index, page_number)
+
+    def delete(self, embedding_ids: Sequence[str]):
+        self.deleted.extend(embedding_ids)
+
+    def apply(self):
+        store = get_store()
+        if store is None:
+            return
+        if self.replace:
+            store.delete_document(self.document_id)
+        elif self.deleted:
+            store.delete(self.deleted)
+        if self.moved:
+            store.update_metadata(list(self.moved), list(self.moved.values()))
+        vectors = np.stack(self.vectors) if self.ids else np.zeros((0, get_encoder().dimension), dtype=np.float32)
+        if self.ids:
+            store.upsert(self.ids, vectors, self.metadatas)
+        embedded_at = timezone.now()
+        Document.objects.filter(id=self.document_id).update(
+            embedding_model=get_encoder().name, embedded_at=embedded_at, generation=F('generation') + 1
+        )
+        index_vectors(self.document_id, embedded_at, self.ids, vectors, self.deleted, self.replace)
+
+    def schedule(self):
+        """Apply once the current transaction commits; call inside the transaction that writes the chunks"""
+        if self.replace:
+            # Until the new vectors are stored the document counts as not embedded
+            Document.objects.filter(id=self.document_id).update(embedding_model='')
+        transaction.on_commit(self.apply)
+
+
+def embed_stored_document(document_id: int, batch_size: Optional[int] = None) -> int:
+    """Replace a document's vectors with embeddings of its stored chunks; boilerplate chunks are left out"""
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    vectors = DocumentVectors(document_id)
+    chunks = list(
+        DocumentChunk.objects.filter(document_id=document_id, boilerplate__isnull=True)
+        .order_by('chunk_index')
+        .values_list('embedding_id', 'chunk_index', 'page_number', 'chunk_text')
+    )
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        encoded = encode_chunks([str(text) for _, _, _, text in batch])
+        for (embedding_id, chunk_index, page_number, _), vector in zip(batch, encoded):
+            vectors.add(embedding_id, vector, chunk_index, page_number)
+    vectors.apply()
+    return len(chunks)
+
+
+def discard_boilerplate_vectors(document_id: int):
+    """Drop the vectors of a document's chunks that have since been linked to boilerplate"""
+    store = get_store()
+    if store is not None:
+        ids = DocumentChunk.objects.filter(document_id=document_id, boilerplate__isnull=False).values_list('embedding_id', flat=True)
+        ids = [embedding_id for embedding_id in ids if embedding_id]
+        store.delete(ids)
+        embedded_at = timezone.now()
+        Document.objects.filter(id=document_id).update(embedded_at=embedded_at, generation=F('generation') + 1)
+        index_vectors(document_id, embedded_at, [], np.zeros((0, get_encoder().dimension), dtype=np.float32), ids)
+
+
+def delete_document_vectors(document_id: int):
+    store = get_store()
+    if store is not None:
+        store.delete_document(document_id)
+    forget_document_vectors(document_id)
+
+
+def search_document(document_id: int, question: str, limit: int,
+                    page_number: Optional[int] = None) -> Optional[List[Match]]:
+    """Chunks of a document nearest to the question, or None when semantic retrieval is unavailable.
+
+    Retrieval is unavailable while the document has no vectors from the current
+    encoder; embedding it here would race its ingestion job inside the request.
+    """
+    store = get_store()
+    if store is None:
+        return None
+    encoder = get_encoder()
+    embedded_with = Document.objects.filter(id=document_id).values_list('embedding_model', flat=True).first()
+    if embedded_with is None:
+        return []
+    if embedded_with != encoder.name:
+        print(f"Document {document_id} has no {encoder.name} vectors yet")
+        return None
+    return store.search(encode_texts([question])[0], limit, document_id, page_number)
+
+
+def search_corpus(question: str, limit: int, document_ids: Optional[Sequence[int]] = None) -> Optional[List[Match]]:
+    """Chunks of all documents (or of ``document_ids``) nearest to the question, or None when semantic retrieval is unavailable.
+
+    Searching everything uses the HNSW index when one is built and enabled;
+    otherwise, and within given documents, the store is searched exactly.
+    """
+    store = get_store()
+    if store is None:
+        return None
+    vector = encode_texts([question])[0]
+    if document_ids is not None:
+        return store.search(vector, limit, document_ids=document_ids)
+    matches = search_chunks(vector, limit)
+    return matches if matches is not None else store.search(vector, limit)
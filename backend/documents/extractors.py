@@ -0,0 +1,116 @@
+# documents/extractors.py
+"""Text extraction for the binary document formats listed in ALLOWED_FILE_EXTENSIONS."""
+import math
+import os
+import zipfile
+from typing import Iterator, List
+from xml.etree import ElementTree
+
+from django.conf import settings
+
+from .chunking import PARAGRAPH_SEPARATOR, Paragraph
+
+W_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_BODY = W_NAMESPACE + 'body'
+W_P = W_NAMESPACE + 'p'
+W_T = W_NAMESPACE + 't'
+W_TAB = W_NAMESPACE + 'tab'
+W_BR = W_NAMESPACE + 'br'
+W_CR = W_NAMESPACE + 'cr'
+
+DOCUMENT_TYPES = {
+    '.pdf': 'pdf',
+    '.docx': 'docx',
+    '.doc': 'doc',
+    '.txt': 'txt',
+    '.md': 'md',
+}
+
+
+def get_document_type(file_name: str) -> str:
+    """Map a file name to one of Document.DOCUMENT_TYPE_CHOICES, defaulting to plain text"""
+    return DOCUMENT_TYPES.get(os.path.splitext(file_name)[1].lower(), 'txt')
+
+
+def count_pdf_pages(file_path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(file_path).pages)
+
+
+def extract_pdf_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages ``[start, stop)``; runs in a worker process"""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(file_path)
+    return [(reader.pages[i].extract_text() or '') for i in range(start, stop)]
+
+
+def extract_pdf_pages(file_path: str, parallel: bool = True) -> List[str]:
+    """Extract the text of every page of a PDF.
+
+    Large PDFs are split into page ranges extracted concurrently on the shared
+    process pool; each worker opens the file itself so only text crosses the
+    process boundary.
+    """
+    num_pages = count_pdf_pages(file_path)
+    if not parallel or num_pages < settings.PDF_PARALLEL_MIN_PAGES:
+        return extract_pdf_page_range(file_path, 0, num_pages)
+
+    from .processors import get_process_pool, get_process_pool_size
+
+    pool = get_process_pool()
+    pages_per_task = max(settings.PDF_PAGES_PER_TASK, math.ceil(num_pages / get_process_pool_size()))
+    futures = [
+        pool.submit(extract_pdf_page_range, file_path, start, min(start + pages_per_task, num_pages))
+        for start in range(0, num_pages, pages_per_task)
+    ]
+
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+
+def iter_docx_paragraphs(file_path: str) -> Iterator[Paragraph]:
+    """Stream the paragraphs of a DOCX file without building its document tree.
+
+    ``word/document.xml`` is read straight out of the zip archive by an
+    incremental XML parser. Each ``w:p`` element is turned into text as soon as
+    it closes and then discarded, along with every finished child of
+    ``w:body``, so memory stays flat however long the document is. Offsets refer
+    to the paragraphs joined with ``PARAGRAPH_SEPARATOR``.
+    """
+    offset = 0
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open('word/document.xml') as xml_file:
+            body = None
+            depth = 0
+            for event, elem in ElementTree.iterparse(xml_file, events=('start', 'end')):
+                if event == 'start':
+                    depth += 1
+                    if elem.tag == W_BODY:
+                        body, body_depth = elem, depth
+                    continue
+
+                if elem.tag == W_P:
+                    raw = ''.join(_paragraph_text(elem))
+                    para = raw.strip()
+                    if para:
+                        start = offset + len(raw) - len(raw.lstrip())
+                        yield para, start, start + len(para)
+                    offset += len(raw) + len(PARAGRAPH_SEPARATOR)
+                    elem.clear()
+                if body is not None and depth == body_depth + 1:
+                    del body[:]
+                depth -= 1
+
+
+def _paragraph_text(paragraph) -> Iterator[str]:
+    for node in paragraph.iter():
+        if node.tag == W_T:
+            yield node.text or ''
+        elif node.tag == W_TAB:
+            yield '\t'
+        elif node.tag in (W_BR, W_CR):
+            yield '\n'
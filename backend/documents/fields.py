@@ -0,0 +1,77 @@
+# documents/fields.py
+"""Model fields"""
+from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+
+from .compression import CompressedText, compress, decompress
+
+
+class CompressedTextDescriptor(DeferredAttribute):
+    """Decompress a loaded frame on first attribute access and keep the text on the instance"""
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+        value = super().__get__(instance, cls)
+        if isinstance(value, CompressedText):
+            value = decompress(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        # Defining __set__ makes this a data descriptor, so __get__ runs even once the value is in __dict__
+        instance.__dict__[self.field.attname] = value
+
+
+class CompressedTextField(models.BinaryField):
+    """Text stored as a compressed frame (see ``documents.compression``).
+
+    Reads and writes ``str`` through the model attribute. Rows are only
+    decompressed when the attribute is accessed, so loading chunks that are
+    never read costs no decompression; unchanged rows are saved back without
+    recompressing. ``values()``/``values_list()`` return ``CompressedText``
+    frames, which decompress with ``str()``. The column cannot be filtered on.
+    """
+
+    descriptor_class = CompressedTextDescriptor
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('editable', True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.editable:
+            kwargs.pop('editable', None)
+        else:
+            kwargs['editable'] = False
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return CompressedText(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, (str, CompressedText)):
+            return value
+        return CompressedText(value)
+
+    def pre_save(self, model_instance, add):
+        # Read past the descriptor so saving an unread value reuses the stored frame
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, CompressedText):
+            return value
+        return super().pre_save(model_instance, add)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or isinstance(value, CompressedText):
+            return value
+        return compress(str(value))
+
+    def get_default(self):
+        return models.Field.get_default(self)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
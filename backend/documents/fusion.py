@@ -0,0 +1,30 @@
+# documents/fusion.py
+"""Reciprocal rank fusion of several rankings.
+
+Each ranking adds ``1 / (k + rank)`` (rank counted from 1) to the score of
+every item it lists. Only ranks matter, so retrievers whose scores are on
+unrelated scales (BM25, cosine similarity) combine without calibration. An
+item ranked well by several retrievers beats one ranked first by a single
+retriever. ``k`` (RRF_K, 60 in Cormack et al.) damps the weight of the very
+top ranks.
+"""
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: Optional[int] = None,
+                           limit: Optional[int] = None) -> List[Tuple[Hashable, float]]:
+    """Items of all rankings by fused score, best first, each with its score scaled to [0, 1].
+
+    A score of 1 means ranked first by every ranking. Ties keep the order in
+    which items first appear, ranking by ranking.
+    """
+    k = settings.RRF_K if k is None else k
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    best = len(rankings) / (k + 1)
+    fused = sorted(scores.items(), key=lambda entry: -entry[1])[:limit]
+    return [(item, score / best) for item, score in fused]
@@ -0,0 +1,381 @@
+# documents/hnsw.py
+"""HNSW approximate nearest-neighbour index over chunk embeddings.
+
+A hierarchical navigable small world graph (Malkov & Yashunin): every vector
+is a node on level 0 and, with exponentially decreasing probability, on the
+levels above it. A search descends greedily from the single entry point on
+the top level and then runs a best-first search of width ``ef`` on level 0.
+Its cost grows roughly logarithmically with the number of vectors. Nodes
+keep up to ``M`` links per upper level and ``2 * M`` on level 0, chosen with
+the paper's diversity heuristic.
+
+Deleted vectors are tombstoned: they stay in the graph to keep it connected
+but are never returned. A search whose level-0 pass finds fewer than
+``limit`` live vectors is repeated with a doubled width, so tombstones never
+cost results while live vectors remain. ``manage.py build_hnsw_index``
+rebuilds the index from the vector store without them and saves it. A saved
+index reloads in seconds instead of being rebuilt.
+
+Each process keeps its own copy, loaded from the saved index on first use.
+Like the near-duplicate index, it catches up every HNSW_SYNC_INTERVAL seconds
+with documents embedded since then (``Document.embedded_at``), reading their
+vectors from the vector store, and tombstones documents that no longer exist.
+Documents embedded or deleted in this process are applied immediately. A
+document deleted by another process stays searchable here until the next
+sync, so callers drop matches whose chunk no longer exists.
+"""
+import json
+import math
+import os
+import random
+import shutil
+import threading
+import time
+from collections import defaultdict
+from heapq import heapify, heappop, heappush
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Document
+from .vector_store import Match, collection_name
+
+# Candidates expanded per step of a layer search
+EXPAND_BATCH = 4
+
+
+class HNSWIndex:
+    """HNSW graph over L2-normalised vectors; distance is ``1 - dot product``"""
+
+    def __init__(self, dimension: int, m: Optional[int] = None, ef_construction: Optional[int] = None,
+                 ef_search: Optional[int] = None, seed: int = 0):
+        self.dimension = dimension
+        self.m = m or settings.HNSW_M
+        self.ef_construction = ef_construction or settings.HNSW_EF_CONSTRUCTION
+        self.ef_search = ef_search or settings.HNSW_EF_SEARCH
+        self._level_factor = 1 / math.log(self.m)
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._links: List[List[List[int]]] = []  # node -> level -> neighbours
+        self._ids: List[str] = []
+        self._documents: List[int] = []
+        self._deleted = bytearray()
+        self._nodes: Dict[str, int] = {}  # embedding id -> live node
+        self._document_nodes: Dict[int, List[int]] = defaultdict(list)
+        self._entry: Optional[int] = None
+        self._max_level = -1
+        self.synced_at = None
+        self._versions: Dict[int, object] = {}  # document id -> ``embedded_at`` of the vectors indexed
+        self.checked_at = 0.0
+        self.saved_at = time.monotonic()
+        self.dirty = False
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @property
+    def node_count(self) -> int:
+        """Nodes in the graph, including tombstoned ones"""
+        return len(self._ids)
+
+    def _search_layer(self, query: np.ndarray, entry_points: List[int], ef: int, level: int) -> List[Tuple[float, int]]:
+        """The ``ef`` nodes nearest to ``query`` on one level as ``(distance, node)``, nearest first"""
+        vectors, links = self._vectors, self._links
+        visited = set(entry_points)
+        candidates = list(zip((1.0 - vectors[entry_points] @ query).tolist(), entry_points))
+        heapify(candidates)
+        found = [(-distance, node) for distance, node in candidates]  # Max-heap of the best so far
+        heapify(found)
+        while len(found) > ef:
+            heappop(found)
+        worst = -found[0][0] if len(found) >= ef else math.inf
+        while candidates and candidates[0][0] <= worst:
+            # Expand the few closest candidates together: one matrix product instead of several small ones
+            expanded = [heappop(candidates)[1]]
+            while candidates and len(expanded) < EXPAND_BATCH and candidates[0][0] <= worst:
+                expanded.append(heappop(candidates)[1])
+            neighbours = []
+            for node in expanded:
+                for neighbour in links[node][level]:
+                    if neighbour not in visited:
+                        visited.add(neighbour)
+                        neighbours.append(neighbour)
+            if not neighbours:
+                continue
+            for neighbour_distance, neighbour in zip((1.0 - vectors[neighbours] @ query).tolist(), neighbours):
+                if neighbour_distance < worst:
+                    heappush(candidates, (neighbour_distance, neighbour))
+                    heappush(found, (-neighbour_distance, neighbour))
+                    if len(found) > ef:
+                        heappop(found)
+                    if len(found) >= ef:
+                        worst = -found[0][0]
+        return sorted((-distance, node) for distance, node in found)
+
+    def _select_neighbours(self, candidates: List[Tuple[float, int]], limit: int) -> List[int]:
+        """Keep a candidate only if it is nearer to the base than to every neighbour kept so far"""
+        if len(candidates) <= 1:
+            return [node for _, node in candidates]
+        nodes = [node for _, node in candidates]
+        block = self._vectors[nodes]
+        similarities = (block @ block.T).tolist()
+        selected: List[int] = []
+        for position, (distance, _) in enumerate(candidates):
+            row = similarities[position]
+            # Nearer to the base than to a kept neighbour: 1 - similarity > distance
+            if all(1.0 - row[kept] > distance for kept in selected):
+                selected.append(position)
+                if len(selected) >= limit:
+                    break
+        return [nodes[position] for position in selected]
+
+    def _grow(self, rows: int):
+        if rows > len(self._vectors):
+            grown = np.zeros((max(rows, 2 * len(self._vectors), 1024), self.dimension), dtype=np.float32)
+            grown[:len(self._vectors)] = self._vectors
+            self._vectors = grown
+
+    def add(self, embedding_id: str, document_id: int, vector: np.ndarray):
+        """Insert a vector, replacing any live vector with the same id"""
+        with self._lock:
+            self.remove([embedding_id])
+            node = len(self._ids)
+            self._grow(node + 1)
+            self._vectors[node] = vector
+            query = self._vectors[node]
+            level = int(-math.log(1.0 - self._random.random()) * self._level_factor)
+            self._links.append([[] for _ in range(level + 1)])
+            self._ids.append(embedding_id)
+            self._documents.append(document_id)
+            self._deleted.append(0)
+            self._nodes[embedding_id] = node
+            self._document_nodes[document_id].append(node)
+            self.dirty = True
+            if self._entry is None:
+                self._entry, self._max_level = node, level
+                return
+
+            entry = [self._entry]
+            for upper in range(self._max_level, level, -1):
+                entry = [self._search_layer(query, entry, 1, upper)[0][1]]
+            for current in range(min(level, self._max_level), -1, -1):
+                nearest = self._search_layer(query, entry, self.ef_construction, current)
+                neighbours = self._select_neighbours(nearest, self.m)
+                self._links[node][current] = neighbours
+                limit = 2 * self.m if current == 0 else self.m
+                for neighbour in neighbours:
+                    links = self._links[neighbour][current]
+                    links.append(node)
+                    if len(links) > limit:
+                        ranked = sorted(zip((1.0 - self._vectors[links] @ self._vectors[neighbour]).tolist(), links))
+                        self._links[neighbour][current] = self._select_neighbours(ranked, limit)
+                entry = [n for _, n in nearest]
+            if level > self._max_level:
+                self._entry, self._max_level = node, level
+
+    def add_many(self, ids: Sequence[str], document_ids: Sequence[int], vectors: np.ndarray):
+        with self._lock:
+            self._grow(len(self._ids) + len(ids))
+            for embedding_id, document_id, vector in zip(ids, document_ids, vectors):
+                self.add(embedding_id, document_id, vector)
+
+    def remove(self, ids: Iterable[str]):
+        """Tombstone vectors by embedding id"""
+        with self._lock:
+            for embedding_id in ids:
+                node = self._nodes.pop(embedding_id, None)
+                if node is not None:
+                    self._deleted[node] = 1
+                    self.dirty = True
+
+    def remove_document(self, document_id: int):
+        with self._lock:
+            self._versions.pop(document_id, None)
+            for node in self._document_nodes.pop(document_id, ()):
+                if not self._deleted[node]:
+                    self._deleted[node] = 1
+                    del self._nodes[self._ids[node]]
+                    self.dirty = True
+
+    def search(self, vector: np.ndarray, limit: int, ef: Optional[int] = None) -> List[Match]:
+        """Up to ``limit`` approximate nearest live vectors, most similar first"""
+        query = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._entry is None:
+                return []
+            entry = [self._entry]
+            for level in range(self._max_level, 0, -1):
+                entry = [self._search_layer(query, entry, 1, level)[0][1]]
+            ef = max(ef or self.ef_search, limit)
+            wanted = min(limit, len(self._nodes))
+            while True:
+                nearest = self._search_layer(query, entry, ef, 0)
+                matches = [(self._ids[node], 1.0 - distance) for distance, node in nearest if not self._deleted[node]]
+                # Tombstones took some of the ef slots; widen until enough live vectors are found
+                if len(matches) >= wanted or ef >= self.node_count:
+                    break
+                ef = min(2 * ef, self.node_count)
+        return matches[:limit]
+
+    def save(self, path: str):
+        """Write the index to ``path`` (a directory), replacing any previous copy atomically"""
+        with self._lock:
+            count = len(self._ids)
+            levels = np.array([len(links) for links in self._links], dtype=np.int32)
+            flat = [links for node_links in self._links for links in node_links]
+            link_offsets = np.cumsum([0] + [len(links) for links in flat], dtype=np.int64)
+            link_targets = np.fromiter((n for links in flat for n in links), dtype=np.int32, count=int(link_offsets[-1]))
+            header = {
+                'dimension': self.dimension, 'm': self.m, 'ef_construction': self.ef_construction,
+                'entry': self._entry, 'max_level': self._max_level,
+                'synced_at': self.synced_at.isoformat() if self.synced_at else None,
+                # The next sync starts at ``synced_at`` inclusive; these documents need not be inserted again
+                'synced_documents': [document_id for document_id, version in self._versions.items()
+                                     if version == self.synced_at],
+            }
+            temporary = f"{path}.tmp"
+            shutil.rmtree(temporary, ignore_errors=True)
+            os.makedirs(temporary)
+            np.save(os.path.join(temporary, 'vectors.npy'), self._vectors[:count])
+            np.save(os.path.join(temporary, 'documents.npy'), np.array(self._documents, dtype=np.int64))
+            np.save(os.path.join(temporary, 'deleted.npy'), np.frombuffer(bytes(self._deleted), dtype=np.uint8))
+            np.save(os.path.join(temporary, 'levels.npy'), levels)
+            np.save(os.path.join(temporary, 'link_offsets.npy'), link_offsets)
+            np.save(os.path.join(temporary, 'link_targets.npy'), link_targets)
+            with open(os.path.join(temporary, 'ids.txt'), 'w') as file:
+                file.write('\n'.join(self._ids))
+            with open(os.path.join(temporary, 'index.json'), 'w') as file:
+                json.dump(header, file)
+            previous = f"{path}.old"
+            shutil.rmtree(previous, ignore_errors=True)
+            if os.path.exists(path):
+                os.replace(path, previous)
+            os.replace(temporary, path)
+            shutil.rmtree(previous, ignore_errors=True)
+            self.saved_at = time.monotonic()
+            self.dirty = False
+
+    @classmethod
+    def load(cls, path: str, ef_search: Optional[int] = None) -> 'HNSWIndex':
+        with open(os.path.join(path, 'index.json')) as file:
+            header = json.load(file)
+        index = cls(header['dimension'], header['m'], header['ef_construction'], ef_search)
+        index._vectors = np.load(os.path.join(path, 'vectors.npy'))
+        index._documents = np.load(os.path.join(path, 'documents.npy')).tolist()
+        index._deleted = bytearray(np.load(os.path.join(path, 'deleted.npy')).tobytes())
+        with open(os.path.join(path, 'ids.txt')) as file:
+            index._ids = file.read().split('\n') if index._documents else []
+        levels = np.load(os.path.join(path, 'levels.npy')).tolist()
+        offsets = np.load(os.path.join(path, 'link_offsets.npy')).tolist()
+        targets = np.load(os.path.join(path, 'link_targets.npy')).tolist()
+        position = 0
+        for level_count in levels:
+            index._links.append([targets[offsets[position + k]:offsets[position + k + 1]] for k in range(level_count)])
+            position += level_count
+        for node, (embedding_id, document_id) in enumerate(zip(index._ids, index._documents)):
+            if not index._deleted[node]:
+                index._nodes[embedding_id] = node
+                index._document_nodes[document_id].append(node)
+        index._entry, index._max_level = header['entry'], header['max_level']
+        index.synced_at = parse_datetime(header['synced_at']) if header['synced_at'] else None
+        index._versions = {document_id: index.synced_at for document_id in header['synced_documents']}
+        return index
+
+    def sync(self, store):
+        """Insert documents embedded since the last sync and drop deleted ones, including by other processes"""
+        live = set(Document.objects.values_list('id', flat=True))
+        for document_id in set(self._document_nodes) - live:
+            self.remove_document(document_id)
+
+        changed = Document.objects.filter(embedded_at__isnull=False)
+        if self.synced_at is not None:
+            changed = changed.filter(embedded_at__gte=self.synced_at)
+        for document_id, embedding_model, embedded_at in changed.values_list(
+                'id', 'embedding_model', 'embedded_at').order_by('embedded_at'):
+            if self._versions.get(document_id) == embedded_at:
+                continue  # Already inserted by this process
+            ids, vectors = store.get_document_vectors(document_id) if embedding_model else ([], None)
+            # One critical section, so a concurrent search never sees the document without its vectors
+            with self._lock:
+                self.remove_document(document_id)
+                if ids:
+                    self.add_many(ids, [document_id] * len(ids), vectors)
+                self._versions[document_id] = embedded_at
+            if self.synced_at is None or embedded_at > self.synced_at:
+                self.synced_at = embedded_at
+        self.checked_at = time.monotonic()
+
+
+def index_path(encoder_name: str) -> str:
+    return os.path.join(settings.HNSW_INDEX_PATH, collection_name(encoder_name))
+
+
+def build_index(store, dimension: int, batch_size: int = 10000) -> HNSWIndex:
+    """A new index holding every vector in the store"""
+    index = HNSWIndex(dimension)
+    index.synced_at = timezone.now()  # Documents embedded during the build are caught up by the next sync
+    for ids, document_ids, vectors in store.iter_vectors(batch_size):
+        index.add_many(ids, document_ids, vectors)
+    return index
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_chunk_index(load: bool = True) -> Optional[HNSWIndex]:
+    """This process's index, loaded from disk on first use and synced every HNSW_SYNC_INTERVAL seconds.
+
+    Returns None when HNSW is disabled or no index has been built yet
+    (``manage.py build_hnsw_index``). With ``load=False`` returns the index
+    only if it is already loaded, without syncing it.
+    """
+    global _index
+    if not load or not settings.HNSW_ENABLED:
+        return _index
+    from .embeddings import get_encoder, get_store
+
+    with _index_lock:
+        if _index is None:
+            path = index_path(get_encoder().name)
+            if not os.path.exists(os.path.join(path, 'index.json')):
+                return None
+            _index = HNSWIndex.load(path)
+            _index.sync(get_store())
+        elif time.monotonic() - _index.checked_at > settings.HNSW_SYNC_INTERVAL:
+            _index.sync(get_store())
+            if _index.dirty and time.monotonic() - _index.saved_at > settings.HNSW_SAVE_INTERVAL:
+                _index.save(index_path(get_encoder().name))
+        return _index
+
+
+def index_vectors(document_id: int, embedded_at, ids: Sequence[str], vectors: np.ndarray,
+                  removed: Iterable[str] = (), replace: bool = False):
+    """Apply a document's stored vector changes to this process's index, if loaded"""
+    index = get_chunk_index(load=False)
+    if index is None:
+        return
+    with index._lock:
+        if replace:
+            index.remove_document(document_id)
+        index.remove(removed)
+        index.add_many(ids, [document_id] * len(ids), vectors)
+        index._versions[document_id] = embedded_at
+
+
+def forget_document_vectors(document_id: int):
+    index = get_chunk_index(load=False)
+    if index is not None:
+        index.remove_document(document_id)
+
+
+def search_chunks(vector: np.ndarray, limit: int, ef: Optional[int] = None) -> Optional[List[Match]]:
+    """Approximate nearest chunks across all documents, or None when no HNSW index is available"""
+    index = get_chunk_index()
+    if index is None:
+        return None
+    return index.search(vector, limit, ef)
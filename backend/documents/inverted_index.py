@@ -0,0 +1,247 @@
+# documents/inverted_index.py
+"""Per-document inverted index and BM25 ranking over chunk text.
+
+For every term of a document a ``ChunkPosting`` row lists the chunks that
+contain it as ``(chunk_index, term frequency)`` pairs. Chunk indexes are delta
+encoded and both numbers are variable-byte encoded: 7 bits per byte, with the
+high bit set on every byte except a value's last. The index is rewritten
+whenever a document's chunks are, so answering a question decodes the postings
+of the question's terms instead of scanning every chunk.
+
+The row also stores each posting's BM25 weight (float32), computed at
+ingestion from the document's chunk count, the term's chunk frequency and the
+chunk's length. The rows of a document together form a sparse term x chunk
+weight matrix in CSR layout. Scoring a query is the product of the sparse
+query vector with that matrix: the selected rows' weights are scaled by the
+query term counts and summed per chunk with one ``bincount``. A top-k
+selection follows.
+
+Encoding, decoding and weighting are vectorised with numpy; a whole
+document's postings are encoded in one pass.
+"""
+import re
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from .models import ChunkPosting, Document, DocumentChunk
+
+TERM_RE = re.compile(r'\w+')
+
+# ask_question has always ignored words of two letters or fewer
+MIN_TERM_LENGTH = 3
+MAX_TERM_LENGTH = 64
+
+# (chunk indexes, BM25 weights) of one term
+Postings = Tuple[np.ndarray, np.ndarray]
+
+
+def extract_terms(text: str) -> List[str]:
+    """Lowercased index terms of ``text``, in order and with repeats"""
+    return [term for term in TERM_RE.findall(text.lower()) if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH]
+
+
+def varbyte_encode(values: np.ndarray) -> Tuple[bytes, np.ndarray]:
+    """Variable-byte encode non-negative integers; returns the bytes and each value's size in bytes"""
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        sizes += rest > 0
+        rest >>= np.uint64(7)
+    offsets = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max()) if len(sizes) else 0):
+        mask = sizes > k
+        low_bits = (values[mask] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (sizes[mask] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[mask] + k] = low_bits | more
+    return out.tobytes(), sizes
+
+
+def varbyte_decode(data: bytes) -> np.ndarray:
+    """Decode ``varbyte_encode`` output into an int64 array"""
+    raw = np.frombuffer(data, dtype=np.uint8)
+    last = raw < 0x80
+    if last.all():
+        return raw.astype(np.int64)
+    ends = np.flatnonzero(last)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    shifts = np.arange(len(raw)) - np.repeat(starts, ends - starts + 1)
+    return np.add.reduceat((raw & 0x7F).astype(np.int64) << (7 * shifts), starts)
+
+
+def _flatten(postings_lists: List[List[Tuple[int, int]]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """List lengths and the concatenated chunk indexes and term frequencies of several postings lists"""
+    lengths = np.fromiter((len(postings) for postings in postings_lists), dtype=np.int64, count=len(postings_lists))
+    total = int(lengths.sum())
+    pairs = np.fromiter(chain.from_iterable(chain.from_iterable(postings_lists)), dtype=np.int64, count=2 * total)
+    return lengths, pairs[0::2], pairs[1::2]
+
+
+def _split(data: bytes, value_sizes: np.ndarray, lengths: np.ndarray) -> List[bytes]:
+    """Cut concatenated encodings into one piece per list, given each value's size and each list's value count"""
+    ends = np.concatenate([[0], np.cumsum(value_sizes)])[np.cumsum(lengths)]
+    starts = np.concatenate([[0], ends[:-1]])
+    return [data[start:end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def encode_postings_lists(postings_lists: List[List[Tuple[int, int]]]) -> List[bytes]:
+    """Encode several postings lists, each sorted by chunk index, in one vectorised pass"""
+    lengths, indexes, frequencies = _flatten(postings_lists)
+    if not len(indexes):
+        return [b''] * len(postings_lists)
+    deltas = np.diff(indexes, prepend=0)
+    firsts = (np.cumsum(lengths) - lengths)[lengths > 0]
+    deltas[firsts] = indexes[firsts]  # Each list starts from zero
+
+    values = np.empty(2 * len(indexes), dtype=np.int64)
+    values[0::2] = deltas
+    values[1::2] = frequencies
+    data, sizes = varbyte_encode(values)
+    return _split(data, sizes, 2 * lengths)
+
+
+def decode_postings(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """Chunk indexes and term frequencies of an encoded postings list"""
+    values = varbyte_decode(data)
+    return np.cumsum(values[0::2]), values[1::2]
+
+
+def idf(chunk_frequency, chunk_count: int):
+    """BM25 inverse document frequency (the always-positive variant) over a document's chunks"""
+    return np.log1p((chunk_count - chunk_frequency + 0.5) / (chunk_frequency + 0.5))
+
+
+def bm25_weights(postings_lists: List[List[Tuple[int, int]]], chunk_lengths: Dict[int, int],
+                 k1: Optional[float] = None, b: Optional[float] = None) -> List[bytes]:
+    """float32 BM25 weight of every posting, as one byte string per list"""
+    k1 = settings.BM25_K1 if k1 is None else k1
+    b = settings.BM25_B if b is None else b
+    lengths, indexes, frequencies = _flatten(postings_lists)
+    if not len(indexes):
+        return [b''] * len(postings_lists)
+    length_of = np.zeros(max(chunk_lengths) + 1, dtype=np.float64)
+    length_of[list(chunk_lengths)] = list(chunk_lengths.values())
+    average_length = length_of.sum() / len(chunk_lengths)
+
+    term_idf = np.repeat(idf(lengths, len(chunk_lengths)), lengths)
+    norm = k1 * (1 - b + b * length_of[indexes] / average_length)
+    weights = (term_idf * frequencies * (k1 + 1) / (frequencies + norm)).astype('<f4')
+    return _split(weights.tobytes(), np.full(len(weights), 4), lengths)
+
+
+class IndexBuilder:
+    """Collects the postings of one document's chunks"""
+
+    def __init__(self):
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.chunk_lengths: Dict[int, int] = {}  # Terms per indexed chunk
+        self._last_index = -1
+        self._ordered = True
+
+    def add(self, chunk_index: int, text: str):
+        """Index a chunk; chunks without terms (e.g. boilerplate, stored empty) are left out"""
+        terms = extract_terms(text)
+        if not terms:
+            return
+        if chunk_index <= self._last_index:
+            self._ordered = False
+        self._last_index = max(self._last_index, chunk_index)
+        self.chunk_lengths[chunk_index] = len(terms)
+        for term, frequency in Counter(terms).items():
+            self.postings[term].append((chunk_index, frequency))
+
+    def save(self, document_id: int, batch_size: Optional[int] = None) -> int:
+        """Replace the document's postings and statistics; call inside the transaction that writes its chunks"""
+        batch_size = batch_size or settings.CHUNK_BULK_BATCH_SIZE
+        ChunkPosting.objects.filter(document_id=document_id).delete()
+        terms = list(self.postings)
+        postings_lists = [self.postings[term] for term in terms]
+        if not self._ordered:
+            for postings in postings_lists:
+                postings.sort()
+        encoded = encode_postings_lists(postings_lists)
+        weights = bm25_weights(postings_lists, self.chunk_lengths)
+        ChunkPosting.objects.bulk_create(
+            (
+                ChunkPosting(document_id=document_id, term=term, chunk_count=len(postings),
+                             postings=data, weights=term_weights)
+                for term, postings, data, term_weights in zip(terms, postings_lists, encoded, weights)
+            ),
+            batch_size=batch_size
+        )
+        lengths = self.chunk_lengths.values()
+        Document.objects.filter(id=document_id).update(
+            indexed_chunks=len(lengths),
+            average_chunk_length=sum(lengths) / len(lengths) if lengths else 0.0,
+            generation=F('generation') + 1  # Invalidates cached answers (see answer_cache)
+        )
+        return len(terms)
+
+
+def index_stored_document(document_id: int) -> int:
+    """Rebuild a document's postings from its stored chunks; boilerplate chunks are left out"""
+    builder = IndexBuilder()
+    chunks = (
+        DocumentChunk.objects.filter(document_id=document_id, boilerplate__isnull=True)
+        .order_by('chunk_index')
+        .values_list('chunk_index', 'chunk_text')
+    )
+    for chunk_index, text in chunks.iterator(chunk_size=500):
+        builder.add(chunk_index, str(text))
+    return builder.save(document_id)
+
+
+def load_postings(document_id: int, terms: Iterable[str]) -> Tuple[Dict[str, Postings], Dict[str, int]]:
+    """Postings of the given terms that occur in the document, and each term's chunk frequency"""
+    rows = (
+        ChunkPosting.objects.filter(document_id=document_id, term__in=set(terms))
+        .values_list('term', 'chunk_count', 'postings', 'weights')
+    )
+    postings, chunk_frequencies = {}, {}
+    for term, chunk_count, data, weights in rows:
+        postings[term] = (decode_postings(bytes(data))[0], np.frombuffer(bytes(weights), dtype='<f4'))
+        chunk_frequencies[term] = chunk_count
+    return postings, chunk_frequencies
+
+
+def rank_chunks(postings: Dict[str, Postings], query_terms: List[str], limit: Optional[int] = None,
+                allowed: Optional[Iterable[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Top ``limit`` chunk indexes by BM25 score and their scores, best first (ties by chunk index).
+
+    ``query_terms`` may repeat a term to weight it. ``allowed`` restricts the
+    result to those chunk indexes.
+    """
+    counts = Counter(query_terms)
+    matched = [term for term in counts if term in postings]
+    if not matched:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+    # Sparse query vector times the selected rows of the term x chunk matrix
+    indexes = np.concatenate([postings[term][0] for term in matched])
+    weights = np.concatenate([postings[term][1].astype(np.float64) * counts[term] for term in matched])
+    scores = np.bincount(indexes, weights=weights)
+    candidates = np.flatnonzero(scores)
+    if allowed is not None:
+        candidates = candidates[np.isin(candidates, np.fromiter(allowed, dtype=np.int64))]
+    if limit is not None and limit < len(candidates):
+        # The limit-th best score; ties with it are resolved by chunk index below
+        cutoff = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+        candidates = candidates[scores[candidates] >= cutoff]
+    order = np.lexsort((candidates, -scores[candidates]))[:limit]
+    return candidates[order], scores[candidates[order]]
+
+
+def query_score_bound(query_terms: List[str], chunk_frequencies: Dict[str, int], chunk_count: int) -> float:
+    """BM25 score of a chunk of average length containing each query term once; used to scale scores to [0, 1]"""
+    counts = Counter(query_terms)
+    if not counts or not chunk_count:
+        return 0.0
+    frequencies = np.array([chunk_frequencies.get(term, 0) for term in counts], dtype=np.float64)
+    return float(np.dot(idf(frequencies, chunk_count), list(counts.values())))
@@ -0,0 +1,175 @@
+# documents/jobs.py
+"""Database-backed ingestion job queue and worker pool.
+
+Uploads enqueue an ``IngestionJob`` row and return immediately. Workers claim
+pending jobs with a conditional UPDATE (so two workers never run the same job),
+run ``DocumentProcessor.process_document`` and record the outcome on the job,
+along with the document's near-duplicates when NEAR_DUPLICATE_CHECK_ON_INGEST
+is on.
+
+A job left 'processing' for longer than INGESTION_JOB_TIMEOUT belongs to a
+worker that died; idle workers return such jobs to the queue.
+
+Incremental jobs (file replacements) leave the document's status alone: its
+stored chunks stay queryable until the update commits, and progress is only
+tracked on the job.
+"""
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Document, IngestionJob
+from .near_duplicates import job_near_duplicates
+
+
+def enqueue_document(document: Document, file_path: str, incremental: bool = False) -> IngestionJob:
+    """Queue a document for background ingestion"""
+    if not incremental:
+        document.processing_status = 'pending'
+        document.save(update_fields=['processing_status', 'updated_at'])
+    return IngestionJob.objects.create(document=document, file_path=file_path, incremental=incremental)
+
+
+def claim_next_job(worker_id: str) -> Optional[IngestionJob]:
+    """Atomically claim the oldest pending job, or return None if the queue is empty"""
+    candidates = (
+        IngestionJob.objects.filter(status='pending')
+        .order_by('created_at')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        claimed = IngestionJob.objects.filter(id=job_id, status='pending').update(
+            status='processing',
+            worker_id=worker_id,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return IngestionJob.objects.select_related('document').get(id=job_id)
+    return None
+
+
+def requeue_stale_jobs() -> int:
+    """Return jobs abandoned by a dead worker to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=settings.INGESTION_JOB_TIMEOUT)
+    return IngestionJob.objects.filter(status='processing', started_at__lt=cutoff).update(
+        status='pending', worker_id=''
+    )
+
+
+def run_job(job: IngestionJob, processor=None) -> IngestionJob:
+    """Process a claimed job and record its result"""
+    from .processors import DocumentProcessor
+
+    processor = processor or DocumentProcessor()
+
+    if not job.incremental:
+        Document.objects.filter(id=job.document_id).update(processing_status='processing')
+
+    def report_progress(chunks_stored):
+        IngestionJob.objects.filter(id=job.pk).update(chunks_created=chunks_stored)
+
+    result = processor.process_document(
+        job.document_id, job.file_path,
+        progress_callback=report_progress,
+        incremental=job.incremental
+    )
+
+    job.refresh_from_db()
+    job.finished_at = timezone.now()
+    if result.get('status') == 'success':
+        job.status = 'completed'
+        job.chunks_created = result.get('chunks_created', job.chunks_created)
+        job.error_message = ''
+        if settings.NEAR_DUPLICATE_CHECK_ON_INGEST:
+            try:
+                job.near_duplicates = job_near_duplicates(job.document_id)
+            except Exception as e:
+                print(f"Near-duplicate lookup for document {job.document_id} failed: {e}")
+    else:
+        job.status = 'failed'
+        job.error_message = result.get('error', 'Unknown error')
+    job.save()
+    return job
+
+
+def worker_loop(worker_id: str, stop_event, poll_interval: Optional[float] = None):
+    """Claim and run jobs until ``stop_event`` is set"""
+    from .processors import DocumentProcessor
+
+    poll_interval = settings.INGESTION_POLL_INTERVAL if poll_interval is None else poll_interval
+    processor = DocumentProcessor()
+
+    while not stop_event.is_set():
+        close_old_connections()
+        try:
+            job = claim_next_job(worker_id)
+            if job is None:
+                # Idle workers pick up jobs left behind by workers that died mid-job
+                requeued = requeue_stale_jobs()
+                if requeued:
+                    print(f"WORKER {worker_id}: Requeued {requeued} stale jobs")
+                    continue
+                stop_event.wait(poll_interval)
+                continue
+            print(f"WORKER {worker_id}: Processing job {job.pk} (document {job.document_id})")
+            run_job(job, processor)
+        except Exception as e:
+            print(f"WORKER {worker_id} ERROR: {e}")
+            stop_event.wait(poll_interval)
+    close_old_connections()
+
+
+def make_worker_id(index: int) -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+class IngestionWorkerPool:
+    """Pool of ingestion worker threads running inside the current process"""
+
+    def __init__(self, num_workers: Optional[int] = None, poll_interval: Optional[float] = None):
+        self.num_workers = num_workers or settings.INGESTION_WORKERS
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        requeue_stale_jobs()
+        for i in range(self.num_workers):
+            thread = threading.Thread(
+                target=worker_loop,
+                args=(make_worker_id(i), self.stop_event, self.poll_interval),
+                name=f"ingestion-worker-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def ensure_workers_started():
+    """Start in-process workers once per process when INGESTION_AUTOSTART_WORKERS is on"""
+    global _pool
+    if not settings.INGESTION_AUTOSTART_WORKERS:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = IngestionWorkerPool()
+            _pool.start()
+    return _pool
@@ -0,0 +1,110 @@
+# documents/management/commands/benchmark_chunk_compression.py
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from documents import compression
+from documents.models import DocumentChunk
+from documents.processors import read_chunks
+
+
+def build_database(path, texts, encode):
+    """Write the texts into a fresh SQLite file shaped like document_chunks and return its size"""
+    column_type = 'TEXT' if encode is None else 'BLOB'
+    connection = sqlite3.connect(path)
+    connection.execute(f'CREATE TABLE chunks (id INTEGER PRIMARY KEY, document_id INTEGER, chunk_text {column_type})')
+    with connection:
+        connection.executemany(
+            'INSERT INTO chunks (id, document_id, chunk_text) VALUES (?, ?, ?)',
+            ((i, i // 100, text if encode is None else encode(text)) for i, text in enumerate(texts, start=1))
+        )
+    connection.execute('VACUUM')
+    connection.close()
+    return os.path.getsize(path)
+
+
+def measure_reads(path, decode, queries):
+    """Fetch and decode each group of ids; return per-query latencies and the full-scan time"""
+    connection = sqlite3.connect(path)
+    latencies = []
+    for ids in queries:
+        start = time.perf_counter()
+        rows = connection.execute(
+            f"SELECT chunk_text FROM chunks WHERE id IN ({','.join('?' * len(ids))})", ids
+        ).fetchall()
+        for (value,) in rows:
+            value if decode is None else decode(value)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for (value,) in connection.execute('SELECT chunk_text FROM chunks'):
+        value if decode is None else decode(value)
+    scan_time = time.perf_counter() - start
+    connection.close()
+    return latencies, scan_time
+
+
+class Command(BaseCommand):
+    help = 'Compare SQLite size and chunk read latency for plain and compressed chunk text'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Chunk this file instead of reading chunks from the database')
+        parser.add_argument('--limit', type=int, default=50000, help='Maximum chunks taken from the database')
+        parser.add_argument('--queries', type=int, default=2000, help='Random retrieval queries to time')
+        parser.add_argument('--top-k', type=int, default=5, help='Chunks fetched per query')
+        parser.add_argument('--dict-size', type=int, default=32 * 1024)
+
+    def handle(self, *args, **options):
+        if options['file']:
+            texts = [chunk.text for chunk in read_chunks(options['file']).chunks]
+        else:
+            texts = [str(text) for text in DocumentChunk.objects.values_list('chunk_text', flat=True)[:options['limit']]]
+        if not texts:
+            raise CommandError('No chunks to benchmark; pass --file or ingest some documents')
+
+        rng = random.Random(0)
+        samples = rng.sample(texts, min(len(texts), 2000))
+        codecs = ['zlib'] + (['zstd'] if compression.zstandard is not None else [])
+        variants = [('plain text', None, None)]
+        for codec in codecs:
+            level = compression.DEFAULT_LEVELS[codec]
+            dictionary = (1, compression.train_dictionary(samples, codec, options['dict_size']))
+            variants.append((codec, codec, (level, None)))
+            variants.append((f'{codec} + dictionary', codec, (level, dictionary)))
+
+        queries = [
+            [rng.randint(1, len(texts)) for _ in range(options['top_k'])]
+            for _ in range(options['queries'])
+        ]
+        raw_bytes = sum(len(text.encode('utf-8')) for text in texts)
+        self.stdout.write(f"{len(texts)} chunks, {raw_bytes / (1024 * 1024):.1f} MB of text")
+        self.stdout.write(f"{'variant':<20} {'db size':>10} {'ratio':>7} {'p50 read':>10} {'p95 read':>10} {'scan':>9}")
+
+        baseline_size = None
+        with tempfile.TemporaryDirectory() as directory:
+            for name, codec, params in variants:
+                if codec is None:
+                    encode = decode = None
+                else:
+                    level, dictionary = params
+                    encode = (lambda text, codec=codec, level=level, dictionary=dictionary:
+                              compression.encode(text, codec, level, dictionary, min_size=64))
+                    decode = (lambda frame, dictionary=dictionary:
+                              compression.decode(frame, lambda dict_id: dictionary[1]))
+
+                path = os.path.join(directory, f"{name.replace(' ', '_')}.sqlite3")
+                size = build_database(path, texts, encode)
+                baseline_size = baseline_size or size
+                latencies, scan_time = measure_reads(path, decode, queries)
+                latencies.sort()
+                p50 = statistics.median(latencies) * 1e6
+                p95 = latencies[int(len(latencies) * 0.95) - 1] * 1e6
+                self.stdout.write(
+                    f"{name:<20} {size / (1024 * 1024):>8.1f}MB {baseline_size / size:>6.2f}x "
+                    f"{p50:>8.0f}us {p95:>8.0f}us {raw_bytes / (1024 * 1024) / scan_time:>6.0f}MB/s"
+                )
@@ -0,0 +1,59 @@
+# documents/management/commands/benchmark_chunk_storage.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.chunking import TextChunk
+from documents.models import Document, DocumentChunk
+from documents.processors import DocumentProcessor
+
+
+def make_chunks(count):
+    return [f"Benchmark chunk {i}. " + 'lorem ipsum dolor sit amet ' * 10 for i in range(count)]
+
+
+class Command(BaseCommand):
+    help = 'Compare chunks/sec of per-row autocommit inserts against batched transactional inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=5000, help='Number of chunks to store')
+        parser.add_argument('--batch-size', type=int, default=settings.CHUNK_BULK_BATCH_SIZE)
+        parser.add_argument('--skip-per-row', action='store_true', help='Only run the batched path')
+
+    def handle(self, *args, **options):
+        chunks = make_chunks(options['chunks'])
+        document = Document.objects.create(
+            title='storage-benchmark',
+            file_path='',
+            document_type='txt',
+            file_size=sum(len(c) for c in chunks),
+            processing_status='processing'
+        )
+
+        try:
+            if not options['skip_per_row']:
+                start = time.perf_counter()
+                for i, chunk_text in enumerate(chunks):
+                    DocumentChunk.objects.create(
+                        document_id=document.pk,
+                        chunk_index=i,
+                        chunk_text=chunk_text,
+                        token_count=len(chunk_text.split()),
+                        embedding_id=f"{document.pk}_{i}"
+                    )
+                elapsed = time.perf_counter() - start
+                self.stdout.write(f"Per-row autocommit: {len(chunks) / elapsed:,.0f} chunks/s ({elapsed:.2f}s)")
+                DocumentChunk.objects.filter(document=document).delete()
+
+            processor = DocumentProcessor()
+            text_chunks = [TextChunk(text, 0, len(text)) for text in chunks]
+            start = time.perf_counter()
+            processor._store_chunks(document.pk, text_chunks, batch_size=options['batch_size'])
+            elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"Batched (batch size {options['batch_size']}): "
+                f"{len(chunks) / elapsed:,.0f} chunks/s ({elapsed:.2f}s)"
+            )
+        finally:
+            document.delete()
@@ -0,0 +1,83 @@
+# documents/management/commands/benchmark_chunking.py
+import os
+import random
+import tempfile
+import time
+
+import psutil
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.chunking import STREAM_BLOCK_SIZE, stream_file_chunks
+
+WORDS = (
+    'document intelligence platform chunk paragraph retrieval index query answer '
+    'stream memory worker upload report export log entry error warning request'
+).split()
+
+
+def write_synthetic_file(path, size_bytes, seed=0):
+    """Write a text file of roughly ``size_bytes`` made of short paragraphs"""
+    rng = random.Random(seed)
+    paragraphs = []
+    for _ in range(2000):
+        words = rng.choices(WORDS, k=rng.randint(10, 80))
+        paragraphs.append(' '.join(words).capitalize() + '.')
+    block = ('\n\n'.join(paragraphs) + '\n\n').encode('utf-8')
+
+    written = 0
+    with open(path, 'wb') as f:
+        while written < size_bytes:
+            f.write(block)
+            written += len(block)
+    return written
+
+
+class Command(BaseCommand):
+    help = 'Stream-chunk a large text file and check that peak RSS stays under a fixed cap'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Existing text file to chunk (default: generate one)')
+        parser.add_argument('--size-mb', type=int, default=2048, help='Size of the generated file')
+        parser.add_argument('--rss-cap-mb', type=int, default=256, help='Fail if peak RSS exceeds this')
+        parser.add_argument('--block-size', type=int, default=STREAM_BLOCK_SIZE, help='Characters read per block')
+
+    def handle(self, *args, **options):
+        file_path = options['file']
+        generated = file_path is None
+        if generated:
+            fd, file_path = tempfile.mkstemp(suffix='.txt')
+            os.close(fd)
+            self.stdout.write(f"Generating {options['size_mb']} MB test file at {file_path}")
+            write_synthetic_file(file_path, options['size_mb'] * 1024 * 1024)
+
+        process = psutil.Process()
+        cap_bytes = options['rss_cap_mb'] * 1024 * 1024
+        baseline_rss = process.memory_info().rss
+        peak_rss = baseline_rss
+
+        try:
+            file_size = os.path.getsize(file_path)
+            start = time.perf_counter()
+            chunks = 0
+            chars = 0
+            for chunk in stream_file_chunks(file_path, options['block_size']):
+                chunks += 1
+                chars += len(chunk.text)
+                if chunks % 1000 == 0:
+                    peak_rss = max(peak_rss, process.memory_info().rss)
+            peak_rss = max(peak_rss, process.memory_info().rss)
+            elapsed = time.perf_counter() - start
+        finally:
+            if generated:
+                os.remove(file_path)
+
+        mb = file_size / (1024 * 1024)
+        self.stdout.write(f"File size:      {mb:.1f} MB")
+        self.stdout.write(f"Chunks:         {chunks} ({chars} chars)")
+        self.stdout.write(f"Elapsed:        {elapsed:.2f}s ({mb / elapsed:.1f} MB/s, {chunks / elapsed:.0f} chunks/s)")
+        self.stdout.write(f"Baseline RSS:   {baseline_rss / (1024 * 1024):.1f} MB")
+        self.stdout.write(f"Peak RSS:       {peak_rss / (1024 * 1024):.1f} MB (cap {options['rss_cap_mb']} MB)")
+
+        if peak_rss > cap_bytes:
+            raise CommandError('Peak RSS exceeded the cap')
+        self.stdout.write(self.style.SUCCESS('Peak RSS stayed under the cap'))
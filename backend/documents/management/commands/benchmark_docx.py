@@ -0,0 +1,126 @@
+# documents/management/commands/benchmark_docx.py
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+
+import psutil
+from django.core.management.base import BaseCommand
+
+from documents.extractors import iter_docx_paragraphs
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+WORDS = 'report quarter revenue customer contract clause section summary figure table appendix'.split()
+
+
+def write_synthetic_docx(path, paragraphs, seed=0):
+    """Write a minimal DOCX with ``paragraphs`` paragraphs, streaming document.xml into the zip"""
+    rng = random.Random(seed)
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', CONTENT_TYPES)
+        archive.writestr('_rels/.rels', RELS)
+        with archive.open('word/document.xml', 'w', force_zip64=True) as xml:
+            xml.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+            )
+            for _ in range(paragraphs):
+                text = ' '.join(rng.choices(WORDS, k=rng.randint(10, 60)))
+                xml.write(f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'.encode('utf-8'))
+            xml.write(b'<w:sectPr/></w:body></w:document>')
+
+
+def count_paragraphs(texts):
+    paragraphs = chars = 0
+    for text in texts:
+        paragraphs += 1
+        chars += len(text)
+    return paragraphs, chars
+
+
+def streaming_extract(path):
+    return count_paragraphs(para for para, _, _ in iter_docx_paragraphs(path))
+
+
+def full_dom_extract(path):
+    import docx
+
+    document = docx.Document(path)
+    return count_paragraphs(p.text.strip() for p in document.paragraphs if p.text.strip())
+
+
+def measure(name, path, queue):
+    """Run one extractor in a fresh process and report time and peak RSS growth"""
+    process = psutil.Process()
+    baseline = process.memory_info().rss
+    peak = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], process.memory_info().rss)
+            done.wait(0.01)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    extractor = streaming_extract if name == 'streaming' else full_dom_extract
+    start = time.perf_counter()
+    paragraphs, chars = extractor(path)
+    elapsed = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    peak[0] = max(peak[0], process.memory_info().rss)
+    queue.put((paragraphs, chars, elapsed, peak[0] - baseline))
+
+
+class Command(BaseCommand):
+    help = 'Compare the streaming DOCX extractor against a full-DOM python-docx extraction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Existing DOCX file (default: generate one)')
+        parser.add_argument('--paragraphs', type=int, default=200000, help='Paragraphs in the generated file')
+
+    def handle(self, *args, **options):
+        path = options['file']
+        generated = path is None
+        if generated:
+            fd, path = tempfile.mkstemp(suffix='.docx')
+            os.close(fd)
+            self.stdout.write(f"Generating DOCX with {options['paragraphs']} paragraphs at {path}")
+            write_synthetic_docx(path, options['paragraphs'])
+
+        try:
+            self.stdout.write(f"File size: {os.path.getsize(path) / (1024 * 1024):.1f} MB")
+            for name in ('streaming', 'full-dom'):
+                queue = multiprocessing.Queue()
+                worker = multiprocessing.Process(target=measure, args=(name, path, queue))
+                worker.start()
+                paragraphs, chars, elapsed, rss_growth = queue.get()
+                worker.join()
+                self.stdout.write(
+                    f"{name:>10}: {paragraphs} paragraphs, {elapsed:.2f}s "
+                    f"({chars / elapsed / (1024 * 1024):.1f} MB/s of text), "
+                    f"peak RSS growth {rss_growth / (1024 * 1024):.1f} MB"
+                )
+        finally:
+            if generated:
+                os.remove(path)
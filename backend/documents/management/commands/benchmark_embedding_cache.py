@@ -0,0 +1,58 @@
+# documents/management/commands/benchmark_embedding_cache.py
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from documents.chunking import iter_chunks, split_paragraphs
+from documents.embedding_cache import get_embedding_cache
+from documents.embeddings import encode_chunks, encode_texts, get_encoder
+
+WORDS = (
+    'document intelligence platform chunk paragraph retrieval index query answer '
+    'stream memory worker upload report export log entry error warning request'
+).split()
+
+
+def synthetic_text(paragraphs, seed=0):
+    rng = random.Random(seed)
+    return '\n\n'.join(' '.join(rng.choices(WORDS, k=rng.randint(10, 80))).capitalize() + '.' for _ in range(paragraphs))
+
+
+class Command(BaseCommand):
+    help = 'Time chunk embedding with a cold and a warm embedding cache, and after changing the chunk size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--paragraphs', type=int, default=20000)
+        parser.add_argument('--chunk-size', type=int, default=200)
+        parser.add_argument('--tweaked-chunk-size', type=int, default=250)
+
+    def handle(self, *args, **options):
+        text = synthetic_text(options['paragraphs'])
+        original = [chunk.text for chunk in iter_chunks(split_paragraphs(text), chunk_size=options['chunk_size'], chunk_overlap=0)]
+        tweaked = [chunk.text for chunk in iter_chunks(split_paragraphs(text), chunk_size=options['tweaked_chunk_size'], chunk_overlap=0)]
+        self.stdout.write(f"Encoder {get_encoder().name}; {len(original)} chunks, {len(tweaked)} after the chunk size change")
+
+        start = time.perf_counter()
+        encode_texts(original)
+        self.stdout.write(f"  no cache: {time.perf_counter() - start:.2f}s")
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(EMBEDDING_CACHE_ENABLED=True, EMBEDDING_CACHE_PATH=os.path.join(directory, 'cache.sqlite3')):
+                get_embedding_cache.cache_clear()
+                try:
+                    for label, texts in [('cold', original), ('warm', original), ('re-chunked', tweaked)]:
+                        cache = get_embedding_cache()
+                        hits, misses = cache.hits, cache.misses
+                        start = time.perf_counter()
+                        encode_chunks(texts)
+                        elapsed = time.perf_counter() - start
+                        self.stdout.write(
+                            f"  {label}: {elapsed:.2f}s, {cache.hits - hits} hits, {cache.misses - misses} misses"
+                        )
+                    self.stdout.write(f"  cache file: {os.path.getsize(cache.path) / 1024 / 1024:.1f}MB")
+                finally:
+                    get_embedding_cache.cache_clear()
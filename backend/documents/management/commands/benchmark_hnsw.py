@@ -0,0 +1,76 @@
+# documents/management/commands/benchmark_hnsw.py
+import os
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from documents.hnsw import HNSWIndex
+
+
+def make_vectors(rng, count, dimension, clusters):
+    """Unit vectors scattered around random cluster centres, like embeddings of related chunks"""
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, size=count)] + rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class Command(BaseCommand):
+    help = 'Compare recall and latency of HNSW search against exact search on synthetic embeddings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+        parser.add_argument('--dimension', type=int, default=384)
+        parser.add_argument('--clusters', type=int, default=100)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--m', type=int, default=None)
+        parser.add_argument('--ef-construction', type=int, default=None)
+        parser.add_argument('--ef', type=int, nargs='+', default=[10, 32, 64, 128])
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        top = options['top']
+        for size in options['sizes']:
+            vectors = make_vectors(rng, size + options['queries'], options['dimension'], options['clusters'])
+            corpus, queries = vectors[:size], vectors[size:]
+            ids = [str(row) for row in range(size)]
+
+            index = HNSWIndex(options['dimension'], options['m'], options['ef_construction'])
+            start = time.perf_counter()
+            index.add_many(ids, [0] * size, corpus)
+            built = time.perf_counter() - start
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'index')
+                index.save(path)
+                start = time.perf_counter()
+                HNSWIndex.load(path)
+                loaded = time.perf_counter() - start
+            self.stdout.write(
+                f"{size} vectors: built in {built:.1f}s ({size / built:.0f}/s), reloaded in {loaded * 1000:.0f}ms"
+            )
+
+            exact, latencies = [], []
+            for query in queries:
+                start = time.perf_counter()
+                scores = corpus @ query
+                best = np.argpartition(scores, -top)[-top:]
+                latencies.append(time.perf_counter() - start)
+                exact.append({str(row) for row in best.tolist()})
+            self.stdout.write(f"  exact: p50 {statistics.median(latencies) * 1e6:.0f}us")
+
+            for ef in options['ef']:
+                latencies, recalls = [], []
+                for query, expected in zip(queries, exact):
+                    start = time.perf_counter()
+                    found = index.search(query, top, ef)
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(len(expected.intersection(embedding_id for embedding_id, _ in found)) / top)
+                latencies.sort()
+                self.stdout.write(
+                    f"  hnsw ef={max(ef, top)}: p50 {statistics.median(latencies) * 1e6:.0f}us, "
+                    f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e6:.0f}us, "
+                    f"recall@{top} {statistics.mean(recalls):.3f}"
+                )
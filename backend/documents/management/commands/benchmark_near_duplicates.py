@@ -0,0 +1,50 @@
+# documents/management/commands/benchmark_near_duplicates.py
+import statistics
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents import minhash
+from documents.near_duplicates import DocumentIndex
+
+
+class Command(BaseCommand):
+    help = 'Time near-duplicate lookups against a synthetic index of document signatures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--documents', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=2000)
+        parser.add_argument('--similarity', type=float, default=0.8, help='Similarity of each query to its planted duplicate')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        num_perm = settings.MINHASH_NUM_PERM
+        signatures = rng.integers(0, 1 << 32, size=(options['documents'], num_perm), dtype=np.uint64)
+        signatures = signatures.astype(minhash.SIGNATURE_DTYPE)
+
+        start = time.perf_counter()
+        index = DocumentIndex()
+        index.add_many(enumerate(signatures))
+        self.stdout.write(f"Indexed {len(index)} documents in {time.perf_counter() - start:.2f}s")
+
+        # Each query agrees with one indexed document in a `similarity` fraction of positions
+        targets = rng.integers(0, len(signatures), size=options['queries'])
+        latencies = []
+        found = 0
+        for target in targets:
+            query = signatures[target].copy()
+            changed = rng.random(num_perm) >= options['similarity']
+            query[changed] = rng.integers(0, 1 << 32, size=int(changed.sum()), dtype=np.uint64)
+            start = time.perf_counter()
+            matches = index.lookup(query)
+            latencies.append(time.perf_counter() - start)
+            found += any(document_id == target for document_id, _ in matches)
+
+        latencies.sort()
+        self.stdout.write(
+            f"p50 {statistics.median(latencies) * 1e6:.0f}us, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e6:.0f}us, "
+            f"recall at similarity {options['similarity']}: {found / len(targets):.3f}"
+        )
@@ -0,0 +1,94 @@
+# documents/management/commands/benchmark_ranking.py
+import statistics
+import time
+from collections import Counter
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from documents.inverted_index import IndexBuilder, bm25_weights, rank_chunks
+
+
+def make_chunks(rng, count, vocabulary):
+    """Chunks of Zipf-distributed words with varying lengths, like natural text"""
+    words = [f"w{i:05d}" for i in range(vocabulary)]
+    lengths = rng.integers(40, 400, size=count)
+    ranks = np.minimum(rng.zipf(1.2, size=int(lengths.sum())), vocabulary) - 1
+    chunks, start = [], 0
+    for length in lengths.tolist():
+        chunks.append(' '.join(words[rank] for rank in ranks[start:start + length].tolist()))
+        start += length
+    return chunks
+
+
+def rank_by_frequency(postings, query_terms, limit):
+    """The previous scorer: summed term frequencies, ties by chunk index"""
+    counts = Counter(query_terms)
+    matched = [term for term in counts if term in postings]
+    if not matched:
+        return np.zeros(0, dtype=np.int64)
+    indexes = np.concatenate([postings[term][0] for term in matched])
+    scores = np.bincount(indexes, weights=np.concatenate([postings[term][1] * counts[term] for term in matched]))
+    candidates = np.flatnonzero(scores)
+    return candidates[np.lexsort((candidates, -scores[candidates]))][:limit]
+
+
+class Command(BaseCommand):
+    help = 'Compare latency and ranking quality of BM25 against summed term frequencies on synthetic chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunks', type=int, default=10000)
+        parser.add_argument('--vocabulary', type=int, default=50000)
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--terms', type=int, default=3, help='Terms per query, sampled from its target chunk')
+        parser.add_argument('--top', type=int, default=3, help='Chunks returned per question')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        chunks = make_chunks(rng, options['chunks'], options['vocabulary'])
+
+        start = time.perf_counter()
+        builder = IndexBuilder()
+        for chunk_index, text in enumerate(chunks):
+            builder.add(chunk_index, text)
+        built = time.perf_counter() - start
+        terms = list(builder.postings)
+        start = time.perf_counter()
+        weights = bm25_weights([builder.postings[term] for term in terms], builder.chunk_lengths)
+        weighted = time.perf_counter() - start
+        self.stdout.write(
+            f"Indexed {len(chunks)} chunks ({len(terms)} terms) in {built:.2f}s; BM25 weights took {weighted:.2f}s"
+        )
+
+        frequency_postings, bm25_postings = {}, {}
+        for term, data in zip(terms, weights):
+            pairs = np.array(builder.postings[term], dtype=np.int64)
+            frequency_postings[term] = (pairs[:, 0], pairs[:, 1])
+            bm25_postings[term] = (pairs[:, 0], np.frombuffer(data, dtype='<f4'))
+
+        # Known-item queries: a few distinct terms of a random chunk, which should rank first
+        targets = rng.integers(0, len(chunks), size=options['queries'])
+        queries = []
+        for target in targets.tolist():
+            distinct = sorted(set(chunks[target].split()))
+            picked = rng.choice(len(distinct), size=min(options['terms'], len(distinct)), replace=False)
+            queries.append([distinct[i] for i in picked.tolist()])
+
+        scorers = {
+            'term frequency': lambda query: rank_by_frequency(frequency_postings, query, options['top']),
+            'bm25': lambda query: rank_chunks(bm25_postings, query, options['top'])[0],
+        }
+        for name, scorer in scorers.items():
+            latencies, reciprocal_ranks = [], []
+            for target, query in zip(targets.tolist(), queries):
+                start = time.perf_counter()
+                ranked = scorer(query).tolist()
+                latencies.append(time.perf_counter() - start)
+                reciprocal_ranks.append(1 / (ranked.index(target) + 1) if target in ranked else 0.0)
+            latencies.sort()
+            self.stdout.write(
+                f"{name}: p50 {statistics.median(latencies) * 1e6:.0f}us, "
+                f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e6:.0f}us, "
+                f"hit@{options['top']} {np.count_nonzero(reciprocal_ranks) / len(queries):.3f}, "
+                f"MRR@{options['top']} {statistics.mean(reciprocal_ranks):.3f}"
+            )
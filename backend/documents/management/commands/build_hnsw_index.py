@@ -0,0 +1,29 @@
+# documents/management/commands/build_hnsw_index.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from documents.embeddings import get_encoder, get_store
+from documents.hnsw import build_index, index_path
+
+
+class Command(BaseCommand):
+    help = 'Build the HNSW index from every vector in the store and save it (also drops deleted vectors)'
+
+    def handle(self, *args, **options):
+        store = get_store()
+        if store is None:
+            self.stderr.write(self.style.ERROR('No vector store is configured'))
+            return
+        encoder = get_encoder()
+        start = time.perf_counter()
+        index = build_index(store, encoder.dimension)
+        built = time.perf_counter() - start
+        path = index_path(encoder.name)
+        index.save(path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {len(index)} vectors in {built:.1f}s (M={index.m}, ef_construction={index.ef_construction}); saved to {path}"
+        ))
+        if not settings.HNSW_ENABLED:
+            self.stdout.write('Set HNSW_ENABLED = True to search with it')
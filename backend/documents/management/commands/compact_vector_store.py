@@ -0,0 +1,17 @@
+# documents/management/commands/compact_vector_store.py
+from django.core.management.base import BaseCommand
+
+from documents.embeddings import get_store
+from documents.vector_store import NumpyVectorStore
+
+
+class Command(BaseCommand):
+    help = 'Rewrite the numpy vector store without deleted and replaced vectors'
+
+    def handle(self, *args, **options):
+        store = get_store()
+        if not isinstance(store, NumpyVectorStore):
+            self.stderr.write(self.style.ERROR('Only the numpy vector store needs compacting'))
+            return
+        stats = store.compact()
+        self.stdout.write(self.style.SUCCESS(f"Compacted {stats['rows_before']} rows to {stats['rows_after']}"))
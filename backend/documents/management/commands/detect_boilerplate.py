@@ -0,0 +1,30 @@
+# documents/management/commands/detect_boilerplate.py
+from django.core.management.base import BaseCommand
+
+from documents.boilerplate import detect_boilerplate
+
+
+class Command(BaseCommand):
+    help = 'Find chunks repeated across documents and store them once as boilerplate'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-documents', type=int, help='Documents a chunk must repeat in (default BOILERPLATE_MIN_DOCUMENTS)')
+        parser.add_argument('--threshold', type=float, help='Estimated Jaccard similarity for a match (default BOILERPLATE_SIMILARITY)')
+        parser.add_argument('--recompute', action='store_true', help='Recompute every chunk signature, e.g. after changing MINHASH_* settings')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+
+    def handle(self, *args, **options):
+        stats = detect_boilerplate(
+            min_documents=options['min_documents'],
+            threshold=options['threshold'],
+            recompute=options['recompute'],
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(
+            f"Computed {stats['signatures_computed']} signatures, scanned {stats['chunks_scanned']} chunks"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {stats['boilerplate_created']} boilerplate chunks; "
+            f"linked {stats['chunks_linked']} chunks"
+        ))
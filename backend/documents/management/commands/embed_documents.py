@@ -0,0 +1,29 @@
+# documents/management/commands/embed_documents.py
+from django.core.management.base import BaseCommand
+
+from documents.embeddings import embed_stored_document, get_encoder, get_store
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = 'Embed processed documents whose vectors are missing or come from another encoder'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, action='append', help='Only this document (repeatable)')
+        parser.add_argument('--force', action='store_true', help='Re-embed documents already embedded with the current encoder')
+
+    def handle(self, *args, **options):
+        if get_store() is None:
+            self.stderr.write(self.style.ERROR('No vector store is available; check VECTOR_STORE_BACKEND'))
+            return
+        encoder = get_encoder()
+        documents = Document.objects.filter(processing_status='completed')
+        if options['document']:
+            documents = documents.filter(id__in=options['document'])
+        if not options['force']:
+            documents = documents.exclude(embedding_model=encoder.name)
+        embedded = chunks = 0
+        for document_id in documents.values_list('id', flat=True).iterator():
+            chunks += embed_stored_document(document_id)
+            embedded += 1
+        self.stdout.write(self.style.SUCCESS(f"Embedded {chunks} chunks of {embedded} documents with {encoder.name}"))
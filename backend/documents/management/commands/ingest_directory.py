@@ -0,0 +1,199 @@
+# documents/management/commands/ingest_directory.py
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from documents.extractors import get_document_type
+from documents.models import Document
+from documents.processors import DocumentProcessor, extract_chunks, get_process_pool_size
+from documents.storage import hash_file
+
+STATE_FILE_NAME = '.ingest_state.jsonl'
+
+
+def extract_file(file_path):
+    """Hash and chunk one file in a worker process"""
+    try:
+        digest = hash_file(file_path)
+    except OSError as e:
+        return {'status': 'error', 'error': str(e), 'extract_time': 0.0}
+    extracted = extract_chunks(file_path)
+    extracted['content_hash'] = digest
+    return extracted
+
+
+def iter_files(root, state_path):
+    """Yield ``(relative_path, absolute_path)`` for every allowed file under ``root`` in a stable order"""
+    allowed = {ext.lower() for ext in settings.ALLOWED_FILE_EXTENSIONS}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            file_path = os.path.join(dirpath, filename)
+            if file_path == state_path:
+                continue
+            if os.path.splitext(filename)[1].lower() in allowed:
+                yield os.path.relpath(file_path, root), file_path
+
+
+def truncate_torn_line(state_path):
+    """Drop a partially written last line left by an interrupted run so appends start on a fresh line"""
+    with open(state_path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return
+        position = size
+        while position > 0:
+            step = min(4096, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b'\n')
+            if newline != -1:
+                f.truncate(position + newline + 1)
+                return
+        f.truncate(0)
+
+
+def load_state(state_path, retry_errors):
+    """Relative paths already recorded in the state file"""
+    done = set()
+    if not os.path.exists(state_path):
+        return done
+    truncate_torn_line(state_path)
+    with open(state_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if retry_errors and entry['status'] == 'error':
+                done.discard(entry['path'])
+            else:
+                done.add(entry['path'])
+    return done
+
+
+class Command(BaseCommand):
+    help = 'Import every supported file under a directory, chunking in a process pool and resuming from a state file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', help='Directory tree to import')
+        parser.add_argument(
+            '--workers', type=int, default=get_process_pool_size(),
+            help='Extraction processes (default: BATCH_PROCESS_WORKERS or one per CPU core)',
+        )
+        parser.add_argument(
+            '--state-file',
+            help=f'Checkpoint file recording finished files (default: <directory>/{STATE_FILE_NAME})',
+        )
+        parser.add_argument('--retry-errors', action='store_true', help='Process files that failed in a previous run')
+        parser.add_argument('--report-interval', type=float, default=5.0, help='Seconds between progress lines')
+
+    def handle(self, *args, **options):
+        root = os.path.realpath(options['directory'])
+        if not os.path.isdir(root):
+            raise CommandError(f"Not a directory: {root}")
+        state_path = os.path.realpath(options['state_file'] or os.path.join(root, STATE_FILE_NAME))
+        num_workers = max(1, options['workers'])
+
+        done = load_state(state_path, options['retry_errors'])
+        if done:
+            self.stdout.write(f"Resuming: {len(done)} file(s) already recorded in {state_path}")
+
+        processor = DocumentProcessor()
+        totals = {'files': 0, 'chunks': 0, 'bytes': 0, 'deduplicated': 0, 'errors': 0}
+        start = time.perf_counter()
+        last_report = start
+        files = ((rel, path) for rel, path in iter_files(root, state_path) if rel not in done)
+
+        with open(state_path, 'a', encoding='utf-8') as state, \
+                ProcessPoolExecutor(max_workers=num_workers) as pool:
+            pending = {}
+            exhausted = False
+            while pending or not exhausted:
+                # Keep a bounded number of files in flight so extracted chunks never pile up in memory
+                while not exhausted and len(pending) < num_workers * 2:
+                    try:
+                        relative_path, file_path = next(files)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[pool.submit(extract_file, file_path)] = (relative_path, file_path)
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    relative_path, file_path = pending.pop(future)
+                    try:
+                        extracted = future.result()
+                    except Exception as e:
+                        extracted = {'status': 'error', 'error': str(e), 'extract_time': 0.0}
+                    entry = self._import_file(processor, relative_path, file_path, extracted)
+
+                    state.write(json.dumps(entry) + '\n')
+                    state.flush()
+                    totals['files'] += 1
+                    totals['bytes'] += entry.get('file_size', 0)
+                    totals['chunks'] += entry.get('chunks_created', 0)
+                    totals['deduplicated'] += entry['status'] == 'deduplicated'
+                    totals['errors'] += entry['status'] == 'error'
+                    if entry['status'] == 'error':
+                        self.stderr.write(f"{relative_path}: {entry['error']}")
+
+                now = time.perf_counter()
+                if now - last_report >= options['report_interval']:
+                    self._report(totals, now - start)
+                    last_report = now
+
+        self._report(totals, time.perf_counter() - start)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['files']} file(s): {totals['deduplicated']} deduplicated, {totals['errors']} failed"
+        ))
+
+    def _import_file(self, processor, relative_path, file_path, extracted):
+        """Create the document and store its chunks; return the state file entry"""
+        entry = {'path': relative_path}
+        if extracted['status'] != 'success':
+            return {**entry, 'status': 'error', 'error': extracted['error']}
+
+        file_size = os.path.getsize(file_path)
+        entry['file_size'] = file_size
+        existing = (
+            Document.objects.filter(content_hash=extracted['content_hash'])
+            .exclude(processing_status='failed')
+            .first()
+        )
+        if existing is not None:
+            return {**entry, 'status': 'deduplicated', 'document_id': existing.pk}
+
+        # The document and its chunks commit together, so an interrupted run leaves no half-imported file
+        with transaction.atomic():
+            document = Document.objects.create(
+                title=os.path.splitext(os.path.basename(file_path))[0],
+                file_path=file_path,
+                document_type=get_document_type(file_path),
+                file_size=file_size,
+                content_hash=extracted['content_hash'],
+                processing_status='processing'
+            )
+            result = processor.store_extracted(document.pk, extracted)
+
+        if result['status'] != 'success':
+            return {**entry, 'status': 'error', 'document_id': document.pk, 'error': result['error']}
+        return {**entry, 'status': 'success', 'document_id': document.pk, 'chunks_created': result['chunks_created']}
+
+    def _report(self, totals, elapsed):
+        elapsed = max(elapsed, 1e-9)
+        self.stdout.write(
+            f"{totals['files']} files, {totals['chunks']} chunks, {totals['bytes'] / (1024 * 1024):.1f} MB "
+            f"in {elapsed:.1f}s: {totals['files'] / elapsed:.1f} files/s, "
+            f"{totals['chunks'] / elapsed:.0f} chunks/s, {totals['bytes'] / (1024 * 1024) / elapsed:.2f} MB/s"
+        )
@@ -0,0 +1,24 @@
+# documents/management/commands/rebuild_index.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from documents.inverted_index import index_stored_document
+from documents.models import Document
+
+
+class Command(BaseCommand):
+    help = "Rebuild the inverted index and BM25 weights of processed documents, e.g. after changing BM25_* settings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--document', type=int, action='append', help='Only this document (repeatable)')
+
+    def handle(self, *args, **options):
+        documents = Document.objects.filter(processing_status='completed')
+        if options['document']:
+            documents = documents.filter(id__in=options['document'])
+        rebuilt = 0
+        for document_id in documents.values_list('id', flat=True).iterator():
+            with transaction.atomic():
+                index_stored_document(document_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the index of {rebuilt} documents"))
@@ -0,0 +1,59 @@
+# documents/management/commands/run_ingestion_workers.py
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from documents.jobs import make_worker_id, requeue_stale_jobs, worker_loop
+
+
+class Command(BaseCommand):
+    help = 'Run a pool of ingestion worker processes that drain the ingestion job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.INGESTION_WORKERS,
+            help='Number of worker processes (default: INGESTION_WORKERS)',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.INGESTION_POLL_INTERVAL,
+            help='Seconds to sleep when the queue is empty',
+        )
+
+    def handle(self, *args, **options):
+        num_workers = max(1, options['workers'])
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+
+        # Each worker opens its own database connection after fork
+        connections.close_all()
+
+        stop_event = multiprocessing.Event()
+        workers = []
+        for i in range(num_workers):
+            process = multiprocessing.Process(
+                target=worker_loop,
+                args=(make_worker_id(i), stop_event, options['poll_interval']),
+                name=f"ingestion-worker-{i}",
+            )
+            process.start()
+            workers.append(process)
+
+        self.stdout.write(self.style.SUCCESS(f"Started {num_workers} ingestion worker(s)"))
+
+        def shutdown(signum, frame):
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        try:
+            for process in workers:
+                process.join()
+        except KeyboardInterrupt:
+            stop_event.set()
+            for process in workers:
+                process.join()
+
+        self.stdout.write("Ingestion workers stopped")
@@ -0,0 +1,20 @@
+# documents/management/commands/sign_documents.py
+from django.core.management.base import BaseCommand
+
+from documents.boilerplate import backfill_chunk_signatures
+from documents.near_duplicates import sign_documents
+
+
+class Command(BaseCommand):
+    help = 'Compute missing chunk and document MinHash signatures for near-duplicate lookup'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunks = backfill_chunk_signatures(recompute=False, batch_size=options['batch_size'])
+        documents = sign_documents(options['batch_size'])
+        self.stdout.write(f"Signed {chunks} chunks and {documents} documents")
+        self.stdout.write(self.style.SUCCESS(
+            'Restart running servers so their near-duplicate index includes the backfilled documents'
+        ))
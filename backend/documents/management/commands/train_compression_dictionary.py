@@ -0,0 +1,61 @@
+# documents/management/commands/train_compression_dictionary.py
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.compression import clear_dictionary_cache, encode, get_codec, get_level, train_dictionary
+from documents.models import CompressionDictionary, DocumentChunk
+
+
+class Command(BaseCommand):
+    help = 'Train a shared chunk text compression dictionary from the stored corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=2000, help='Chunks sampled for training')
+        parser.add_argument('--size', type=int, default=32 * 1024, help='Dictionary size in bytes (zlib caps it at 32KB)')
+        parser.add_argument('--recompress', action='store_true', help='Rewrite every stored chunk with the new dictionary')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        codec = get_codec()
+        if codec == 'none':
+            raise CommandError('CHUNK_TEXT_CODEC is none; there is nothing to train')
+
+        samples = [
+            str(text) for text in
+            DocumentChunk.objects.order_by('?').values_list('chunk_text', flat=True)[:options['samples']]
+        ]
+        if not samples:
+            raise CommandError('No chunks stored yet')
+
+        data = train_dictionary(samples, codec, options['size'])
+        if not data:
+            raise CommandError('The samples share too little text to build a dictionary')
+        dictionary = CompressionDictionary.objects.create(codec=codec, data=data, sample_count=len(samples))
+        clear_dictionary_cache()
+
+        level = get_level(codec)
+        raw = sum(len(text.encode('utf-8')) for text in samples)
+        plain = sum(len(encode(text, codec, level)) for text in samples)
+        trained = sum(len(encode(text, codec, level, (dictionary.pk, data))) for text in samples)
+        self.stdout.write(
+            f"Trained {codec} dictionary {dictionary.pk} ({len(data)} bytes) on {len(samples)} chunks; "
+            f"sample ratio {raw / plain:.2f}x without, {raw / trained:.2f}x with the dictionary"
+        )
+
+        if options['recompress']:
+            rewritten = 0
+            batch = []
+            for chunk in DocumentChunk.objects.only('id', 'chunk_text').iterator(chunk_size=options['batch_size']):
+                chunk.chunk_text = chunk.chunk_text  # Decompress now so the save recompresses
+                batch.append(chunk)
+                if len(batch) >= options['batch_size']:
+                    DocumentChunk.objects.bulk_update(batch, ['chunk_text'])
+                    rewritten += len(batch)
+                    batch = []
+            if batch:
+                DocumentChunk.objects.bulk_update(batch, ['chunk_text'])
+                rewritten += len(batch)
+            self.stdout.write(f"Recompressed {rewritten} chunks")
+
+        self.stdout.write(self.style.SUCCESS(
+            'New chunks use this dictionary; restart running servers to pick it up'
+        ))
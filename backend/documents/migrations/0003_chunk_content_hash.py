@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:04
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def backfill_content_hash(apps, schema_editor):
+    DocumentChunk = apps.get_model('documents', 'DocumentChunk')
+    batch = []
+    for chunk in DocumentChunk.objects.only('id', 'chunk_text').iterator(chunk_size=1000):
+        chunk.content_hash = hashlib.sha256(chunk.chunk_text.encode('utf-8')).hexdigest()
+        batch.append(chunk)
+        if len(batch) >= 1000:
+            DocumentChunk.objects.bulk_update(batch, ['content_hash'])
+            batch = []
+    if batch:
+        DocumentChunk.objects.bulk_update(batch, ['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentchunk',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='incremental',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+    ]
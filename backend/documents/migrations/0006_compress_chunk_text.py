@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:30
+
+from django.db import migrations, models
+
+import documents.fields
+
+
+def compress_chunk_text(apps, schema_editor):
+    DocumentChunk = apps.get_model('documents', 'DocumentChunk')
+    batch = []
+    for chunk in DocumentChunk.objects.only('id', 'chunk_text').iterator(chunk_size=1000):
+        chunk.chunk_text_compressed = chunk.chunk_text
+        batch.append(chunk)
+        if len(batch) >= 1000:
+            DocumentChunk.objects.bulk_update(batch, ['chunk_text_compressed'])
+            batch = []
+    if batch:
+        DocumentChunk.objects.bulk_update(batch, ['chunk_text_compressed'])
+
+
+def decompress_chunk_text(apps, schema_editor):
+    DocumentChunk = apps.get_model('documents', 'DocumentChunk')
+    batch = []
+    for chunk in DocumentChunk.objects.only('id', 'chunk_text_compressed').iterator(chunk_size=1000):
+        chunk.chunk_text = chunk.chunk_text_compressed
+        batch.append(chunk)
+        if len(batch) >= 1000:
+            DocumentChunk.objects.bulk_update(batch, ['chunk_text'])
+            batch = []
+    if batch:
+        DocumentChunk.objects.bulk_update(batch, ['chunk_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0005_uploadsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompressionDictionary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codec', models.CharField(max_length=10)),
+                ('data', models.BinaryField()),
+                ('sample_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'compression_dictionaries',
+            },
+        ),
+        # Copy the text into a compressed column, then swap it in under the old name
+        migrations.AlterField(
+            model_name='documentchunk',
+            name='chunk_text',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='chunk_text_compressed',
+            field=documents.fields.CompressedTextField(null=True),
+        ),
+        migrations.RunPython(compress_chunk_text, decompress_chunk_text),
+        migrations.RemoveField(
+            model_name='documentchunk',
+            name='chunk_text',
+        ),
+        migrations.RenameField(
+            model_name='documentchunk',
+            old_name='chunk_text_compressed',
+            new_name='chunk_text',
+        ),
+        migrations.AlterField(
+            model_name='documentchunk',
+            name='chunk_text',
+            field=documents.fields.CompressedTextField(),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+import documents.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0006_compress_chunk_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BoilerplateChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chunk_text', documents.fields.CompressedTextField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('minhash', models.BinaryField()),
+                ('document_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'boilerplate_chunks',
+            },
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='minhash',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentchunk',
+            name='boilerplate',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='copies', to='documents.boilerplatechunk'),
+        ),
+    ]
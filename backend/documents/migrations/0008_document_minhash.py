@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_boilerplate_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='minhash',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_document_minhash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('postings', models.BinaryField()),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='documents.document')),
+            ],
+            options={
+                'db_table': 'chunk_postings',
+                'unique_together': {('document', 'term')},
+            },
+        ),
+    ]
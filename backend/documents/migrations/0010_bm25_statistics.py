@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0009_chunk_postings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkposting',
+            name='weights',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='average_chunk_length',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='indexed_chunks',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0010_bm25_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='embedding_model',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+    ]
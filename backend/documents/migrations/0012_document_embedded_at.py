@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0011_document_embedding_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='embedded_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_chunk_embedding_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
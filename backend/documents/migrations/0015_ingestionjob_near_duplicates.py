@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-17 07:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_document_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='near_duplicates',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# ChatHistory and the chunk indexes were declared on the models without a migration
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_ingestionjob_near_duplicates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.TextField()),
+                ('answer', models.TextField()),
+                ('confidence_score', models.FloatField(default=0.0)),
+                ('chunks_used', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_history', to='documents.document')),
+            ],
+            options={
+                'db_table': 'chat_history',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=models.Index(fields=['document', 'chunk_index'], name='document_ch_documen_15f3c0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentchunk',
+            index=models.Index(fields=['document', 'page_number'], name='document_ch_documen_53f1d2_idx'),
+        ),
+    ]
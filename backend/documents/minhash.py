@@ -0,0 +1,146 @@
+# documents/minhash.py
+"""MinHash signatures and LSH banding for near-duplicate text detection.
+
+A signature is MINHASH_NUM_PERM 32-bit minimums of word shingle hashes under
+random universal hash functions; the fraction of equal positions estimates the
+Jaccard similarity of two texts' shingle sets. LSH splits a signature into
+MINHASH_BANDS bands and hashes each band to a bucket, so texts that are
+similar enough share at least one bucket with high probability and can be
+found without comparing against every stored signature.
+
+Shingles are hashed with CRC-32 (not Python's salted ``hash``) so signatures are
+stable across processes and can be stored.
+"""
+import re
+import zlib
+from functools import lru_cache
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+WORD_RE = re.compile(r'\w+')
+
+MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+MAX_HASH = np.uint64((1 << 32) - 1)
+
+# Multipliers that combine consecutive word hashes into a shingle hash
+SHINGLE_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9,
+                                0x27D4EB2F165667C5, 0x85EBCA77C2B2AE63], dtype=np.uint64)
+
+SIGNATURE_DTYPE = np.dtype('<u4')
+
+FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+FNV_PRIME = np.uint64(0x100000001B3)
+
+
+@lru_cache(maxsize=None)
+def _permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingle_hashes(text: str, shingle_size: Optional[int] = None) -> np.ndarray:
+    """64-bit hashes of the word ``shingle_size``-grams of ``text`` (lowercased)"""
+    shingle_size = shingle_size or settings.MINHASH_SHINGLE_SIZE
+    words = WORD_RE.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(word.encode('utf-8')) for word in words),
+                              dtype=np.uint64, count=len(words))
+    width = min(shingle_size, len(words))
+    count = len(words) - width + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for offset in range(width):
+            hashes ^= word_hashes[offset:offset + count] * SHINGLE_MULTIPLIERS[offset % len(SHINGLE_MULTIPLIERS)]
+    return hashes
+
+
+def signature(text: str, num_perm: Optional[int] = None) -> np.ndarray:
+    """MinHash signature of ``text`` as a ``uint32`` array of ``num_perm`` values"""
+    num_perm = num_perm or settings.MINHASH_NUM_PERM
+    hashes = shingle_hashes(text)
+    if not len(hashes):
+        return np.full(num_perm, MAX_HASH, dtype=SIGNATURE_DTYPE)
+    a, b = _permutations(num_perm)
+    with np.errstate(over='ignore'):
+        permuted = (np.outer(hashes & MAX_HASH, a) + b) % MERSENNE_PRIME & MAX_HASH
+    return permuted.min(axis=0).astype(SIGNATURE_DTYPE)
+
+
+def to_bytes(sig: np.ndarray) -> bytes:
+    return sig.astype(SIGNATURE_DTYPE).tobytes()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(bytes(data), dtype=SIGNATURE_DTYPE)
+
+
+def similarity(sig1: np.ndarray, sig2: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    if len(sig1) != len(sig2):
+        return 0.0
+    return float(np.count_nonzero(sig1 == sig2)) / len(sig1)
+
+
+def union(signatures: Iterable[np.ndarray]) -> Optional[np.ndarray]:
+    """Signature of the union of several texts' shingles (the elementwise minimum)"""
+    result = None
+    for sig in signatures:
+        result = np.array(sig, dtype=SIGNATURE_DTYPE) if result is None else np.minimum(result, sig, out=result)
+    return result
+
+
+def band_hashes(sigs: np.ndarray, bands: Optional[int] = None) -> np.ndarray:
+    """Bucket of every band of each signature as an ``(n, bands)`` int64 array (FNV-1a over the band's values)"""
+    bands = bands or settings.MINHASH_BANDS
+    sigs = np.atleast_2d(sigs)
+    rows = sigs.shape[1] // bands
+    values = sigs[:, :bands * rows].reshape(len(sigs), bands, rows).astype(np.uint64)
+    hashes = np.full(values.shape[:2], FNV_OFFSET, dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for row in range(rows):
+            hashes = (hashes ^ values[:, :, row]) * FNV_PRIME
+    return hashes.view(np.int64)
+
+
+def band_keys(sig: np.ndarray, bands: Optional[int] = None) -> List[Tuple[int, int]]:
+    """``(band, bucket)`` pairs for a signature; buckets are signed 64-bit ints"""
+    return list(enumerate(band_hashes(sig, bands)[0].tolist()))
+
+
+class MinHashLSH:
+    """In-memory LSH index mapping keys to signatures"""
+
+    def __init__(self, threshold: Optional[float] = None, bands: Optional[int] = None):
+        self.threshold = settings.BOILERPLATE_SIMILARITY if threshold is None else threshold
+        self.bands = bands or settings.MINHASH_BANDS
+        self.buckets: Dict[Tuple[int, int], List[Hashable]] = {}
+        self.signatures: Dict[Hashable, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def add(self, key: Hashable, sig: np.ndarray, keys: Optional[Iterable[Tuple[int, int]]] = None):
+        self.signatures[key] = sig
+        for band_key in keys if keys is not None else band_keys(sig, self.bands):
+            self.buckets.setdefault(band_key, []).append(key)
+
+    def candidates(self, sig: np.ndarray) -> List[Hashable]:
+        seen = {}
+        for band_key in band_keys(sig, self.bands):
+            for key in self.buckets.get(band_key, ()):
+                seen[key] = None
+        return list(seen)
+
+    def match(self, sig: np.ndarray) -> Optional[Hashable]:
+        """Most similar indexed key at or above the threshold, or None"""
+        best, best_score = None, self.threshold
+        for key in self.candidates(sig):
+            score = similarity(sig, self.signatures[key])
+            if score >= best_score:
+                best, best_score = key, score
+        return best
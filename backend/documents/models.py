@@ -1,8 +1,10 @@
 ﻿# documents/models.py
 import os
+import uuid
 from django.db import models
 from django.core.validators import FileExtensionValidator
 from django.utils import timezone
+from .fields import CompressedTextField
 
 class Document(models.Model):
     """Model to store document metadata"""
@@ -26,6 +28,7 @@ class Document(models.Model):
     file_path = models.CharField(max_length=500)  # Changed from FileField to CharField for compatibility
     document_type = models.CharField(max_length=10, choices=DOCUMENT_TYPE_CHOICES)
     file_size = models.BigIntegerField()  # Size in bytes
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)  # SHA-256 of the file
     pages_count = models.IntegerField(default=1)  # Fixed field name consistency
     processing_status = models.CharField(
         max_length=20, 
@@ -33,8 +36,14 @@ class Document(models.Model):
         default='pending'
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    processed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
+    minhash = models.BinaryField(null=True, blank=True)  # Document MinHash signature (see near_duplicates)
+    indexed_chunks = models.IntegerField(null=True, blank=True)  # Chunks in the inverted index; null until indexed
+    average_chunk_length = models.FloatField(default=0.0)  # Mean index terms per indexed chunk (BM25)
+    embedding_model = models.CharField(max_length=200, blank=True, default='')  # Encoder of the document's stored vectors
+    embedded_at = models.DateTimeField(null=True, blank=True, db_index=True)  # Last change to the stored vectors (see hnsw)
+    generation = models.PositiveIntegerField(default=0)  # Bumped when the index or vectors change (see answer_cache)
     
     class Meta:
         ordering = ['-uploaded_at']
@@ -77,12 +86,21 @@ class DocumentChunk(models.Model):
         related_name='chunks'
     )
     chunk_index = models.IntegerField()
-    chunk_text = models.TextField()  # Fixed field name consistency
+    chunk_text = CompressedTextField()  # Compressed at rest, read and written as str
     page_number = models.IntegerField(default=1)
     start_char = models.IntegerField(default=0)
     end_char = models.IntegerField(default=0)
     token_count = models.IntegerField(default=0)
-    embedding_id = models.CharField(max_length=100, null=True, blank=True)  # ChromaDB ID
+    content_hash = models.CharField(max_length=64, blank=True, default='')  # SHA-256 of chunk_text
+    embedding_id = models.CharField(max_length=100, null=True, blank=True, db_index=True)  # Vector store ID
+    minhash = models.BinaryField(null=True, blank=True)  # MinHash signature for boilerplate detection
+    boilerplate = models.ForeignKey(
+        'BoilerplateChunk',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='copies'
+    )  # Set for boilerplate; the text is then stored once on the BoilerplateChunk
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -97,11 +115,53 @@ class DocumentChunk(models.Model):
     def __str__(self):
         return f"{self.document.title} - Chunk {self.chunk_index}"
     
+    @property
+    def text(self):
+        """Chunk text, following the link for boilerplate chunks"""
+        if self.boilerplate_id is not None:
+            return self.boilerplate.chunk_text
+        return self.chunk_text
+    
     def get_preview(self, length=100):
         """Get preview of chunk text"""
-        if len(self.chunk_text) <= length:
-            return self.chunk_text
-        return self.chunk_text[:length] + "..."
+        if len(self.text) <= length:
+            return self.text
+        return self.text[:length] + "..."
+
+class BoilerplateChunk(models.Model):
+    """Model to store text repeated across many documents once"""
+    
+    chunk_text = CompressedTextField()
+    content_hash = models.CharField(max_length=64)
+    minhash = models.BinaryField()
+    document_count = models.IntegerField(default=0)  # Documents containing a copy when it was detected
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'boilerplate_chunks'
+    
+    def __str__(self):
+        return f"Boilerplate {self.pk} ({self.document_count} documents)"
+
+class ChunkPosting(models.Model):
+    """Model to store the inverted index entry of one term in one document"""
+    
+    document = models.ForeignKey(
+        Document, 
+        on_delete=models.CASCADE, 
+        related_name='postings'
+    )
+    term = models.CharField(max_length=64)
+    chunk_count = models.IntegerField(default=0)  # Chunks containing the term
+    postings = models.BinaryField()  # Delta + varbyte encoded (chunk_index, term frequency) pairs
+    weights = models.BinaryField(null=True)  # float32 BM25 weight of each posting, in the same order
+    
+    class Meta:
+        unique_together = ['document', 'term']
+        db_table = 'chunk_postings'
+    
+    def __str__(self):
+        return f"{self.term} ({self.chunk_count} chunks)"
 
 class ChatHistory(models.Model):
     """Model to store chat history"""
@@ -122,4 +182,94 @@ class ChatHistory(models.Model):
         db_table = 'chat_history'
     
     def __str__(self):
-        return f"Q: {self.question[:50]}..." if len(self.question) > 50 else f"Q: {self.question}"
\ No newline at end of file
+        return f"Q: {self.question[:50]}..." if len(self.question) > 50 else f"Q: {self.question}"
+
+class IngestionJob(models.Model):
+    """Model to store queued document ingestion jobs"""
+    
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+    
+    document = models.ForeignKey(
+        Document, 
+        on_delete=models.CASCADE, 
+        related_name='ingestion_jobs'
+    )
+    file_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    incremental = models.BooleanField(default=False)  # Only rewrite chunks whose content changed
+    chunks_created = models.IntegerField(default=0)  # Progress counter
+    error_message = models.TextField(blank=True, default='')
+    worker_id = models.CharField(max_length=100, blank=True, default='')
+    near_duplicates = models.JSONField(null=True, blank=True)  # Looked up once the document is processed
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['created_at']
+        db_table = 'ingestion_jobs'
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Job {self.pk} ({self.status}) - {self.document.title}"
+
+class UploadSession(models.Model):
+    """Model to store a resumable upload assembled from byte ranges"""
+    
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('completed', 'Completed'),
+        ('aborted', 'Aborted'),
+        ('failed', 'Failed'),
+    ]
+    
+    upload_id = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    filename = models.CharField(max_length=255)
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)  # Offset the next part must start at
+    parts_received = models.IntegerField(default=0)
+    expected_sha256 = models.CharField(max_length=64, blank=True, default='')  # Optional whole-file checksum
+    temp_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    error_message = models.TextField(blank=True, default='')
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='upload_sessions'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        db_table = 'upload_sessions'
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"Upload {self.upload_id} ({self.received_bytes}/{self.total_size})"
+
+class CompressionDictionary(models.Model):
+    """Model to store shared dictionaries used to compress chunk text"""
+    
+    codec = models.CharField(max_length=10)
+    data = models.BinaryField()
+    sample_count = models.IntegerField(default=0)  # Chunks the dictionary was trained on
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'compression_dictionaries'
+    
+    def __str__(self):
+        return f"{self.codec} dictionary {self.pk} ({len(self.data)} bytes)"
@@ -0,0 +1,240 @@
+# documents/near_duplicates.py
+"""Document-level near-duplicate lookup.
+
+A document's signature is the elementwise minimum of its chunks' MinHash
+signatures, i.e. the MinHash of the union of their shingles. Ingestion already
+signs every chunk, so processed documents are signed from the stored chunk
+signatures, and a file looked up without ingesting it is signed by chunking it
+the same way. An ingestion job looks up its document's near-duplicates once
+the document is processed (``job_near_duplicates``), so uploads never wait for
+the file to be read.
+
+``DocumentIndex`` keeps the LSH buckets of every processed document in sorted
+numpy arrays, one per band. A lookup is MINHASH_BANDS binary searches plus one
+vectorised comparison against the candidates' signatures, which stays well
+under a millisecond for hundreds of thousands of documents. Documents added
+since the last merge sit in a small dict keyed by bucket and are merged into
+the arrays in bulk.
+"""
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from . import minhash
+from .chunking import TextChunk
+from .models import Document, DocumentChunk
+
+
+def chunks_signature(chunks: Iterable[TextChunk]) -> Optional[np.ndarray]:
+    """Document signature of freshly extracted chunks"""
+    return minhash.union(minhash.signature(chunk.text) for chunk in chunks)
+
+
+def stored_signature(document_id: int) -> Optional[np.ndarray]:
+    """Document signature from the signatures stored on its chunks"""
+    data = (
+        DocumentChunk.objects.filter(document_id=document_id, minhash__isnull=False)
+        .values_list('minhash', flat=True)
+    )
+    signatures = (minhash.from_bytes(value) for value in data)
+    return minhash.union(sig for sig in signatures if len(sig) == settings.MINHASH_NUM_PERM)
+
+
+class DocumentIndex:
+    """LSH index of document signatures keyed by document id"""
+
+    def __init__(self, num_perm: Optional[int] = None, bands: Optional[int] = None,
+                 merge_size: Optional[int] = None):
+        self.num_perm = num_perm or settings.MINHASH_NUM_PERM
+        self.bands = bands or settings.MINHASH_BANDS
+        self.merge_size = merge_size or settings.NEAR_DUPLICATE_MERGE_SIZE
+        self._lock = threading.Lock()
+        # Merged documents: row-aligned ids and signatures, and per band the
+        # bucket keys in sorted order with the row each key belongs to
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._signatures = np.zeros((0, self.num_perm), dtype=minhash.SIGNATURE_DTYPE)
+        self._sorted_keys = np.zeros((self.bands, 0), dtype=np.int64)
+        self._sorted_rows = np.zeros((self.bands, 0), dtype=np.int64)
+        self._rows: Dict[int, int] = {}  # document id -> live row; replaced rows stay until the next merge
+        # Documents added since the last merge
+        self._pending: Dict[int, np.ndarray] = {}
+        self._pending_buckets: Dict[Tuple[int, int], Set[int]] = defaultdict(set)
+        self.synced_at = None
+        self.checked_at = 0.0
+
+    def __len__(self):
+        return len(self._rows) + len(self._pending)
+
+    def __contains__(self, document_id):
+        return document_id in self._rows or document_id in self._pending
+
+    def add(self, document_id: int, sig: np.ndarray):
+        self.add_many([(document_id, sig)])
+
+    def add_many(self, items: Iterable[Tuple[int, np.ndarray]]):
+        """Add or replace documents, merging once at the end if enough are pending"""
+        items = [(document_id, sig) for document_id, sig in items if len(sig) == self.num_perm]
+        with self._lock:
+            for document_id, _ in items:
+                self._discard(document_id)
+            if len(self._pending) + len(items) >= self.merge_size:
+                # The merge hashes every band in one vectorised pass, so skip the pending buckets
+                self._pending.update(items)
+                self._merge()
+                return
+            for document_id, sig in items:
+                self._pending[document_id] = sig
+                for key in minhash.band_keys(sig, self.bands):
+                    self._pending_buckets[key].add(document_id)
+
+    def remove(self, document_id: int):
+        with self._lock:
+            self._discard(document_id)
+
+    def _discard(self, document_id: int):
+        self._rows.pop(document_id, None)
+        sig = self._pending.pop(document_id, None)
+        if sig is not None:
+            for key in minhash.band_keys(sig, self.bands):
+                self._pending_buckets[key].discard(document_id)
+
+    def _merge(self):
+        """Rebuild the sorted arrays from the live rows and the pending documents"""
+        live = np.fromiter(self._rows.values(), dtype=np.int64, count=len(self._rows))
+        live.sort()
+        ids = np.concatenate([self._ids[live], np.fromiter(self._pending, dtype=np.int64, count=len(self._pending))])
+        signatures = np.concatenate([self._signatures[live]] + [sig[None, :] for sig in self._pending.values()])
+        keys = minhash.band_hashes(signatures, self.bands).T
+        order = np.argsort(keys, axis=1, kind='stable')
+        self._ids, self._signatures = ids, signatures
+        self._sorted_keys = np.take_along_axis(keys, order, axis=1)
+        self._sorted_rows = order
+        self._rows = {int(document_id): row for row, document_id in enumerate(ids)}
+        self._pending = {}
+        self._pending_buckets = defaultdict(set)
+
+    def lookup(self, sig: np.ndarray, limit: Optional[int] = None, threshold: Optional[float] = None,
+               exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Up to ``limit`` ``(document_id, similarity)`` pairs at or above ``threshold``, most similar first"""
+        limit = limit or settings.NEAR_DUPLICATE_LIMIT
+        threshold = settings.NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+        if len(sig) != self.num_perm:
+            return []
+        keys = minhash.band_hashes(sig, self.bands)[0]
+        scores = {}
+        with self._lock:
+            starts = [np.searchsorted(self._sorted_keys[band], key, 'left') for band, key in enumerate(keys)]
+            ends = [np.searchsorted(self._sorted_keys[band], key, 'right') for band, key in enumerate(keys)]
+            found = [self._sorted_rows[band, start:end] for band, (start, end) in enumerate(zip(starts, ends)) if end > start]
+            if found:
+                rows = np.unique(np.concatenate(found))
+                similarities = np.count_nonzero(self._signatures[rows] == sig, axis=1) / self.num_perm
+                for row, similarity in zip(rows.tolist(), similarities.tolist()):
+                    document_id = int(self._ids[row])
+                    if self._rows.get(document_id) == row:
+                        scores[document_id] = similarity
+            for band, key in enumerate(keys.tolist()):
+                for document_id in self._pending_buckets.get((band, key), ()):
+                    scores[document_id] = minhash.similarity(sig, self._pending[document_id])
+
+        matches = [
+            (document_id, similarity) for document_id, similarity in scores.items()
+            if similarity >= threshold and document_id != exclude
+        ]
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches[:limit]
+
+    def sync(self):
+        """Pick up documents processed or failed since the last sync, including by other processes"""
+        changed = Document.objects.filter(processed_at__isnull=False)
+        if self.synced_at is not None:
+            changed = changed.filter(processed_at__gte=self.synced_at)
+        added, removed = [], []
+        for document_id, status, data, processed_at in changed.values_list(
+                'id', 'processing_status', 'minhash', 'processed_at').iterator(chunk_size=2000):
+            if status == 'completed' and data is not None:
+                added.append((document_id, minhash.from_bytes(data)))
+            else:
+                removed.append(document_id)
+            if self.synced_at is None or processed_at > self.synced_at:
+                self.synced_at = processed_at
+        for document_id in removed:
+            self.remove(document_id)
+        self.add_many(added)
+        self.checked_at = time.monotonic()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_document_index(load: bool = True) -> Optional[DocumentIndex]:
+    """The process-wide index, loaded on first use and synced every NEAR_DUPLICATE_SYNC_INTERVAL seconds.
+
+    With ``load=False`` returns the index only if it is already loaded, without syncing it.
+    """
+    global _index
+    if not load:
+        return _index
+    with _index_lock:
+        if _index is None:
+            _index = DocumentIndex()
+            _index.sync()
+        elif time.monotonic() - _index.checked_at > settings.NEAR_DUPLICATE_SYNC_INTERVAL:
+            _index.sync()
+        return _index
+
+
+def index_document(document: Document):
+    """Add a processed document to this process's index once the current transaction commits"""
+    index = get_document_index(load=False)
+    if index is not None and document.minhash is not None:
+        signature = minhash.from_bytes(document.minhash)
+        transaction.on_commit(lambda: index.add(document.pk, signature))
+
+
+def forget_document(document_id: int):
+    index = get_document_index(load=False)
+    if index is not None:
+        index.remove(document_id)
+
+
+def find_near_duplicates(signature: Optional[np.ndarray], limit: Optional[int] = None,
+                         threshold: Optional[float] = None, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+    if signature is None:
+        return []
+    return get_document_index().lookup(signature, limit, threshold, exclude)
+
+
+def near_duplicate_entries(matches: List[Tuple[int, float]]) -> List[dict]:
+    """Response entries for ``(document_id, similarity)`` matches, dropping documents deleted meanwhile"""
+    titles = dict(Document.objects.filter(id__in=[document_id for document_id, _ in matches]).values_list('id', 'title'))
+    return [
+        {'document_id': document_id, 'title': titles[document_id], 'similarity': round(similarity, 3)}
+        for document_id, similarity in matches if document_id in titles
+    ]
+
+
+def job_near_duplicates(document_id: int) -> Optional[List[dict]]:
+    """Entries for the near-duplicates of a processed document, from its stored signature; None if it has none"""
+    data = Document.objects.filter(id=document_id).values_list('minhash', flat=True).first()
+    if data is None:
+        return None
+    return near_duplicate_entries(find_near_duplicates(minhash.from_bytes(data), exclude=document_id))
+
+
+def sign_documents(batch_size: int = 500) -> int:
+    """Store signatures for processed documents that have none (e.g. processed before signatures existed)"""
+    signed = 0
+    documents = Document.objects.filter(processing_status='completed', minhash__isnull=True).only('id')
+    for document in documents.iterator(chunk_size=batch_size):
+        signature = stored_signature(document.pk)
+        if signature is not None:
+            Document.objects.filter(pk=document.pk).update(minhash=minhash.to_bytes(signature))
+            signed += 1
+    return signed
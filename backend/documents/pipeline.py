@@ -0,0 +1,272 @@
+# documents/pipeline.py
+"""Staged ingestion pipeline.
+
+A document flows through extract -> normalise -> chunk -> embed -> persist.
+Every stage runs in its own thread(s) and hands batches to the next one through
+a bounded queue, so a fast extractor blocks (backpressure) instead of buffering
+text while persistence catches up. Stages that do not depend on order
+(normalise, embed) can run several workers; extract, chunk and persist are
+sequential. Each stage records how long it was busy, starved (waiting for
+input) and blocked (waiting for room downstream); the stage with the most
+busy time per worker is the one limiting throughput.
+"""
+import queue
+import threading
+import time
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+
+from .chunking import chunk_page_paragraphs, normalize_paragraph
+
+# Seconds between checks of the stop flag while waiting on a queue
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class PipelineStopped(Exception):
+    """Raised inside a stage when another stage failed"""
+
+
+class Stage(NamedTuple):
+    name: str
+    func: Callable
+    workers: int = 1
+    ordered: bool = False  # func maps an ordered iterator of batches to batches, instead of one batch to one batch
+
+
+class StageStats:
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.batches = 0
+        self.items = 0
+        self.busy_time = 0.0
+        self.starved_time = 0.0
+        self.blocked_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy: float, starved: float, blocked: float, batches: int, items: int):
+        with self._lock:
+            self.busy_time += busy
+            self.starved_time += starved
+            self.blocked_time += blocked
+            self.batches += batches
+            self.items += items
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'workers': self.workers,
+            'batches': self.batches,
+            'items': self.items,
+            'busy_time': self.busy_time,
+            'starved_time': self.starved_time,
+            'blocked_time': self.blocked_time,
+        }
+
+
+class _Worker:
+    """Per-thread wait accounting for one stage worker"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.starved = 0.0
+        self.blocked = 0.0
+        self.batches = 0
+        self.items = 0
+
+
+class _Channel:
+    """Bounded queue between two stages, closed once every producer has finished"""
+
+    def __init__(self, maxsize: int, producers: int, stop: threading.Event):
+        self.queue = queue.Queue(maxsize)
+        self.producers = producers
+        self.stop = stop
+        self._lock = threading.Lock()
+
+    def put(self, item, worker: _Worker):
+        start = time.perf_counter()
+        while True:
+            if self.stop.is_set():
+                raise PipelineStopped()
+            try:
+                self.queue.put(item, timeout=POLL_INTERVAL)
+                break
+            except queue.Full:
+                continue
+        worker.blocked += time.perf_counter() - start
+
+    def close(self, worker: _Worker):
+        with self._lock:
+            self.producers -= 1
+            last = self.producers == 0
+        if last:
+            self.put(_DONE, worker)
+
+    def __call__(self, worker: _Worker) -> Iterator[Tuple[int, Any]]:
+        """Yield ``(seq, batch)`` items until the channel is closed"""
+        while True:
+            start = time.perf_counter()
+            while True:
+                if self.stop.is_set():
+                    raise PipelineStopped()
+                try:
+                    item = self.queue.get(timeout=POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    continue
+            worker.starved += time.perf_counter() - start
+            if item is _DONE:
+                # Leave the marker for sibling consumers; the slot just freed guarantees room
+                self.queue.put_nowait(_DONE)
+                return
+            yield item
+
+
+def _in_order(items: Iterator[Tuple[int, Any]]) -> Iterator[Any]:
+    """Restore sequence order of batches emitted by a multi-worker stage"""
+    waiting = {}
+    next_seq = 0
+    for seq, batch in items:
+        waiting[seq] = batch
+        while next_seq in waiting:
+            yield waiting.pop(next_seq)
+            next_seq += 1
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Pipeline:
+    """Run a source and a list of stages in threads, feeding a sink in the calling thread"""
+
+    def __init__(self, stages: List[Stage], queue_size: Optional[int] = None):
+        self.stages = stages
+        self.queue_size = queue_size or settings.INGESTION_PIPELINE_QUEUE_SIZE
+        self.stats = {stage.name: StageStats(stage.name, stage.workers) for stage in stages}
+        self.total_time = 0.0
+
+    def run(self, source: Iterable[Any], sink: Callable[[Iterator[Any]], Any], sink_name: str = 'persist'):
+        """Feed ``source`` batches through the stages and return ``sink(batches)``.
+
+        The first stage iterates ``source`` itself, so work done lazily by the
+        source (such as extraction) is timed as that stage. The sink receives
+        the last stage's batches in order and runs in the calling thread, so it
+        keeps the caller's database connection and transaction.
+        """
+        start = time.perf_counter()
+        stop = threading.Event()
+        errors = []
+        channels = [_Channel(self.queue_size, stage.workers, stop) for stage in self.stages]
+        sink_stats = self.stats[sink_name] = StageStats(sink_name, 1)
+        threads = []
+
+        def run_worker(index: int, stage: Stage):
+            worker = _Worker()
+            stats = self.stats[stage.name]
+            output = channels[index]
+            try:
+                if index == 0:
+                    inputs = ((seq, batch) for seq, batch in enumerate(source))
+                else:
+                    inputs = channels[index - 1](worker)
+
+                if stage.ordered:
+                    for seq, batch in enumerate(stage.func(_in_order(inputs))):
+                        output.put((seq, batch), worker)
+                        worker.batches += 1
+                        worker.items += len(batch)
+                else:
+                    for seq, batch in inputs:
+                        result = stage.func(batch)
+                        output.put((seq, result), worker)
+                        worker.batches += 1
+                        worker.items += len(result)
+                output.close(worker)
+            except PipelineStopped:
+                pass
+            except BaseException as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                elapsed = time.perf_counter() - worker.started
+                stats.add(elapsed - worker.starved - worker.blocked, worker.starved, worker.blocked,
+                          worker.batches, worker.items)
+
+        for index, stage in enumerate(self.stages):
+            if index == 0 and stage.workers != 1:
+                raise ValueError('The first stage reads the source and must have one worker')
+            for n in range(stage.workers):
+                thread = threading.Thread(target=run_worker, args=(index, stage),
+                                          name=f"pipeline-{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        sink_worker = _Worker()
+
+        def sink_input() -> Iterator[Any]:
+            for batch in _in_order(channels[-1](sink_worker)):
+                sink_worker.batches += 1
+                sink_worker.items += len(batch)
+                yield batch
+
+        try:
+            result = sink(sink_input())
+        except PipelineStopped:
+            result = None
+        except BaseException:
+            stop.set()
+            raise
+        finally:
+            # Release any producer still blocked on a full queue if the sink returned early
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - sink_worker.started
+            sink_stats.add(elapsed - sink_worker.starved - sink_worker.blocked, sink_worker.starved,
+                           sink_worker.blocked, sink_worker.batches, sink_worker.items)
+            self.total_time = time.perf_counter() - start
+
+        if errors:
+            raise errors[0]
+        return result
+
+    def timings(self) -> Dict[str, Any]:
+        stages = {name: stats.as_dict() for name, stats in self.stats.items()}
+        bottleneck = max(self.stats.values(), key=lambda stats: stats.busy_time / stats.workers).name
+        return {
+            'total_time': self.total_time,
+            'queue_size': self.queue_size,
+            'bottleneck': bottleneck,
+            'stages': stages,
+        }
+
+
+def _normalise(batch):
+    return [(page, normalize_paragraph(paragraph)) for page, paragraph in batch]
+
+
+def _chunk(batches: Iterator[List[Any]]) -> Iterator[List[Tuple[int, Any]]]:
+    paragraphs = (item for batch in batches for item in batch)
+    return batched(enumerate(chunk_page_paragraphs(paragraphs)), settings.INGESTION_PIPELINE_BATCH_SIZE)
+
+
+def ingestion_stages(embed: Callable[[List[Tuple[int, Any]]], List[Any]],
+                     workers: Optional[Dict[str, int]] = None) -> List[Stage]:
+    """The extract -> normalise -> chunk -> embed stages; ``embed`` turns ``(index, chunk)`` batches into rows"""
+    workers = {**settings.INGESTION_STAGE_WORKERS, **(workers or {})}
+    return [
+        Stage('extract', lambda batch: batch),
+        Stage('normalise', _normalise, workers.get('normalise', 1)),
+        Stage('chunk', _chunk, ordered=True),
+        Stage('embed', embed, workers.get('embed', 1)),
+    ]
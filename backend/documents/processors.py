@@ -1,174 +1,676 @@
 ﻿import os
 import time
-from typing import List, Dict, Any
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import partial
+from typing import List, Dict, Any, Callable, Iterable, Iterator, NamedTuple, Optional, Tuple
 from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import minhash
+from .answer_cache import cache_key, document_generation, get_answer, store_answer
+from .boilerplate import get_boilerplate_index
+from .embeddings import (
+    DocumentVectors, embeddings_enabled, encode_chunks, get_encoder, search_corpus, search_document
+)
+from .fusion import reciprocal_rank_fusion
 from .models import Document, DocumentChunk
+from .near_duplicates import index_document, stored_signature
+from .inverted_index import (
+    IndexBuilder, extract_terms, index_stored_document, load_postings, query_score_bound, rank_chunks
+)
+from .chunking import (
+    PageParagraph, TextChunk, chunk_page_paragraphs, content_hash, iter_page_paragraphs, iter_paragraphs,
+    normalize_paragraph, split_paragraphs
+)
+from .sentences import sentence_spans
+from .tokens import count_tokens
+from .extractors import extract_pdf_pages, get_document_type, iter_docx_paragraphs
+from .pipeline import Pipeline, batched, ingestion_stages
+
+
+class Extraction(NamedTuple):
+    chunks: Iterable[TextChunk]
+    pages_count: int = 1
+
+
+class ParagraphSource(NamedTuple):
+    paragraphs: Iterable[PageParagraph]
+    pages_count: int = 1
+
+
+def extract_paragraphs(file_path: str, streaming: Optional[bool] = None, parallel: bool = True) -> ParagraphSource:
+    """Extract a file's text as page-tagged paragraphs.
+
+    PDFs are extracted page by page (in parallel when ``parallel`` is true).
+    DOCX paragraphs are streamed from the archive. Text files larger than
+    STREAMING_CHUNK_THRESHOLD (or any text file when ``streaming`` is true)
+    are read incrementally.
+    """
+    document_type = get_document_type(file_path)
+    if document_type == 'pdf':
+        pages = extract_pdf_pages(file_path, parallel=parallel)
+        return ParagraphSource(iter_page_paragraphs(pages), len(pages))
+    if document_type == 'docx':
+        return ParagraphSource((1, paragraph) for paragraph in iter_docx_paragraphs(file_path))
+    
+    if streaming is None:
+        streaming = os.path.getsize(file_path) > settings.STREAMING_CHUNK_THRESHOLD
+    
+    if streaming:
+        return ParagraphSource(_stream_text_paragraphs(file_path))
+    
+    with open(file_path, 'r', encoding='utf-8') as file:
+        content = file.read()
+    return ParagraphSource((1, paragraph) for paragraph in split_paragraphs(content))
+
+
+def _stream_text_paragraphs(file_path: str) -> Iterator[PageParagraph]:
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for paragraph in iter_paragraphs(file):
+            yield 1, paragraph
+
+
+def read_chunks(file_path: str, streaming: Optional[bool] = None, parallel: bool = True) -> Extraction:
+    """Extract, normalise and chunk a file in the calling thread; chunks are produced lazily"""
+    source = extract_paragraphs(file_path, streaming, parallel)
+    normalized = ((page, normalize_paragraph(paragraph)) for page, paragraph in source.paragraphs)
+    return Extraction(chunk_page_paragraphs(normalized), source.pages_count)
+
+
+def extract_chunks(file_path: str) -> Dict[str, Any]:
+    """Read and chunk one file in a worker process; must not touch the database"""
+    start = time.perf_counter()
+    try:
+        # Files are already spread across the pool, so pages are extracted serially
+        extraction = read_chunks(file_path, streaming=False, parallel=False)
+    except Exception as e:
+        return {'status': 'error', 'error': str(e), 'extract_time': time.perf_counter() - start}
+    return {
+        'status': 'success',
+        'chunks': list(extraction.chunks),
+        'pages_count': extraction.pages_count,
+        'extract_time': time.perf_counter() - start
+    }
+
+
+_process_pool = None
+
+
+def get_process_pool_size() -> int:
+    return settings.BATCH_PROCESS_WORKERS or os.cpu_count() or 1
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """Process pool shared by batch ingestion requests, sized to the machine's cores by default"""
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=get_process_pool_size())
+    return _process_pool
+
+
+_thread_pool = None
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    """Threads running one retriever of a hybrid question while the request thread runs the other"""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=settings.RETRIEVAL_THREADS, thread_name_prefix='retrieval')
+    return _thread_pool
+
+
+def _run_in_thread(function: Callable, *args):
+    """Call ``function`` on a pool thread and release the thread's database connection afterwards, as a request does"""
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
 
 class DocumentProcessor:
     def __init__(self):
         import datetime
         print(f"DocumentProcessor initialized - NEW VERSION - {datetime.datetime.now()}")
     
-    def process_document(self, document_id: int, file_path: str) -> Dict[str, Any]:
+    def process_document(self, document_id: int, file_path: str,
+                         progress_callback: Optional[Callable[[int], None]] = None,
+                         streaming: Optional[bool] = None,
+                         incremental: bool = False) -> Dict[str, Any]:
+        """Read, chunk and store a document.
+
+        ``progress_callback`` is called with the number of chunks stored once
+        the chunks have been committed.
+        ``streaming`` reads the file incrementally instead of loading it whole;
+        by default it is used for files larger than STREAMING_CHUNK_THRESHOLD.
+        ``incremental`` diffs the new chunks against the stored ones by content
+        hash and only writes what changed; the document stays queryable
+        throughout and is not marked failed if the update fails.
+        """
         try:
             start_time = time.time()
             
-            # Read document content
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
+            print(f"Processing document {document_id}")
+            # Loaded here so the embed workers share one index instead of each querying for it.
+            # The incremental path only encodes changed chunks, after diffing.
+            encode = encode_chunks if embeddings_enabled() and not incremental else None
+            embed = partial(self._embed_batch, boilerplate_index=get_boilerplate_index(), encode=encode)
+            pipeline = Pipeline(ingestion_stages(embed))
+            source = {}
             
-            print(f"Processing document {document_id}, content length: {len(content)}")
+            def extract():
+                source['extracted'] = extract_paragraphs(file_path, streaming)
+                yield from batched(source['extracted'].paragraphs, settings.INGESTION_PIPELINE_BATCH_SIZE)
             
-            # Split into smaller, meaningful chunks
-            chunks = self._smart_chunk_text(content)
-            print(f"Created {len(chunks)} chunks")
+            # Replace old chunks and mark the document processed in one transaction
+            def persist(batches):
+                if incremental:
+                    # The diff needs every new chunk up front
+                    chunks = [chunk for batch in batches for _, chunk, _ in batch]
+                    return self._store_chunks_incremental(document_id, chunks, source['extracted'].pages_count)
+                rows = ((i, fields) for batch in batches for i, _, fields in batch)
+                with transaction.atomic():
+                    stored = self._replace_rows(document_id, rows)
+                    self._mark_processed(document_id, source['extracted'].pages_count)
+                print(f"Stored {stored} chunks for document {document_id}")
+                return stored
             
-            # Delete old chunks for this document
-            DocumentChunk.objects.filter(document_id=document_id).delete()
+            stored = pipeline.run(extract(), persist)
+            timings = pipeline.timings()
+            print(f"Pipeline for document {document_id}: bottleneck stage '{timings['bottleneck']}'")
             
-            # Store new chunks
-            for i, chunk_text in enumerate(chunks):
-                chunk = DocumentChunk.objects.create(
-                    document_id=document_id,
-                    chunk_index=i,
-                    chunk_text=chunk_text,
-                    page_number=1,
-                    start_char=0,
-                    end_char=len(chunk_text),
-                    token_count=len(chunk_text.split()),
-                    embedding_id=f"{document_id}_{i}"
-                )
-                print(f"Stored chunk {i}: {chunk_text[:50]}...")
+            changes = None
+            if incremental:
+                changes = stored
+                chunks_created = changes['total']
+            else:
+                chunks_created = stored
             
-            # Update document status
-            document = Document.objects.get(id=document_id)
-            document.processing_status = 'completed'
-            document.save()
+            if progress_callback:
+                progress_callback(chunks_created)
             
             processing_time = time.time() - start_time
             
-            return {
+            result = {
                 'status': 'success',
-                'chunks_created': len(chunks),
-                'processing_time': processing_time
+                'chunks_created': chunks_created,
+                'processing_time': processing_time,
+                'stage_timings': timings
             }
+            if changes is not None:
+                result['changes'] = changes
+            return result
             
         except Exception as e:
             print(f"Error processing document: {e}")
-            try:
-                document = Document.objects.get(id=document_id)
-                document.processing_status = 'failed'
-                document.save()
-            except:
-                pass
+            # A failed incremental update rolled back, so the stored chunks are still whole and queryable
+            if not incremental:
+                try:
+                    document = Document.objects.get(id=document_id)
+                    document.mark_as_failed()
+                except:
+                    pass
             
             return {
                 'status': 'error',
                 'error': str(e)
             }
 
-    def _smart_chunk_text(self, text: str) -> List[str]:
-        """Split text into meaningful chunks."""
-        paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
+    def process_batch(self, items: List[Tuple[int, str]]) -> Dict[str, Any]:
+        """Process many ``(document_id, file_path)`` pairs.
+
+        Extraction and chunking fan out across the process pool; chunks are
+        persisted here as each file finishes, overlapping with the remaining work.
+        """
+        start = time.perf_counter()
+        pool = get_process_pool()
+        futures = {pool.submit(extract_chunks, file_path): document_id for document_id, file_path in items}
         
-        chunks = []
-        current_chunk = ""
+        results = {}
+        extract_total = 0.0
+        store_total = 0.0
+        chunks_total = 0
+        for future in as_completed(futures):
+            document_id = futures[future]
+            try:
+                extracted = future.result()
+            except Exception as e:
+                extracted = {'status': 'error', 'error': str(e), 'extract_time': 0.0}
+            extract_total += extracted['extract_time']
+            
+            result = self.store_extracted(document_id, extracted)
+            results[document_id] = result
+            if result['status'] == 'success':
+                store_total += result['store_time']
+                chunks_total += result['chunks_created']
         
-        for para in paragraphs:
-            if len(current_chunk) + len(para) > 300 and current_chunk:
-                chunks.append(current_chunk.strip())
-                current_chunk = para
-            else:
-                if current_chunk:
-                    current_chunk += "\n\n" + para
+        return {
+            'results': [results[document_id] for document_id, _ in items],
+            'timings': {
+                'total_time': time.perf_counter() - start,
+                'extract_time': extract_total,
+                'store_time': store_total,
+                'workers': get_process_pool_size(),
+                'files': len(items),
+                'chunks_created': chunks_total
+            }
+        }
+
+    def store_extracted(self, document_id: int, extracted: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist the output of ``extract_chunks`` for a document, marking it failed on error"""
+        if extracted['status'] != 'success':
+            Document.objects.filter(id=document_id).update(processing_status='failed', processed_at=timezone.now())
+            return {'document_id': document_id, 'status': 'error', 'error': extracted['error']}
+        
+        store_start = time.perf_counter()
+        try:
+            chunks_created = self._store_chunks(document_id, extracted['chunks'], extracted['pages_count'])
+        except Exception as e:
+            Document.objects.filter(id=document_id).update(processing_status='failed', processed_at=timezone.now())
+            return {'document_id': document_id, 'status': 'error', 'error': str(e)}
+        
+        return {
+            'document_id': document_id,
+            'status': 'success',
+            'chunks_created': chunks_created,
+            'extract_time': extracted['extract_time'],
+            'store_time': time.perf_counter() - store_start
+        }
+
+    def _embed_batch(self, batch: List[Tuple[int, TextChunk]],
+                     boilerplate_index: Optional[minhash.MinHashLSH] = None,
+                     encode: Optional[Callable[[List[str]], Any]] = None) -> List[Tuple[int, TextChunk, Dict[str, Any]]]:
+        """Embed/index stage: derive the stored columns of each ``(chunk_index, chunk)``.
+
+        With ``encode``, non-boilerplate chunks are embedded in one call and
+        their vectors passed along under ``fields['embedding']``.
+        """
+        rows = [(i, chunk, self._chunk_fields(chunk, boilerplate_index=boilerplate_index)) for i, chunk in batch]
+        if encode is not None:
+            embedded = [fields for _, _, fields in rows if fields['boilerplate_id'] is None]
+            for fields, vector in zip(embedded, encode([fields['chunk_text'] for fields in embedded])):
+                fields['embedding'] = vector
+        return rows
+
+    def _store_chunks(self, document_id: int, chunks: Iterable[TextChunk], pages_count: int = 1,
+                      batch_size: Optional[int] = None) -> int:
+        """Replace a document's chunks using batched inserts inside one transaction.
+
+        Readers see either the previous chunks or the complete new set, never a
+        partially written document.
+        """
+        boilerplate_index = get_boilerplate_index()
+        rows = ((i, self._chunk_fields(chunk, boilerplate_index=boilerplate_index)) for i, chunk in enumerate(chunks))
+        with transaction.atomic():
+            chunks_created = self._replace_rows(document_id, rows, batch_size)
+            self._mark_processed(document_id, pages_count)
+        
+        print(f"Stored {chunks_created} chunks for document {document_id}")
+        return chunks_created
+
+    def _replace_rows(self, document_id: int, rows: Iterable[Tuple[int, Dict[str, Any]]],
+                      batch_size: Optional[int] = None) -> int:
+        """Delete a document's chunks and bulk insert ``(chunk_index, fields)`` rows; call inside a transaction.
+
+        The document's inverted index is rebuilt from the same rows, and its
+        vectors are replaced once the transaction commits. Vectors the embed
+        stage did not compute are encoded here, one call per batch.
+        """
+        batch_size = batch_size or settings.CHUNK_BULK_BATCH_SIZE
+        DocumentChunk.objects.filter(document_id=document_id).delete()
+        
+        index = IndexBuilder()
+        vectors = DocumentVectors(document_id) if embeddings_enabled() else None
+        chunks_created = 0
+        for batch in batched(rows, batch_size):
+            embeddings = [fields.pop('embedding', None) for _, fields in batch]
+            for i, fields in batch:
+                index.add(i, fields['chunk_text'])  # Empty for boilerplate
+            if vectors is not None:
+                missing = [k for k, (_, fields) in enumerate(batch) if embeddings[k] is None and fields['boilerplate_id'] is None]
+                for k, vector in zip(missing, encode_chunks([batch[k][1]['chunk_text'] for k in missing])):
+                    embeddings[k] = vector
+                for (i, fields), vector in zip(batch, embeddings):
+                    if vector is not None:
+                        vectors.add(f"{document_id}_{i}", vector, i, fields['page_number'])
+            DocumentChunk.objects.bulk_create([
+                DocumentChunk(
+                    document_id=document_id,
+                    chunk_index=i,
+                    embedding_id=f"{document_id}_{i}",
+                    **fields
+                )
+                for i, fields in batch
+            ])
+            chunks_created += len(batch)
+        index.save(document_id, batch_size)
+        if vectors is not None:
+            vectors.schedule()
+        return chunks_created
+
+    def _store_chunks_incremental(self, document_id: int, chunks: Iterable[TextChunk], pages_count: int = 1,
+                                  batch_size: Optional[int] = None) -> Dict[str, int]:
+        """Update a document's chunks in place, writing only chunks whose content changed.
+
+        Stored chunks are matched to new ones by content hash, first at the same
+        position and then anywhere in the document. Matched chunks keep their row
+        and ``embedding_id`` (only their position columns change); unmatched rows are
+        reused for changed content, and the remainder is inserted or deleted.
+        Matched chunks whose only change is that an edit before them shifted
+        their character offsets are updated with one UPDATE per distinct shift;
+        their vectors and index entries are left alone.
+        """
+        batch_size = batch_size or settings.CHUNK_BULK_BATCH_SIZE
+        new_chunks = [(chunk, content_hash(chunk.text)) for chunk in chunks]
+        boilerplate_index = get_boilerplate_index()
+        
+        with transaction.atomic():
+            vectors = None
+            if embeddings_enabled():
+                # Unchanged chunks keep their vectors only if the document is already embedded with this encoder
+                embedded_with = Document.objects.filter(id=document_id).values_list('embedding_model', flat=True).first()
+                vectors = DocumentVectors(document_id, replace=embedded_with != get_encoder().name)
+            to_embed = []  # (embedding_id, text, chunk_index, page_number)
+            
+            existing = list(
+                DocumentChunk.objects.filter(document_id=document_id)
+                .only('id', 'chunk_index', 'content_hash', 'embedding_id', 'page_number', 'start_char', 'end_char',
+                      'boilerplate')
+                .order_by('chunk_index')
+            )
+            by_index = {chunk.chunk_index: chunk for chunk in existing}
+            by_hash = defaultdict(list)
+            for chunk in existing:
+                by_hash[chunk.content_hash].append(chunk)
+            
+            matched = {}
+            used = set()
+            # Unchanged chunks at the same position
+            for i, (chunk, digest) in enumerate(new_chunks):
+                old = by_index.get(i)
+                if old is not None and old.content_hash == digest:
+                    matched[i] = old
+                    used.add(old.id)
+            # Unchanged chunks that moved
+            for i, (chunk, digest) in enumerate(new_chunks):
+                if i in matched:
+                    continue
+                for old in by_hash.get(digest, ()):
+                    if old.id not in used:
+                        matched[i] = old
+                        used.add(old.id)
+                        break
+            
+            recycled = iter([chunk for chunk in existing if chunk.id not in used])
+            reindexed, updated, created = [], [], []
+            shifted = defaultdict(list)  # (start shift, end shift) -> ids of rows whose offsets alone changed
+            index = IndexBuilder()
+            for i, (chunk, digest) in enumerate(new_chunks):
+                old = matched.get(i)
+                if old is not None:
+                    embedded = vectors is not None and old.boilerplate_id is None and old.embedding_id
+                    if old.boilerplate_id is None:
+                        index.add(i, chunk.text)
+                    if embedded and vectors.replace:
+                        to_embed.append((old.embedding_id, chunk.text, i, chunk.page_number))
+                    if (i, chunk.page_number) != (old.chunk_index, old.page_number):
+                        old.chunk_index, old.page_number, old.start_char, old.end_char = (
+                            i, chunk.page_number, chunk.start_char, chunk.end_char
+                        )
+                        reindexed.append(old)
+                        if embedded and not vectors.replace:
+                            vectors.move(old.embedding_id, i, chunk.page_number)
+                    elif (chunk.start_char, chunk.end_char) != (old.start_char, old.end_char):
+                        shift = (chunk.start_char - old.start_char, chunk.end_char - old.end_char)
+                        shifted[shift].append(old.id)
+                    continue
+                
+                fields = self._chunk_fields(chunk, digest, boilerplate_index)
+                fields['embedding_id'] = f"{document_id}_{uuid.uuid4().hex[:16]}"
+                index.add(i, fields['chunk_text'])
+                if vectors is not None and fields['boilerplate_id'] is None:
+                    to_embed.append((fields['embedding_id'], chunk.text, i, chunk.page_number))
+                row = next(recycled, None)
+                if row is not None:
+                    if vectors is not None and row.embedding_id:
+                        vectors.delete([row.embedding_id])
+                    row.chunk_index = i
+                    for name, value in fields.items():
+                        setattr(row, name, value)
+                    updated.append(row)
                 else:
-                    current_chunk = para
+                    created.append(DocumentChunk(document_id=document_id, chunk_index=i, **fields))
+            removed = list(recycled)
+            deleted = [chunk.id for chunk in removed]
+            if vectors is not None:
+                vectors.delete([chunk.embedding_id for chunk in removed if chunk.embedding_id])
+                # Only new and changed chunks are encoded, in one batched pass
+                encoded = encode_chunks([text for _, text, _, _ in to_embed])
+                for (embedding_id, _, i, page_number), vector in zip(to_embed, encoded):
+                    vectors.add(embedding_id, vector, i, page_number)
+            
+            for ids in batched(deleted, batch_size):
+                DocumentChunk.objects.filter(id__in=ids).delete()
+            # Park rows that change position on negative indexes first so the
+            # (document, chunk_index) unique constraint never sees a collision
+            for ids in batched([chunk.id for chunk in reindexed + updated], batch_size):
+                DocumentChunk.objects.filter(id__in=ids).update(chunk_index=-F('chunk_index') - 1)
+            DocumentChunk.objects.bulk_update(
+                reindexed, ['chunk_index', 'page_number', 'start_char', 'end_char'], batch_size=batch_size
+            )
+            for (start_shift, end_shift), shifted_ids in shifted.items():
+                for ids in batched(shifted_ids, batch_size):
+                    DocumentChunk.objects.filter(id__in=ids).update(
+                        start_char=F('start_char') + start_shift, end_char=F('end_char') + end_shift
+                    )
+            DocumentChunk.objects.bulk_update(
+                updated,
+                ['chunk_index', 'embedding_id', 'chunk_text', 'content_hash', 'minhash', 'boilerplate',
+                 'page_number', 'start_char', 'end_char', 'token_count'],
+                batch_size=batch_size
+            )
+            DocumentChunk.objects.bulk_create(created, batch_size=batch_size)
+            index.save(document_id, batch_size)
+            if vectors is not None:
+                vectors.schedule()
+            
+            self._mark_processed(document_id, pages_count)
         
-        if current_chunk.strip():
-            chunks.append(current_chunk.strip())
+        shifted_count = sum(len(ids) for ids in shifted.values())
+        changes = {
+            'total': len(new_chunks),
+            'unchanged': len(matched) - len(reindexed) - shifted_count,
+            'shifted': shifted_count,
+            'moved': len(reindexed),
+            'updated': len(updated),
+            'inserted': len(created),
+            'deleted': len(deleted),
+        }
+        print(f"Incremental update of document {document_id}: {changes}")
+        return changes
+
+    def _mark_processed(self, document_id: int, pages_count: int):
+        document = Document.objects.get(id=document_id)
+        document.pages_count = pages_count
+        signature = stored_signature(document_id)
+        document.minhash = minhash.to_bytes(signature) if signature is not None else None
+        document.mark_as_processed()
+        index_document(document)
+
+    def _chunk_fields(self, chunk: TextChunk, digest: Optional[str] = None,
+                      boilerplate_index: Optional[minhash.MinHashLSH] = None) -> Dict[str, Any]:
+        """Column values derived from a chunk.
+
+        A chunk matching known boilerplate is linked to it and stores no text of its own.
+        """
+        signature = minhash.signature(chunk.text)
+        boilerplate_id = None
+        if boilerplate_index is not None and len(boilerplate_index):
+            boilerplate_id = boilerplate_index.match(signature)
+        return {
+            'chunk_text': '' if boilerplate_id is not None else chunk.text,
+            'content_hash': digest or content_hash(chunk.text),
+            'minhash': minhash.to_bytes(signature),
+            'boilerplate_id': boilerplate_id,
+            'page_number': chunk.page_number,
+            'start_char': chunk.start_char,
+            'end_char': chunk.end_char,
+            'token_count': chunk.token_count if chunk.token_count is not None else count_tokens(chunk.text),
+        }
+
+    def _lexical_ranking(self, document_id: int, question: str, limit: int, chunks,
+                         page_number: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Top ``(chunk_index, score)`` by BM25; scores are scaled so an average-length chunk holding every query term once scores 1"""
+        query_terms = extract_terms(question)
+        
+        indexed_chunks = Document.objects.filter(id=document_id).values_list('indexed_chunks', flat=True).first()
+        if indexed_chunks is None:
+            # Documents processed before the index existed are indexed on their first question
+            with transaction.atomic():
+                index_stored_document(document_id)
+            indexed_chunks = Document.objects.filter(id=document_id).values_list('indexed_chunks', flat=True).first()
         
-        return chunks
+        # Only chunks containing a query term are scored, from the precomputed BM25 weights
+        postings, chunk_frequencies = load_postings(document_id, query_terms)
+        allowed = chunks.values_list('chunk_index', flat=True) if page_number is not None else None
+        chunk_indexes, scores = rank_chunks(postings, query_terms, limit, allowed)
+        bound = query_score_bound(query_terms, chunk_frequencies, indexed_chunks or 0)
+        return [(i, score / bound) for i, score in zip(chunk_indexes.tolist(), scores.tolist())]
+
+    def _semantic_ranking(self, document_id: int, question: str, limit: int, chunks,
+                          page_number: Optional[int] = None) -> Optional[List[Tuple[int, float]]]:
+        """Top ``(chunk_index, cosine similarity)`` by embedding, or None when semantic retrieval is unavailable"""
+        matches = search_document(document_id, question, limit, page_number)
+        if matches is None:
+            return None
+        indexes = dict(chunks.filter(embedding_id__in=[e for e, _ in matches]).values_list('embedding_id', 'chunk_index'))
+        return [(indexes[e], similarity) for e, similarity in matches if e in indexes]
+
+    def _hybrid_ranking(self, document_id: int, question: str, limit: int, chunks,
+                        page_number: Optional[int] = None) -> Optional[List[Tuple[int, float]]]:
+        """Top ``(chunk_index, score)`` ordered by reciprocal rank fusion of the lexical and semantic rankings.
+
+        The semantic retriever runs on a pool thread while this thread runs the
+        lexical one. Each contributes its top HYBRID_CANDIDATES chunks. The
+        fused score only orders the chunks: each keeps the better of its own
+        lexical and semantic scores, so similarity and confidence mean the same
+        as in the other modes. None when semantic retrieval is unavailable.
+        """
+        depth = max(limit, settings.HYBRID_CANDIDATES)
+        semantic = get_thread_pool().submit(
+            _run_in_thread, self._semantic_ranking, document_id, question, depth, chunks, page_number
+        )
+        lexical = self._lexical_ranking(document_id, question, depth, chunks, page_number)
+        semantic = semantic.result()
+        if semantic is None:
+            return None
+        scores = dict(lexical)
+        for i, similarity in semantic:
+            scores[i] = max(scores.get(i, similarity), similarity)
+        fused = reciprocal_rank_fusion([[i for i, _ in lexical], [i for i, _ in semantic]], limit=limit)
+        return [(i, scores[i]) for i, _ in fused]
 
-    def ask_question(self, document_id: int, question: str, num_chunks: int = 3) -> Dict[str, Any]:
-        """Answer a question using smart text analysis."""
+    def _fetch_chunks(self, ranking: List[Tuple[int, float]], chunks) -> List[Dict[str, Any]]:
+        """Load only the ranked chunks, in ranking order"""
+        rows = {chunk.chunk_index: chunk for chunk in chunks.filter(chunk_index__in=[i for i, _ in ranking])}
+        return [
+            {'chunk': rows[i], 'score': score, 'content': rows[i].chunk_text}
+            for i, score in ranking if i in rows
+        ]
+
+    def ask_question(self, document_id: int, question: str, num_chunks: int = 3,
+                     page_number: Optional[int] = None, mode: Optional[str] = None) -> Dict[str, Any]:
+        """Answer a question from the best matching chunks, optionally limited to one page.
+
+        ``mode`` picks the retriever: 'lexical' (BM25), 'semantic' (nearest
+        embeddings) or 'hybrid' (both, fused by rank); ASK_RETRIEVAL_MODE by
+        default. Semantic and hybrid questions fall back to lexical retrieval
+        when no vector store is available or the document has not been
+        embedded with the current encoder yet.
+        Answers that cite sources are cached (see answer_cache); ``cached``
+        in the result tells whether it came from the cache.
+        """
+        start_time = time.time()
+        mode = mode or settings.ASK_RETRIEVAL_MODE
+        key = None
+        if settings.ANSWER_CACHE_ENABLED:
+            generation = document_generation(document_id)
+            if generation is not None:
+                key = cache_key(document_id, generation, question, num_chunks, page_number, mode)
+                cached = get_answer(key)
+                if cached is not None:
+                    print(f"Answer cache hit for document {document_id}")
+                    return {**cached, 'cached': True, 'response_time': time.time() - start_time}
+        
+        result = self._answer_question(document_id, question, num_chunks, page_number, mode)
+        if key is not None and result['sources']:
+            store_answer(key, {name: value for name, value in result.items() if name != 'response_time'})
+        return {**result, 'cached': False}
+
+    def _answer_question(self, document_id: int, question: str, num_chunks: int,
+                         page_number: Optional[int], mode: str) -> Dict[str, Any]:
         try:
             start_time = time.time()
             
             print(f"=== NEW PROCESSOR: Answering question: '{question}' ===")
             
-            chunks = DocumentChunk.objects.filter(document_id=document_id)
-            print(f"Found {chunks.count()} chunks for document {document_id}")
-            
-            if not chunks:
-                return {
-                    'answer': 'No content found for this document.',
-                    'confidence': 0.0,
-                    'sources': [],
-                    'response_time': time.time() - start_time
-                }
-            
-            # Simple keyword matching approach
-            question_lower = question.lower()
-            question_words = question_lower.split()
-            
-            # Score chunks based on keyword matches
-            scored_chunks = []
-            for chunk in chunks:
-                chunk_text_lower = chunk.chunk_text.lower()
-                score = 0
-                
-                # Count keyword matches
-                for word in question_words:
-                    if len(word) > 2:  # Skip short words
-                        score += chunk_text_lower.count(word)
-                
-                if score > 0:
-                    scored_chunks.append({
-                        'chunk': chunk,
-                        'score': score,
-                        'content': chunk.chunk_text
-                    })
+            # Boilerplate (disclaimers, headers) repeats across documents and never answers a question
+            chunks = DocumentChunk.objects.filter(document_id=document_id, boilerplate__isnull=True)
+            if page_number is not None:
+                chunks = chunks.filter(page_number=page_number)
             
-            # Sort by score and take top chunks
-            scored_chunks.sort(key=lambda x: x['score'], reverse=True)
-            relevant_chunks = scored_chunks[:num_chunks]
+            ranking = None
+            if mode in ('semantic', 'hybrid'):
+                rank = self._semantic_ranking if mode == 'semantic' else self._hybrid_ranking
+                ranking = rank(document_id, question, num_chunks, chunks, page_number)
+                if ranking is None:
+                    print("Semantic retrieval unavailable; falling back to lexical")
+                    mode = 'lexical'
+            if ranking is None:
+                ranking = self._lexical_ranking(document_id, question, num_chunks, chunks, page_number)
+            relevant_chunks = self._fetch_chunks(ranking, chunks)
+            print(f"Retrieved {len(relevant_chunks)} chunks for document {document_id} ({mode})")
             
             if not relevant_chunks:
                 # Fallback: use first chunk
                 first_chunk = chunks.first()
-                if first_chunk:
-                    relevant_chunks = [{
-                        'chunk': first_chunk,
-                        'score': 1,
-                        'content': first_chunk.chunk_text
-                    }]
-                else:
-                    relevant_chunks = [{
-                        'chunk': None,
-                        'score': 0,
-                        'content': "No document content available."
-                    }]
+                if first_chunk is None:
+                    return {
+                        'answer': 'No content found for this document.',
+                        'confidence': 0.0,
+                        'sources': [],
+                        'response_time': time.time() - start_time
+                    }
+                relevant_chunks = [{
+                    'chunk': first_chunk,
+                    'score': 0.0,
+                    'content': first_chunk.chunk_text
+                }]
             
             # Generate answer based on question type
             answer = self._generate_answer(question, relevant_chunks)
             
             # Calculate confidence
             best_score = relevant_chunks[0]['score'] if relevant_chunks else 0
-            confidence = min(0.9, best_score / max(1, len(question_words)))
+            confidence = min(0.9, best_score)
             
             # Prepare sources
             sources = []
             for item in relevant_chunks:
                 sources.append({
                     'chunk_id': item['chunk'].chunk_index,
+                    'page_number': item['chunk'].page_number,
                     'content': item['content'][:200] + "..." if len(item['content']) > 200 else item['content'],
-                    'similarity': min(0.9, item['score'] / 10)  # Normalize score
+                    'similarity': min(0.9, item['score'])
                 })
             
             return {
                 'answer': answer,
                 'confidence': confidence,
                 'sources': sources,
+                'retrieval_mode': mode,
                 'response_time': time.time() - start_time
             }
             
@@ -181,6 +683,35 @@ class DocumentProcessor:
                 'response_time': time.time() - start_time
             }
 
+    def search(self, query: str, limit: int = 10, document_ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Chunks of all documents, or of ``document_ids``, nearest to the query by embedding, best first"""
+        start_time = time.time()
+        matches = search_corpus(query, limit, document_ids)
+        if matches is None:
+            return {'error': 'Semantic search is unavailable: no vector store is configured'}
+        
+        # One query for the hits and their documents; ids of since-deleted chunks drop out.
+        # Boilerplate is skipped here rather than in SQL, where SQLite would pick the
+        # boilerplate index (null for nearly every row) over the embedding id one.
+        chunks = DocumentChunk.objects.filter(embedding_id__in=[e for e, _ in matches]).select_related('document')
+        rows = {chunk.embedding_id: chunk for chunk in chunks.order_by()}
+        results = []
+        for e, similarity in matches:
+            chunk = rows.get(e)
+            if chunk is None or chunk.boilerplate_id is not None:
+                continue
+            content = chunk.chunk_text
+            results.append({
+                'document_id': chunk.document_id,
+                'document_title': chunk.document.title,
+                'chunk_id': chunk.chunk_index,
+                'page_number': chunk.page_number,
+                'content': content[:200] + "..." if len(content) > 200 else content,
+                'similarity': similarity
+            })
+        print(f"Search found {len(results)} chunks for '{query}'")
+        return {'results': results, 'response_time': time.time() - start_time}
+
     def _generate_answer(self, question: str, relevant_chunks: List[Dict]) -> str:
         """Generate answer based on question type and content."""
         question_lower = question.lower()
@@ -203,10 +734,10 @@ class DocumentProcessor:
         
         elif any(word in question_lower for word in ['what', 'describe', 'explain']):
             # Extract first meaningful sentence from content
-            sentences = best_content.split('.')
-            for sentence in sentences:
-                if len(sentence.strip()) > 20:
-                    return sentence.strip() + "."
+            for start, end in sentence_spans(best_content):
+                if end - start > 20:
+                    sentence = best_content[start:end]
+                    return sentence if sentence[-1] in '.!?' else sentence + "."
         
         # Default: return relevant content excerpt
         return best_content[:200] + "..." if len(best_content) > 200 else best_content
@@ -220,6 +751,7 @@ class DocumentProcessor:
                 'document_id': document_id,
                 'title': document.title,
                 'total_chunks': chunks.count(),
+                'boilerplate_chunks': chunks.filter(boilerplate__isnull=False).count(),
                 'processing_status': document.processing_status,
                 'file_size': document.file_size,
                 'pages_count': document.pages_count,
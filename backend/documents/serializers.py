@@ -1,6 +1,6 @@
 ﻿# documents/serializers.py
 from rest_framework import serializers
-from .models import Document, DocumentChunk
+from .models import Document, DocumentChunk, IngestionJob, UploadSession
 
 class DocumentSerializer(serializers.ModelSerializer):
     file_size_display = serializers.SerializerMethodField()
@@ -9,10 +9,10 @@ class DocumentSerializer(serializers.ModelSerializer):
         model = Document
         fields = [
             'id', 'title', 'file_path', 'document_type', 'file_size', 
-            'file_size_display', 'pages_count', 'processing_status', 
+            'file_size_display', 'content_hash', 'pages_count', 'processing_status', 
             'uploaded_at', 'processed_at', 'updated_at'
         ]
-        read_only_fields = ['id', 'uploaded_at', 'processed_at', 'updated_at']
+        read_only_fields = ['id', 'content_hash', 'uploaded_at', 'processed_at', 'updated_at']
     
     def get_file_size_display(self, obj):
         """Get human readable file size"""
@@ -23,7 +23,43 @@ class DocumentSerializer(serializers.ModelSerializer):
             size /= 1024.0
         return f"{size:.1f} TB"
 
+class IngestionJobSerializer(serializers.ModelSerializer):
+    document_status = serializers.CharField(source='document.processing_status', read_only=True)
+    processed_at = serializers.DateTimeField(source='document.processed_at', read_only=True)
+    
+    class Meta:
+        model = IngestionJob
+        fields = [
+            'id', 'document', 'status', 'incremental', 'attempts', 'chunks_created',
+            'error_message', 'near_duplicates', 'created_at', 'started_at', 'finished_at',
+            'document_status', 'processed_at'
+        ]
+        read_only_fields = fields
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = [
+            'upload_id', 'filename', 'total_size', 'received_bytes', 'parts_received',
+            'status', 'error_message', 'document', 'created_at', 'updated_at'
+        ]
+        read_only_fields = fields
+
+class UploadSessionCreateSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255)
+    total_size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-fA-F]{64}$', required=False, allow_blank=True, default='')
+
 class QuestionSerializer(serializers.Serializer):
     document_id = serializers.IntegerField()
     question = serializers.CharField(max_length=1000)
-    num_chunks = serializers.IntegerField(default=3, min_value=1, max_value=10)
\ No newline at end of file
+    num_chunks = serializers.IntegerField(default=3, min_value=1, max_value=10)
+    page_number = serializers.IntegerField(required=False, min_value=1)
+    retrieval_mode = serializers.ChoiceField(choices=['lexical', 'semantic', 'hybrid'], required=False)
+
+class SearchSerializer(serializers.Serializer):
+    query = serializers.CharField(max_length=1000)
+    document_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), required=False, allow_empty=False, max_length=1000
+    )
+    limit = serializers.IntegerField(default=10, min_value=1, max_value=50)
\ No newline at end of file
@@ -0,0 +1,77 @@
+# documents/storage.py
+"""Content-addressed storage for uploaded files.
+
+Uploads are hashed while they stream to a temporary file and then moved to
+``media/documents/<sha[:2]>/<sha><ext>``, so identical bytes always land on the
+same path and files with the same name never overwrite each other.
+"""
+import hashlib
+import os
+import tempfile
+from typing import Tuple
+
+from django.conf import settings
+
+
+def get_upload_dir() -> str:
+    return os.path.join(settings.BASE_DIR, 'media', 'documents')
+
+
+def content_addressed_path(digest: str, original_name: str) -> str:
+    """Path a file with the given SHA-256 digest is stored under"""
+    extension = os.path.splitext(original_name)[1].lower()
+    return os.path.join(get_upload_dir(), digest[:2], f"{digest}{extension}")
+
+
+def hash_file(file_path: str, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file already on disk, read in blocks"""
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def resolve_import_path(relative_path: str) -> str:
+    """Resolve a manifest entry under BATCH_IMPORT_ROOT, rejecting paths that escape it"""
+    root = os.path.realpath(settings.BATCH_IMPORT_ROOT)
+    file_path = os.path.realpath(os.path.join(root, relative_path))
+    if os.path.commonpath([root, file_path]) != root:
+        raise ValueError(f"Path is outside the import root: {relative_path}")
+    if not os.path.isfile(file_path):
+        raise ValueError(f"File not found: {relative_path}")
+    return file_path
+
+
+def store_uploaded_file(uploaded_file) -> Tuple[str, str]:
+    """Stream an upload to disk while hashing it; return ``(file_path, sha256)``"""
+    upload_dir = get_upload_dir()
+    os.makedirs(upload_dir, exist_ok=True)
+
+    sha256 = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in uploaded_file.chunks():
+                sha256.update(chunk)
+                destination.write(chunk)
+
+        digest = sha256.hexdigest()
+        file_path = move_into_place(temp_path, digest, uploaded_file.name)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return file_path, digest
+
+
+def move_into_place(temp_path: str, digest: str, original_name: str) -> str:
+    """Move a fully written temporary file to its content-addressed path"""
+    file_path = content_addressed_path(digest, original_name)
+    if os.path.exists(file_path):
+        os.remove(temp_path)
+    else:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        os.replace(temp_path, file_path)
+    return file_path
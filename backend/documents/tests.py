@@ -1,3 +1,1484 @@
-from django.test import TestCase
+import hashlib
+import io
+import itertools
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import boilerplate, compression, hnsw, near_duplicates, processors
+from .answer_cache import bump_generation, cache_key, cache_stats, reset_stats
+from .chunking import chunk_page_paragraphs, iter_chunks, iter_page_paragraphs, iter_paragraphs, split_paragraphs
+from .compression import CompressedText
+from .fusion import reciprocal_rank_fusion
+from .hnsw import HNSWIndex
+from .inverted_index import (
+    IndexBuilder, bm25_weights, decode_postings, encode_postings_lists, extract_terms, load_postings,
+    query_score_bound, rank_chunks, varbyte_decode, varbyte_encode
+)
+from .jobs import claim_next_job, enqueue_document, requeue_stale_jobs, run_job, worker_loop
+from .models import Document, DocumentChunk, IngestionJob, UploadSession
+from .processors import DocumentProcessor
+from .uploads import UploadError, append_part, create_session, finalize_session, parse_content_range
+from .boilerplate import detect_boilerplate
+from .embedding_cache import EmbeddingCache, get_embedding_cache
+from .embeddings import HashingEncoder, embed_stored_document, encode_chunks, get_encoder
+from .minhash import signature
+from .near_duplicates import DocumentIndex, job_near_duplicates
+from .pipeline import Pipeline, Stage, batched
+from .sentences import sentence_spans
+from .vector_store import NumpyVectorStore, get_vector_store
+
+
+def reset_process_indexes():
+    """Forget the per-process indexes, which would otherwise remember documents of rolled-back tests"""
+    near_duplicates._index = None
+    boilerplate._index = None
+    hnsw._index = None
+
+
+class TempDirMixin:
+    """A scratch directory removed after each test"""
+
+    def setUp(self):
+        super().setUp()
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir, ignore_errors=True)
+        self.addCleanup(reset_process_indexes)
+
+    def write_file(self, name, text):
+        file_path = os.path.join(self.temp_dir, name)
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return file_path
+
+    def create_document(self, text, name='doc.txt'):
+        file_path = self.write_file(name, text)
+        return Document.objects.create(title=name, file_path=file_path, document_type='txt',
+                                       file_size=os.path.getsize(file_path))
+
+    def use_temp_vector_store(self):
+        """Keep vectors written by the test in the scratch directory"""
+        override = override_settings(VECTOR_STORE_BACKEND='numpy', VECTOR_STORE_PATH=os.path.join(self.temp_dir, 'vectors'))
+        override.enable()
+        self.addCleanup(override.disable)
+        get_vector_store.cache_clear()
+        self.addCleanup(get_vector_store.cache_clear)
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def unit_vectors(count, dimension=32, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def paragraphs_text(count, edits=None):
+    """``count`` short paragraphs; ``edits`` maps a paragraph number to replacement text"""
+    edits = edits or {}
+    return '\n\n'.join(edits.get(i, f"Paragraph {i} talks about topic{i} and nothing else.") for i in range(count))
+
+
+class ChunkingTests(SimpleTestCase):
+    """Chunks and paragraphs carry offsets into the source text"""
+
+    def setUp(self):
+        self.text = '\n\n'.join(
+            f"Paragraph {i} " + 'word ' * (i % 7 * 3) + 'end.' for i in range(40)
+        )
+
+    def test_paragraph_offsets(self):
+        source = '  First one.  \n\n\n\nSecond\none.\n\n   \n\nThird.'
+        paragraphs = list(split_paragraphs(source))
+        self.assertEqual([text for text, _, _ in paragraphs], ['First one.', 'Second\none.', 'Third.'])
+        for text, start, end in paragraphs:
+            self.assertEqual(source[start:end], text)
+
+    def test_streamed_paragraphs_match_in_memory_split(self):
+        text = 'a' * 50 + '\n\n' + 'b' * 3 + '\n\n\n' + 'c' * 120 + '\n\n\n\n' + 'd'
+        expected = list(split_paragraphs(text))
+        for block_size in (1, 2, 3, 7, 64, 1024):
+            with self.subTest(block_size=block_size):
+                self.assertEqual(list(iter_paragraphs(io.StringIO(text), block_size)), expected)
+
+    def test_long_run_without_separators_is_one_paragraph(self):
+        text = 'x' * 10000 + '\n\n' + 'y' * 10
+        paragraphs = list(iter_paragraphs(io.StringIO(text), block_size=16))
+        self.assertEqual(paragraphs, [('x' * 10000, 0, 10000), ('y' * 10, 10002, 10012)])
+
+    def test_chunk_offsets_reproduce_source(self):
+        for overlap in (0, 10):
+            with self.subTest(overlap=overlap):
+                chunks = list(iter_chunks(split_paragraphs(self.text), chunk_size=30, chunk_overlap=overlap))
+                self.assertGreater(len(chunks), 1)
+                for chunk in chunks:
+                    self.assertEqual(self.text[chunk.start_char:chunk.end_char], chunk.text)
+                    self.assertLessEqual(chunk.token_count, 30)
+
+    def test_overlap_repeats_trailing_paragraphs(self):
+        chunks = list(iter_chunks(split_paragraphs(self.text), chunk_size=30, chunk_overlap=10))
+        pairs = list(zip(chunks, chunks[1:]))
+        self.assertTrue(any(chunk.start_char < previous.end_char for previous, chunk in pairs))
+        for previous, chunk in pairs:
+            self.assertGreater(chunk.start_char, previous.start_char)
+            self.assertGreater(chunk.end_char, previous.end_char)
+
+    def test_long_paragraph_split_at_sentences(self):
+        long = ' '.join(f"Sentence number {i} is here." for i in range(60))
+        text = 'Intro.\n\n' + long + '\n\nOutro.'
+        chunks = list(iter_chunks(split_paragraphs(text), chunk_size=20, chunk_overlap=0))
+        self.assertGreater(len(chunks), 3)
+        for chunk in chunks:
+            self.assertEqual(text[chunk.start_char:chunk.end_char], chunk.text)
+            self.assertTrue(chunk.text.endswith('.'))
+
+    def test_page_offsets_refer_to_joined_pages(self):
+        pages = ['Page one para.\n\nSecond para.', 'Page two.']
+        joined = '\n\n'.join(pages)
+        chunks = list(chunk_page_paragraphs(iter_page_paragraphs(pages)))
+        self.assertEqual([chunk.page_number for chunk in chunks], [1, 2])
+        for chunk in chunks:
+            self.assertEqual(joined[chunk.start_char:chunk.end_char], chunk.text)
+
+
+@override_settings(CHUNK_SIZE=15, CHUNK_OVERLAP=0, EMBED_ON_INGEST=False, INGESTION_AUTOSTART_WORKERS=False,
+                   INGESTION_JOB_TIMEOUT=60)
+class JobQueueTests(TempDirMixin, TestCase):
+    """Jobs are claimed by one worker at a time and always end completed or failed"""
+
+    def setUp(self):
+        super().setUp()
+        self.documents = [self.create_document(paragraphs_text(3), name=f"doc{i}.txt") for i in range(3)]
+        self.jobs = [enqueue_document(document, document.file_path) for document in self.documents]
+
+    def test_claims_are_exclusive_and_oldest_first(self):
+        claimed = [claim_next_job(f"worker-{i}") for i in range(4)]
+        self.assertEqual([job.pk if job else None for job in claimed], [job.pk for job in self.jobs] + [None])
+        for i, job in enumerate(claimed[:3]):
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.worker_id, job.attempts), ('processing', f"worker-{i}", 1))
+
+    def test_claim_skips_a_job_taken_after_it_was_listed(self):
+        values_list = QuerySet.values_list
+
+        def stale_candidates(queryset, *args, **kwargs):
+            candidates = list(values_list(queryset, *args, **kwargs))
+            # Another worker wins the first candidate between the SELECT and the UPDATE
+            IngestionJob.objects.filter(id=candidates[0]).update(status='processing', worker_id='other')
+            return candidates
+
+        with mock.patch.object(QuerySet, 'values_list', stale_candidates):
+            job = claim_next_job('me')
+        self.assertEqual(job.pk, self.jobs[1].pk)
+        self.assertEqual(IngestionJob.objects.get(pk=self.jobs[0].pk).worker_id, 'other')
+        self.assertEqual(job.worker_id, 'me')
+
+    def test_job_runs_to_completion(self):
+        job = run_job(claim_next_job('worker'), DocumentProcessor())
+        self.assertEqual((job.status, job.chunks_created, job.error_message), ('completed', 3, ''))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(Document.objects.get(pk=job.document_id).processing_status, 'completed')
+
+    def test_failed_job(self):
+        os.remove(self.documents[0].file_path)
+        job = run_job(claim_next_job('worker'), DocumentProcessor())
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('No such file', job.error_message)
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(Document.objects.get(pk=job.document_id).processing_status, 'failed')
+
+    def test_stale_jobs_are_requeued(self):
+        stale, fresh = claim_next_job('dead'), claim_next_job('alive')
+        IngestionJob.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timedelta(seconds=120))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(IngestionJob.objects.get(pk=stale.pk).status, 'pending')
+        self.assertEqual(IngestionJob.objects.get(pk=fresh.pk).status, 'processing')
+        self.assertEqual(claim_next_job('new').pk, stale.pk)
+
+    def test_idle_worker_requeues_stale_jobs(self):
+        for _ in self.jobs:
+            claim_next_job('dead')
+        IngestionJob.objects.update(started_at=timezone.now() - timedelta(seconds=120))
+        stop_event = threading.Event()
+        ran = []
+
+        def fake_run_job(job, processor):
+            ran.append(job.pk)
+            if len(ran) == len(self.jobs):
+                stop_event.set()
+
+        # Keep the test transaction's connection open
+        with mock.patch('documents.jobs.close_old_connections'), mock.patch('documents.jobs.run_job', fake_run_job):
+            worker_loop('worker', stop_event, poll_interval=0)
+        self.assertEqual(ran, [job.pk for job in self.jobs])
+        self.assertEqual(set(IngestionJob.objects.values_list('worker_id', flat=True)), {'worker'})
+
+    def test_upload_returns_job_to_poll(self):
+        upload = SimpleUploadedFile('new.txt', paragraphs_text(4).encode())
+        with override_settings(BASE_DIR=self.temp_dir):
+            response = self.client.post(reverse('documents:document-upload'), {'file': upload})
+        self.assertEqual(response.status_code, 202)
+        status_url = response.json()['job_status_url']
+
+        job = self.client.get(status_url).json()['job']
+        self.assertEqual((job['status'], job['document_status']), ('pending', 'pending'))
+
+        IngestionJob.objects.exclude(pk=job['id']).delete()
+        run_job(claim_next_job('worker'), DocumentProcessor())
+        job = self.client.get(status_url).json()['job']
+        self.assertEqual((job['status'], job['document_status'], job['chunks_created']), ('completed', 'completed', 4))
+        self.assertEqual(job['near_duplicates'], [])
+        self.assertEqual(self.client.get(reverse('documents:job-status', args=[0])).status_code, 404)
+
+
+@override_settings(CHUNK_SIZE=15, CHUNK_OVERLAP=0, EMBED_ON_INGEST=False, INGESTION_AUTOSTART_WORKERS=False)
+class IncrementalUpdateTests(TempDirMixin, TestCase):
+    """Incremental processing rewrites only changed chunks and ends up like a full reprocess"""
+
+    def setUp(self):
+        super().setUp()
+        self.processor = DocumentProcessor()
+        self.document = self.create_document(paragraphs_text(10))
+        self.assertEqual(self.processor.process_document(self.document.pk, self.document.file_path)['status'], 'success')
+
+    def stored(self, document):
+        return list(
+            DocumentChunk.objects.filter(document=document).order_by('chunk_index')
+            .values_list('chunk_index', 'chunk_text', 'start_char', 'end_char')
+        )
+
+    def reprocess(self, text):
+        self.write_file('doc.txt', text)
+        result = self.processor.process_document(self.document.pk, self.document.file_path, incremental=True)
+        self.assertEqual(result['status'], 'success')
+        expected = self.create_document(text, name='expected.txt')
+        self.processor.process_document(expected.pk, expected.file_path)
+        self.assertEqual(
+            [(i, str(text), start, end) for i, text, start, end in self.stored(self.document)],
+            [(i, str(text), start, end) for i, text, start, end in self.stored(expected)]
+        )
+        return result['changes']
+
+    def test_edit_rewrites_one_chunk_and_shifts_the_rest(self):
+        ids = dict(DocumentChunk.objects.filter(document=self.document).values_list('chunk_index', 'id'))
+        self.assertEqual(len(ids), 10)
+
+        changes = self.reprocess(paragraphs_text(10, {4: 'Paragraph 4 was rewritten at some length.'}))
+
+        self.assertEqual(changes, {'total': 10, 'unchanged': 4, 'shifted': 5, 'moved': 0,
+                                   'updated': 1, 'inserted': 0, 'deleted': 0})
+        self.assertEqual(dict(DocumentChunk.objects.filter(document=self.document).values_list('chunk_index', 'id')), ids)
+
+    def test_removed_paragraph_moves_later_chunks(self):
+        changes = self.reprocess(paragraphs_text(10).split('\n\n', 1)[1])
+        self.assertEqual(changes['total'], 9)
+        self.assertEqual(changes['moved'], 9)
+        self.assertEqual(changes['deleted'], 1)
+        self.assertEqual(changes['updated'] + changes['inserted'], 0)
+
+    def test_unchanged_file_changes_nothing(self):
+        changes = self.reprocess(paragraphs_text(10))
+        self.assertEqual(changes['unchanged'], 10)
+
+    def test_replace_view_queues_incremental_job(self):
+        generation = Document.objects.get(pk=self.document.pk).generation
+        upload = SimpleUploadedFile('notes.md', paragraphs_text(11).encode())
+        with override_settings(BASE_DIR=self.temp_dir):
+            response = self.client.post(reverse('documents:document-replace', args=[self.document.pk]), {'file': upload})
+        self.assertEqual(response.status_code, 202)
+
+        document = Document.objects.get(pk=self.document.pk)
+        self.assertEqual(document.document_type, 'md')
+        self.assertGreater(document.generation, generation)
+        job = IngestionJob.objects.get(pk=response.json()['job_id'])
+        self.assertTrue(job.incremental)
+        self.assertEqual(job.file_path, document.file_path)
+        self.assertTrue(document.file_path.startswith(self.temp_dir))
+
+    def test_questions_answered_while_replace_job_runs(self):
+        upload = SimpleUploadedFile('doc.txt', paragraphs_text(10, {4: 'Paragraph 4 now covers zebras.'}).encode())
+        with override_settings(BASE_DIR=self.temp_dir):
+            response = self.client.post(reverse('documents:document-replace', args=[self.document.pk]), {'file': upload})
+        job = IngestionJob.objects.get(pk=response.json()['job_id'])
+
+        def ask(question):
+            response = self.client.post(reverse('documents:ask-question'), {
+                'document_id': self.document.pk, 'question': question
+            }, content_type='application/json')
+            self.assertEqual(response.status_code, 200, response.content)
+            return response.json()
+
+        self.assertEqual(Document.objects.get(pk=self.document.pk).processing_status, 'completed')
+        self.assertIn('topic4', ask('What about topic4?')['sources'][0]['content'])
+
+        statuses = []
+
+        class Processor(DocumentProcessor):
+            def process_document(self, document_id, *args, **kwargs):
+                statuses.append(Document.objects.get(pk=document_id).processing_status)
+                return super().process_document(document_id, *args, **kwargs)
+
+        job = run_job(claim_next_job('worker'), Processor())
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(statuses, ['completed'])
+        self.assertIn('zebras', ask('What about zebras?')['sources'][0]['content'])
+
+    def test_failed_replace_job_keeps_document_queryable(self):
+        job = enqueue_document(self.document, os.path.join(self.temp_dir, 'missing.txt'), incremental=True)
+        job = run_job(claim_next_job('worker'), self.processor)
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(Document.objects.get(pk=self.document.pk).processing_status, 'completed')
+        self.assertEqual(DocumentChunk.objects.filter(document=self.document).count(), 10)
+
+
+@override_settings(CHUNK_SIZE=15, CHUNK_OVERLAP=0, EMBED_ON_INGEST=False, BATCH_PROCESS_WORKERS=2)
+class BatchUploadTests(TempDirMixin, TestCase):
+    """Batch uploads fan out across the process pool and report one result per file"""
+
+    def setUp(self):
+        super().setUp()
+        self.import_root = os.path.join(self.temp_dir, 'imports')
+        os.makedirs(os.path.join(self.import_root, 'nested'))
+        settings_override = override_settings(BASE_DIR=self.temp_dir, BATCH_IMPORT_ROOT=self.import_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Pool processes keep the settings they were forked with, so each test starts its own pool
+        self.addCleanup(self.shutdown_process_pool)
+        self.shutdown_process_pool()
+        self.url = reverse('documents:document-batch-upload')
+
+    def shutdown_process_pool(self):
+        if processors._process_pool is not None:
+            processors._process_pool.shutdown()
+            processors._process_pool = None
+
+    def post_manifest(self, manifest):
+        return self.client.post(self.url, manifest, content_type='application/json')
+
+    def test_multipart_batch(self):
+        files = [
+            SimpleUploadedFile('a.txt', paragraphs_text(5).encode()),
+            SimpleUploadedFile('b.md', paragraphs_text(8).encode()),
+            SimpleUploadedFile('c.exe', b'binary'),
+            SimpleUploadedFile('a-copy.txt', paragraphs_text(5).encode()),
+        ]
+        response = self.client.post(self.url, {'files': files})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        results = {result['file']: result for result in body['results']}
+        self.assertEqual(set(results), {'a.txt', 'b.md', 'c.exe', 'a-copy.txt'})
+        self.assertEqual(results['c.exe'], {'file': 'c.exe', 'status': 'error', 'error': 'Unsupported file type'})
+        self.assertEqual((results['a.txt']['status'], results['a.txt']['chunks_created']), ('success', 5))
+        self.assertEqual((results['b.md']['status'], results['b.md']['chunks_created']), ('success', 8))
+        self.assertTrue(results['a-copy.txt']['deduplicated'])
+        self.assertEqual(results['a-copy.txt']['document_id'], results['a.txt']['document_id'])
+        self.assertEqual(body['timings']['files'], 2)
+
+        document = Document.objects.get(pk=results['b.md']['document_id'])
+        self.assertEqual((document.processing_status, document.document_type), ('completed', 'md'))
+        self.assertEqual(DocumentChunk.objects.filter(document=document).count(), 8)
+        self.assertEqual(Document.objects.count(), 2)
+
+    def test_manifest_batch(self):
+        for name, count in [('one.txt', 3), ('nested/two.txt', 6)]:
+            with open(os.path.join(self.import_root, name), 'w', encoding='utf-8') as f:
+                f.write(paragraphs_text(count))
+        self.write_file('outside.txt', paragraphs_text(2))
+        manifest = {'files': ['one.txt', 'nested/two.txt', 'missing.txt', '../outside.txt', 'nested/../../outside.txt']}
+
+        response = self.post_manifest(manifest)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['file'] for result in results], manifest['files'])
+        self.assertEqual([result['status'] for result in results], ['success', 'success', 'error', 'error', 'error'])
+        self.assertEqual([result.get('chunks_created') for result in results[:2]], [3, 6])
+        self.assertIn('File not found', results[2]['error'])
+        self.assertIn('outside the import root', results[3]['error'])
+        self.assertIn('outside the import root', results[4]['error'])
+        # Manifest files are ingested in place, not copied
+        self.assertEqual(Document.objects.get(pk=results[0]['document_id']).file_path,
+                         os.path.join(os.path.realpath(self.import_root), 'one.txt'))
+
+        again = self.post_manifest({'files': ['one.txt', 'nested/two.txt']}).json()['results']
+        self.assertEqual([result['deduplicated'] for result in again], [True, True])
+        self.assertEqual(Document.objects.count(), 2)
+
+    def test_bad_manifest(self):
+        for manifest in (['one.txt'], 'one.txt', 3, None, {'files': 'one.txt'}, {'files': ['one.txt', 2]}, {}):
+            with self.subTest(manifest=manifest):
+                response = self.post_manifest(manifest)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['status'], 'error')
+        response = self.client.post(self.url, 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.post_manifest({'files': []}).json()['message'], 'No files provided')
+
+    def test_process_batch_reports_each_file(self):
+        good = self.create_document(paragraphs_text(4), name='good.txt')
+        bad = Document.objects.create(title='bad', file_path=os.path.join(self.temp_dir, 'gone.txt'),
+                                      document_type='txt', file_size=0)
+        batch = DocumentProcessor().process_batch([(bad.pk, bad.file_path), (good.pk, good.file_path)])
+
+        self.assertEqual([result['document_id'] for result in batch['results']], [bad.pk, good.pk])
+        self.assertEqual([result['status'] for result in batch['results']], ['error', 'success'])
+        self.assertEqual(batch['timings']['chunks_created'], 4)
+        self.assertEqual(Document.objects.get(pk=bad.pk).processing_status, 'failed')
+        self.assertEqual(Document.objects.get(pk=good.pk).processing_status, 'completed')
+
+
+class ResumableUploadTests(TempDirMixin, TestCase):
+    """Parts must arrive in order with matching checksums; bad parts leave the offset where it was"""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(RESUMABLE_UPLOAD_DIR=os.path.join(self.temp_dir, 'parts'),
+                                              BASE_DIR=self.temp_dir, INGESTION_AUTOSTART_WORKERS=False,
+                                              EMBED_ON_INGEST=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.data = paragraphs_text(200).encode()
+        self.session = create_session('big.txt', len(self.data), sha256(self.data))
+
+    def append(self, start, length, checksum=None):
+        part = self.data[start:start + length]
+        return append_part(self.session, io.BytesIO(part), start, length, checksum or sha256(part))
+
+    def test_parse_content_range(self):
+        self.assertEqual(parse_content_range('bytes 0-99/1000'), (0, 100, 1000))
+        self.assertEqual(parse_content_range('bytes 100-100/*'), (100, 1, None))
+        for header in ('bytes 10-5/100', 'bytes=0-9/10', '0-9/10', 'bytes 0-/10'):
+            with self.subTest(header=header), self.assertRaises(UploadError) as raised:
+                parse_content_range(header)
+            self.assertEqual(raised.exception.status, 400)
+
+    def test_parts_assemble_the_file(self):
+        self.append(0, 1000)
+        self.append(1000, len(self.data) - 1000)
+        self.assertEqual(self.session.received_bytes, len(self.data))
+        self.assertEqual(self.session.parts_received, 2)
+
+        file_path, digest = finalize_session(self.session)
+        self.assertEqual(digest, sha256(self.data))
+        with open(file_path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(UploadSession.objects.get(pk=self.session.pk).status, 'completed')
+
+    def test_part_at_wrong_offset_reports_current_offset(self):
+        self.append(0, 1000)
+        for start in (0, 500, 2000):
+            with self.subTest(start=start), self.assertRaises(UploadError) as raised:
+                self.append(start, 100)
+            self.assertEqual(raised.exception.status, 409)
+            self.assertEqual(raised.exception.extra['offset'], 1000)
+
+    def test_checksum_mismatch_truncates_the_part(self):
+        self.append(0, 1000)
+        with self.assertRaises(UploadError) as raised:
+            self.append(1000, 1000, checksum=sha256(b'something else'))
+        self.assertEqual(raised.exception.status, 422)
+        self.assertEqual(raised.exception.extra['offset'], 1000)
+        self.assertEqual(UploadSession.objects.get(pk=self.session.pk).received_bytes, 1000)
+        self.assertEqual(os.path.getsize(self.session.temp_path), 1000)
+
+        self.append(1000, 1000)
+        self.assertEqual(self.session.received_bytes, 2000)
+
+    def test_short_and_oversized_parts(self):
+        with self.assertRaises(UploadError) as raised:
+            append_part(self.session, io.BytesIO(self.data[:10]), 0, 20, sha256(self.data[:20]))
+        self.assertEqual(raised.exception.status, 400)
+        self.assertEqual(os.path.getsize(self.session.temp_path), 0)
+
+        with self.assertRaises(UploadError) as raised:
+            self.append(0, len(self.data) + 1)
+        self.assertEqual(raised.exception.status, 416)
+
+    def test_finalize_checks_completeness_and_file_checksum(self):
+        self.append(0, 1000)
+        with self.assertRaises(UploadError) as raised:
+            finalize_session(self.session)
+        self.assertEqual(raised.exception.status, 409)
+        self.assertEqual(raised.exception.extra['offset'], 1000)
+
+        session = create_session('other.txt', 10, sha256(b'not these bytes'))
+        append_part(session, io.BytesIO(b'0123456789'), 0, 10, sha256(b'0123456789'))
+        with self.assertRaises(UploadError) as raised:
+            finalize_session(session)
+        self.assertEqual(raised.exception.status, 422)
+        session.refresh_from_db()
+        self.assertEqual(session.status, 'failed')
+        self.assertFalse(os.path.exists(session.temp_path))
+
+    def test_resume_through_the_api(self):
+        upload_url = reverse('documents:upload-session-detail', args=[self.session.upload_id])
+
+        def put(start, end):
+            part = self.data[start:end]
+            return self.client.put(upload_url, part, content_type='application/octet-stream', headers={
+                'Content-Range': f"bytes {start}-{end - 1}/{len(self.data)}",
+                'X-Part-SHA256': sha256(part),
+            })
+
+        self.assertEqual(put(0, 4096).status_code, 200)
+        response = put(8192, len(self.data))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4096)
+        self.assertEqual(self.client.get(upload_url).json()['upload']['received_bytes'], 4096)
+        self.assertEqual(put(4096, len(self.data)).status_code, 200)
+
+        response = self.client.post(reverse('documents:upload-session-complete', args=[self.session.upload_id]))
+        self.assertEqual(response.status_code, 202)
+        document = Document.objects.get(pk=response.json()['document_id'])
+        self.assertEqual(document.content_hash, sha256(self.data))
+        self.assertTrue(IngestionJob.objects.filter(document=document).exists())
+
+
+class CompressedTextTests(TestCase):
+    """Chunk text survives compression at rest unchanged"""
+
+    TEXT = 'Der Bär läuft über die Straße. ' * 40 + '\u2014 fin \U0001F4C4'
+
+    def test_frames_round_trip(self):
+        dictionary = (7, b'Der B\xc3\xa4r l\xc3\xa4uft \xc3\xbcber die Stra\xc3\x9fe.')
+        for codec, frame_dictionary in [('zlib', None), ('zlib', dictionary), ('none', None)]:
+            with self.subTest(codec=codec, dictionary=frame_dictionary is not None):
+                frame = compression.encode(self.TEXT, codec, dictionary=frame_dictionary)
+                self.assertEqual(compression.decode(frame, load_dictionary=lambda dict_id: dictionary[1]), self.TEXT)
+        self.assertEqual(compression.encode(self.TEXT, 'zlib')[0], compression.ZLIB)
+        self.assertEqual(compression.encode(self.TEXT, 'zlib', dictionary=dictionary)[0], compression.ZLIB_DICT)
+
+    def test_short_and_incompressible_text_is_stored_raw(self):
+        self.assertEqual(compression.encode('short', 'zlib', min_size=64), bytes([compression.RAW]) + b'short')
+        frame = compression.encode('abc', 'zlib')  # zlib's header and checksum outweigh any saving
+        self.assertEqual(frame, bytes([compression.RAW]) + b'abc')
+        self.assertEqual(compression.decode(compression.encode('', 'zlib')), '')
+
+    def test_model_round_trip(self):
+        document = Document.objects.create(title='doc', file_path='doc.txt', document_type='txt', file_size=0)
+        chunk = DocumentChunk.objects.create(document=document, chunk_index=0, chunk_text=self.TEXT)
+        DocumentChunk.objects.bulk_create([DocumentChunk(document=document, chunk_index=1, chunk_text='tiny')])
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT chunk_text FROM document_chunks WHERE id = %s', [chunk.pk])
+            stored = bytes(cursor.fetchone()[0])
+        self.assertLess(len(stored), len(self.TEXT.encode()))
+
+        loaded = DocumentChunk.objects.get(pk=chunk.pk)
+        self.assertEqual(loaded.chunk_text, self.TEXT)
+        self.assertEqual(DocumentChunk.objects.get(chunk_index=1).chunk_text, 'tiny')
+
+        frames = dict(DocumentChunk.objects.values_list('chunk_index', 'chunk_text'))
+        self.assertIsInstance(frames[0], CompressedText)
+        self.assertEqual({i: str(frame) for i, frame in frames.items()}, {0: self.TEXT, 1: 'tiny'})
+
+    def test_saving_unread_text_keeps_the_stored_frame(self):
+        document = Document.objects.create(title='doc', file_path='doc.txt', document_type='txt', file_size=0)
+        chunk = DocumentChunk.objects.create(document=document, chunk_index=0, chunk_text=self.TEXT)
+
+        loaded = DocumentChunk.objects.get(pk=chunk.pk)
+        loaded.page_number = 2
+        loaded.save()
+        self.assertEqual(DocumentChunk.objects.get(pk=chunk.pk).chunk_text, self.TEXT)
+
+        loaded.chunk_text = 'replaced'
+        loaded.save()
+        self.assertEqual(DocumentChunk.objects.get(pk=chunk.pk).chunk_text, 'replaced')
+
+
+class InvertedIndexTests(TestCase):
+    """Postings survive variable-byte encoding and storage"""
+
+    def test_varbyte_round_trip(self):
+        values = np.array([0, 1, 127, 128, 255, 16383, 16384, 2 ** 21, 2 ** 35 + 7, 2 ** 62], dtype=np.int64)
+        data, sizes = varbyte_encode(values)
+        self.assertEqual(sizes.tolist(), [1, 1, 1, 2, 2, 2, 3, 4, 6, 9])
+        self.assertEqual(len(data), sizes.sum())
+        self.assertEqual(varbyte_decode(data).tolist(), values.tolist())
+
+        self.assertEqual(varbyte_encode([300])[0], bytes([0b10101100, 0b00000010]))
+        self.assertEqual(varbyte_decode(varbyte_encode([])[0]).tolist(), [])
+
+        rng = np.random.default_rng(0)
+        values = rng.integers(0, 2 ** 40, size=5000) >> rng.integers(0, 40, size=5000)
+        self.assertEqual(varbyte_decode(varbyte_encode(values)[0]).tolist(), values.tolist())
+
+    def test_postings_lists_round_trip(self):
+        postings_lists = [
+            [(0, 1), (3, 2), (200, 1), (70000, 5)],
+            [],
+            [(5, 300)],
+            [(0, 1), (1, 1), (2, 1)],
+        ]
+        encoded = encode_postings_lists(postings_lists)
+        self.assertEqual(len(encoded), len(postings_lists))
+        for postings, data in zip(postings_lists, encoded):
+            indexes, frequencies = decode_postings(data)
+            self.assertEqual(list(zip(indexes.tolist(), frequencies.tolist())), postings)
+        self.assertEqual(encode_postings_lists([[], []]), [b'', b''])
+
+    def test_saved_index_loads_back(self):
+        document = Document.objects.create(title='doc', file_path='doc.txt', document_type='txt', file_size=0)
+        builder = IndexBuilder()
+        texts = {2: 'Apples and pears.', 0: 'Apples, apples, apples!', 1: 'No fruit here', 3: 'a b'}
+        for chunk_index, text in texts.items():  # Out of order on purpose
+            builder.add(chunk_index, text)
+        self.assertEqual(builder.save(document.pk), 5)  # apples, and, pears, fruit, here
+
+        postings, chunk_frequencies = load_postings(document.pk, ['apples', 'pears', 'missing'])
+        self.assertEqual(chunk_frequencies, {'apples': 2, 'pears': 1})
+        self.assertEqual(postings['apples'][0].tolist(), [0, 2])
+        self.assertEqual(postings['pears'][0].tolist(), [2])
+        self.assertTrue((postings['apples'][1] > 0).all())
+
+        document.refresh_from_db()
+        self.assertEqual(document.indexed_chunks, 3)  # The chunk without index terms is left out
+        self.assertEqual(document.average_chunk_length, 8 / 3)
+
+
+@override_settings(BM25_K1=1.2, BM25_B=0.75)
+class BM25Tests(TestCase):
+    """Precomputed weights and ranking agree with the textbook BM25 formula"""
+
+    CHUNKS = [
+        'The cat sat on the mat.',
+        'A dog chased the cat around the garden, and the cat ran up a tree.',
+        'Nothing relevant appears in this chunk at all, it is about weather.',
+        'Cat cat cat cat.',
+        'Dogs and cats: a long essay on pets, the cat, the dog and their owners and homes and gardens.',
+        'The mat was red.',
+    ]
+
+    def setUp(self):
+        self.document = Document.objects.create(title='doc', file_path='doc.txt', document_type='txt', file_size=0)
+        builder = IndexBuilder()
+        for chunk_index, text in enumerate(self.CHUNKS):
+            builder.add(chunk_index, text)
+        builder.save(self.document.pk)
+        self.terms = [extract_terms(text) for text in self.CHUNKS]
+
+    def reference_scores(self, query, k1=1.2, b=0.75):
+        average_length = sum(map(len, self.terms)) / len(self.terms)
+        scores = {}
+        for chunk_index, terms in enumerate(self.terms):
+            score = 0.0
+            for term in extract_terms(query):
+                frequency = terms.count(term)
+                if not frequency:
+                    continue
+                chunk_frequency = sum(term in other for other in self.terms)
+                term_idf = math.log(1 + (len(self.terms) - chunk_frequency + 0.5) / (chunk_frequency + 0.5))
+                norm = k1 * (1 - b + b * len(terms) / average_length)
+                score += term_idf * frequency * (k1 + 1) / (frequency + norm)
+            if score:
+                scores[chunk_index] = score
+        return scores
+
+    def rank(self, query, limit=None, allowed=None):
+        terms = extract_terms(query)
+        postings, _ = load_postings(self.document.pk, terms)
+        indexes, scores = rank_chunks(postings, terms, limit, allowed)
+        return list(zip(indexes.tolist(), scores.tolist()))
+
+    def test_weights_match_formula(self):
+        postings_lists = [[(0, 1), (1, 2), (3, 4)], [(1, 1)]]
+        lengths = {0: 6, 1: 14, 2: 10, 3: 4}
+        weights = [np.frombuffer(data, dtype='<f4') for data in bm25_weights(postings_lists, lengths, k1=1.5, b=0.5)]
+        average_length = sum(lengths.values()) / len(lengths)
+        for postings, term_weights in zip(postings_lists, weights):
+            term_idf = math.log(1 + (4 - len(postings) + 0.5) / (len(postings) + 0.5))
+            for (chunk_index, frequency), weight in zip(postings, term_weights):
+                norm = 1.5 * (1 - 0.5 + 0.5 * lengths[chunk_index] / average_length)
+                self.assertAlmostEqual(weight, term_idf * frequency * 2.5 / (frequency + norm), places=5)
+
+    def test_ranking_matches_reference_scores(self):
+        for query in ('cat', 'the cat on the mat', 'dog garden', 'cat cat mat', 'weather', 'unicorn'):
+            with self.subTest(query=query):
+                expected = sorted(self.reference_scores(query).items(), key=lambda item: (-item[1], item[0]))
+                ranked = self.rank(query)
+                self.assertEqual([i for i, _ in ranked], [i for i, _ in expected])
+                for (_, score), (_, expected_score) in zip(ranked, expected):
+                    self.assertAlmostEqual(score, expected_score, places=5)
+
+    def test_limit_and_allowed_chunks(self):
+        full = self.rank('cat mat')
+        self.assertEqual(self.rank('cat mat', limit=2), full[:2])
+        allowed = {1, 4, 5}
+        self.assertEqual(self.rank('cat mat', allowed=allowed), [entry for entry in full if entry[0] in allowed])
+
+    def test_ties_are_ordered_by_chunk_index(self):
+        postings = {'term': (np.array([4, 1, 7]), np.array([1.0, 1.0, 1.0], dtype='<f4'))}
+        indexes, _ = rank_chunks(postings, ['term'], limit=2)
+        self.assertEqual(indexes.tolist(), [1, 4])
+
+    def test_query_score_bound(self):
+        _, chunk_frequencies = load_postings(self.document.pk, ['cat', 'mat'])
+        bound = query_score_bound(['cat', 'mat'], chunk_frequencies, len(self.CHUNKS))
+        expected = sum(
+            math.log(1 + (len(self.CHUNKS) - frequency + 0.5) / (frequency + 0.5))
+            for frequency in (chunk_frequencies['cat'], chunk_frequencies['mat'])
+        )
+        self.assertAlmostEqual(bound, expected)
+        self.assertEqual(query_score_bound([], chunk_frequencies, len(self.CHUNKS)), 0.0)
+
+
+class RankFusionTests(SimpleTestCase):
+    """Reciprocal rank fusion orders by summed reciprocal ranks"""
+
+    def test_agreement_beats_a_single_first_place(self):
+        fused = reciprocal_rank_fusion([['a', 'b', 'c'], ['b', 'd', 'a']], k=60)
+        self.assertEqual([item for item, _ in fused], ['b', 'a', 'd', 'c'])
+        scores = dict(fused)
+        best = 2 / 61
+        self.assertAlmostEqual(scores['b'], (1 / 62 + 1 / 61) / best)
+        self.assertAlmostEqual(scores['a'], (1 / 61 + 1 / 63) / best)
+        self.assertAlmostEqual(scores['c'], (1 / 63) / best)
+
+    def test_first_in_every_ranking_scores_one(self):
+        fused = reciprocal_rank_fusion([['x', 'y'], ['x', 'z'], ['x']], k=60)
+        self.assertEqual(fused[0], ('x', 1.0))
+        self.assertTrue(all(0 < score < 1 for _, score in fused[1:]))
+
+    def test_ties_keep_first_appearance_and_limit_applies(self):
+        fused = reciprocal_rank_fusion([['a', 'b'], ['c', 'd']], k=10, limit=3)
+        self.assertEqual([item for item, _ in fused], ['a', 'c', 'b'])
+        self.assertEqual(reciprocal_rank_fusion([[], []]), [])
+
+    def test_small_k_favours_top_ranks(self):
+        rankings = [['a', 'b', 'c', 'd'], ['d', 'c', 'b', 'a']]
+        self.assertEqual([item for item, _ in reciprocal_rank_fusion(rankings, k=1)][:2], ['a', 'd'])
+
+    @override_settings(HYBRID_CANDIDATES=10)
+    def test_hybrid_ranking_orders_by_fusion_and_keeps_own_scores(self):
+        processor = DocumentProcessor()
+        lexical = [(3, 0.8), (1, 0.6), (7, 0.2)]
+        semantic = [(1, 0.97), (5, 0.91), (3, 0.4)]
+        with mock.patch.object(processor, '_lexical_ranking', return_value=lexical), \
+                mock.patch.object(processor, '_semantic_ranking', return_value=semantic):
+            ranking = processor._hybrid_ranking(1, 'question', 3, chunks=None)
+        self.assertEqual(ranking, [(1, 0.97), (3, 0.8), (5, 0.91)])
+
+        with mock.patch.object(processor, '_lexical_ranking', return_value=lexical), \
+                mock.patch.object(processor, '_semantic_ranking', return_value=None):
+            self.assertIsNone(processor._hybrid_ranking(1, 'question', 3, chunks=None))
+
+
+@override_settings(CHUNK_SIZE=15, CHUNK_OVERLAP=0, EMBED_ON_INGEST=False, INGESTION_AUTOSTART_WORKERS=False,
+                   ANSWER_CACHE_ENABLED=True, ASK_RETRIEVAL_MODE='lexical')
+class AnswerCacheTests(TempDirMixin, TestCase):
+    """Cached answers are served until what the document can answer changes"""
+
+    def setUp(self):
+        super().setUp()
+        caches['answers'].clear()
+        reset_stats()
+        self.addCleanup(caches['answers'].clear)
+        self.processor = DocumentProcessor()
+        self.document = self.create_document(paragraphs_text(10))
+        self.processor.process_document(self.document.pk, self.document.file_path)
+
+    def ask(self, question='What about topic4?', **kwargs):
+        return self.processor.ask_question(self.document.pk, question, **kwargs)
+
+    def test_repeated_question_is_cached(self):
+        first = self.ask()
+        self.assertFalse(first['cached'])
+        second = self.ask('  what ABOUT   topic4? ')
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['sources'], first['sources'])
+        self.assertEqual(second['answer'], first['answer'])
+
+    def test_key_includes_retrieval_parameters(self):
+        self.ask()
+        self.assertFalse(self.ask(num_chunks=5)['cached'])
+        self.assertFalse(self.ask(page_number=1)['cached'])
+        self.assertTrue(self.ask(num_chunks=5)['cached'])
+        self.assertNotEqual(cache_key(1, 0, 'question', 3, None, 'lexical'), cache_key(1, 0, 'question', 3, None, 'hybrid'))
+        self.assertNotEqual(cache_key(1, 0, 'question', 3, None, 'lexical'), cache_key(1, 1, 'question', 3, None, 'lexical'))
+
+    def test_incremental_update_invalidates(self):
+        self.ask()
+        self.assertTrue(self.ask()['cached'])
+        self.write_file('doc.txt', paragraphs_text(10, {4: 'Paragraph 4 now covers topic4 and zebras.'}))
+        self.processor.process_document(self.document.pk, self.document.file_path, incremental=True)
+
+        answer = self.ask()
+        self.assertFalse(answer['cached'])
+        self.assertIn('zebras', answer['sources'][0]['content'])
+
+    def test_reprocessing_and_bump_invalidate(self):
+        self.ask()
+        self.processor.process_document(self.document.pk, self.document.file_path)
+        self.assertFalse(self.ask()['cached'])
+        self.assertTrue(self.ask()['cached'])
+        bump_generation(self.document.pk)
+        self.assertFalse(self.ask()['cached'])
+
+    def test_replace_invalidates(self):
+        self.ask()
+        upload = SimpleUploadedFile('doc.txt', paragraphs_text(12).encode())
+        with override_settings(BASE_DIR=self.temp_dir):
+            response = self.client.post(reverse('documents:document-replace', args=[self.document.pk]), {'file': upload})
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(self.ask()['cached'])
+
+    def test_deleted_document_and_empty_answers_are_not_cached(self):
+        empty = self.create_document('', name='empty.txt')
+        for _ in range(2):
+            self.assertFalse(self.processor.ask_question(empty.pk, 'anything?')['cached'])
+
+        self.ask()
+        Document.objects.filter(pk=self.document.pk).delete()
+        self.assertFalse(self.ask()['cached'])
+
+    def test_stats_endpoint(self):
+        self.ask()
+        self.ask()
+        url = reverse('documents:answer-cache-stats')
+        stats = self.client.get(url).json()['cache']
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_rate']), (1, 1, 0.5))
+        self.assertEqual(stats, cache_stats())
+
+        self.assertEqual(self.client.post(url).status_code, 405)
+        stats = self.client.delete(url).json()['cache']
+        self.assertEqual((stats['hits'], stats['misses']), (0, 0))
+
+
+class HNSWIndexTests(TempDirMixin, TestCase):
+    """The HNSW graph finds the exact neighbours most of the time and never returns removed vectors"""
+
+    def setUp(self):
+        super().setUp()
+        self.vectors = unit_vectors(1500)
+        self.ids = [f"e{i}" for i in range(len(self.vectors))]
+        self.index = HNSWIndex(32, m=8, ef_construction=64, ef_search=32)
+        self.index.add_many(self.ids, [i % 15 for i in range(len(self.ids))], self.vectors)
+
+    def exact(self, query, limit, excluded=()):
+        order = np.argsort(-(self.vectors @ query), kind='stable')
+        return [self.ids[i] for i in order if self.ids[i] not in excluded][:limit]
+
+    def test_recall_against_exact_search(self):
+        queries = unit_vectors(50, seed=1)
+        found = sum(
+            len({e for e, _ in self.index.search(query, 10, ef=64)} & set(self.exact(query, 10))) for query in queries
+        )
+        self.assertGreaterEqual(found / (10 * len(queries)), 0.9)
+
+    def test_search_returns_similarities_best_first(self):
+        matches = self.index.search(self.vectors[7], 5)
+        self.assertEqual(matches[0][0], 'e7')
+        self.assertAlmostEqual(matches[0][1], 1.0, places=5)
+        similarities = [similarity for _, similarity in matches]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+        for embedding_id, similarity in matches:
+            self.assertAlmostEqual(similarity, float(self.vectors[int(embedding_id[1:])] @ self.vectors[7]), places=5)
+
+    def test_removed_vectors_are_never_returned(self):
+        query = self.vectors[0]
+        nearest = self.exact(query, 200)
+        self.index.remove(nearest)
+        self.assertEqual(len(self.index), len(self.ids) - 200)
+
+        matches = self.index.search(query, 10)
+        self.assertEqual(len(matches), 10)
+        self.assertFalse({e for e, _ in matches} & set(nearest))
+        self.assertGreaterEqual(len({e for e, _ in matches} & set(self.exact(query, 10, nearest))), 8)
+
+    def test_remove_document_and_replace(self):
+        self.index.remove_document(3)
+        matches = self.index.search(self.vectors[3], 20)
+        self.assertNotIn('e3', {e for e, _ in matches})
+        self.assertEqual(len(matches), 20)
+
+        self.index.add('e3', 3, self.vectors[3])
+        self.index.add('e4', 4, self.vectors[3])  # Same id again replaces the old vector
+        self.assertEqual(self.index.node_count, len(self.ids) + 2)
+        self.assertEqual({e for e, _ in self.index.search(self.vectors[3], 2)}, {'e3', 'e4'})
+        self.assertNotIn('e4', {e for e, _ in self.index.search(self.vectors[4], 1)})
+
+    def test_search_of_small_or_empty_index(self):
+        self.assertEqual(HNSWIndex(32).search(self.vectors[0], 5), [])
+        index = HNSWIndex(32, m=4)
+        index.add_many(['a', 'b', 'c'], [1, 1, 1], self.vectors[:3])
+        index.remove(['a', 'b'])
+        self.assertEqual([e for e, _ in index.search(self.vectors[0], 5)], ['c'])
+
+    def test_save_and_load(self):
+        self.index.remove(['e1', 'e2'])
+        self.index.remove_document(5)
+        path = os.path.join(self.temp_dir, 'index')
+        self.index.save(path)
+        self.index.save(path)  # Replaces the previous copy
+        self.assertFalse(self.index.dirty)
+
+        loaded = HNSWIndex.load(path, ef_search=32)
+        self.assertEqual((len(loaded), loaded.node_count), (len(self.index), self.index.node_count))
+        for query in unit_vectors(20, seed=2):
+            self.assertEqual(loaded.search(query, 10), self.index.search(query, 10))
+        self.assertNotIn('e1', {e for e, _ in loaded.search(self.vectors[1], 10)})
+
+        loaded.add('new', 99, self.vectors[1])
+        self.assertEqual(loaded.search(self.vectors[1], 1)[0][0], 'new')
+
+    def test_sync_inserts_embedded_and_drops_deleted_documents(self):
+        documents = [Document.objects.create(title=f"doc{i}", file_path='doc.txt', document_type='txt', file_size=0,
+                                             embedding_model='test', embedded_at=timezone.now()) for i in range(2)]
+        vectors = unit_vectors(6, seed=3)
+        stored = {documents[0].pk: (['a0', 'a1', 'a2'], vectors[:3]), documents[1].pk: (['b0', 'b1', 'b2'], vectors[3:])}
+        store = mock.Mock(get_document_vectors=lambda document_id: stored[document_id])
+
+        index = HNSWIndex(32, m=4)
+        index.sync(store)
+        self.assertEqual(len(index), 6)
+        self.assertEqual(index.search(vectors[4], 1)[0][0], 'b1')
+
+        index.sync(store)  # Nothing changed since the last sync
+        self.assertEqual(index.node_count, 6)
+
+        documents[1].delete()  # As if by another process
+        index.sync(store)
+        self.assertEqual(len(index), 3)
+        self.assertEqual({e for e, _ in index.search(vectors[4], 6)}, {'a0', 'a1', 'a2'})
+
+
+@override_settings(VECTOR_STORE_SEARCH_BLOCK=128)
+class NumpyVectorStoreTests(TempDirMixin, SimpleTestCase):
+    """Searches match a brute-force cosine over the stored float16 vectors"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.temp_dir, 'store')
+        self.store = NumpyVectorStore(self.path, shard_rows=300)
+        self.vectors = unit_vectors(1000)
+        self.ids = [f"e{i}" for i in range(len(self.vectors))]
+        self.documents = [i // 50 for i in range(len(self.vectors))]  # 20 documents of 50 rows
+        self.pages = [i % 3 + 1 for i in range(len(self.vectors))]
+        metadatas = [{'document_id': d, 'chunk_index': i % 50, 'page_number': p}
+                     for i, (d, p) in enumerate(zip(self.documents, self.pages))]
+        for start in range(0, len(self.ids), 400):  # Several appends spanning shard boundaries
+            self.store.upsert(self.ids[start:start + 400], self.vectors[start:start + 400], metadatas[start:start + 400])
+
+    def brute_force(self, query, limit, deleted=(), documents=None, page=None):
+        scores = self.vectors.astype(np.float16).astype(np.float32) @ query
+        rows = [
+            i for i in np.argsort(-scores, kind='stable').tolist()
+            if self.ids[i] not in deleted
+            and (documents is None or self.documents[i] in documents)
+            and (page is None or self.pages[i] == page)
+        ]
+        return [(self.ids[i], float(scores[i])) for i in rows[:limit]]
+
+    def assertMatches(self, matches, expected):
+        self.assertEqual([e for e, _ in matches], [e for e, _ in expected])
+        for (_, score), (_, expected_score) in zip(matches, expected):
+            self.assertAlmostEqual(score, expected_score, places=5)
+
+    def test_search_matches_brute_force(self):
+        self.assertEqual(len(self.store.shards), 4)
+        for query in unit_vectors(10, seed=1):
+            self.assertMatches(self.store.search(query, 15), self.brute_force(query, 15))
+            self.assertMatches(self.store.search(query, 5, document_id=7), self.brute_force(query, 5, documents={7}))
+            self.assertMatches(self.store.search(query, 8, document_ids=[2, 5, 19]),
+                               self.brute_force(query, 8, documents={2, 5, 19}))
+            self.assertMatches(self.store.search(query, 5, document_id=11, page_number=2),
+                               self.brute_force(query, 5, documents={11}, page=2))
+        self.assertEqual(len(self.store.search(self.vectors[0], 5000)), 1000)
+
+    def test_deleted_vectors_are_excluded(self):
+        query = self.vectors[123]
+        deleted = {e for e, _ in self.brute_force(query, 20)}
+        self.store.delete(list(deleted))
+        self.store.delete_document(4)
+        deleted |= {self.ids[i] for i in range(200, 250)}
+        self.assertEqual(len(self.store), 1000 - len(deleted))
+        self.assertMatches(self.store.search(query, 20), self.brute_force(query, 20, deleted))
+        self.assertEqual(self.store.search(query, 5, document_id=4), [])
+        ids, vectors = self.store.get_document_vectors(4)
+        self.assertEqual((ids, vectors.shape), ([], (0, 32)))
+
+    def test_upsert_replaces_vector_and_metadata_updates(self):
+        replacement = unit_vectors(1, seed=5)
+        self.store.upsert(['e10'], replacement, [{'document_id': 0, 'chunk_index': 10, 'page_number': 9}])
+        self.assertEqual(len(self.store), 1000)
+        self.assertEqual(self.store.search(replacement[0], 1)[0][0], 'e10')
+        self.assertNotEqual(self.store.search(self.vectors[10], 1)[0][0], 'e10')
+        self.assertEqual([e for e, _ in self.store.search(replacement[0], 5, document_id=0, page_number=9)], ['e10'])
+
+        self.store.update_metadata(['e11'], [{'document_id': 0, 'chunk_index': 11, 'page_number': 9}])
+        self.assertEqual({e for e, _ in self.store.search(replacement[0], 5, document_id=0, page_number=9)}, {'e10', 'e11'})
+
+    def test_compact_preserves_results(self):
+        self.store.delete(self.ids[::3])
+        self.store.delete_document(10)
+        queries = unit_vectors(10, seed=2)
+        before = [self.store.search(query, 10) for query in queries]
+        by_document = [self.store.search(query, 5, document_id=3) for query in queries]
+        live = len(self.store)
+
+        self.assertEqual(self.store.compact(), {'rows_before': 1000, 'rows_after': live})
+        self.assertEqual(self.store.generation, 1)
+        self.assertEqual(len(self.store), live)
+        self.assertEqual(sum(shard.rows for shard in self.store.shards), live)
+        self.assertEqual([self.store.search(query, 10) for query in queries], before)
+        self.assertEqual([self.store.search(query, 5, document_id=3) for query in queries], by_document)
+        self.assertEqual(self.store.get_document_vectors(3)[0], [self.ids[i] for i in range(150, 200) if i % 3])
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'g0')))
+
+    def test_compact_empty_store(self):
+        store = NumpyVectorStore(os.path.join(self.temp_dir, 'empty'))
+        self.assertEqual(store.compact(), {'rows_before': 0, 'rows_after': 0})
+        self.assertEqual(store.search(self.vectors[0], 5), [])
+
+        self.store.delete(self.ids)
+        self.assertEqual(self.store.compact(), {'rows_before': 1000, 'rows_after': 0})
+        self.assertEqual(self.store.search(self.vectors[0], 5), [])
+
+    def test_reopen_and_share_between_instances(self):
+        queries = unit_vectors(5, seed=3)
+        self.store.delete(['e0', 'e1'])
+        reopened = NumpyVectorStore(self.path, shard_rows=300)
+        self.assertEqual(len(reopened), 998)
+        for query in queries:
+            self.assertEqual(reopened.search(query, 10), self.store.search(query, 10))
+
+        # Writes by one instance (as by another process) show up in the other
+        extra = unit_vectors(1, seed=4)
+        reopened.upsert(['extra'], extra, [{'document_id': 50}])
+        self.assertEqual(self.store.search(extra[0], 1)[0][0], 'extra')
+        self.store.compact()
+        self.assertEqual(reopened.search(extra[0], 1)[0][0], 'extra')
+        self.assertEqual(len(reopened), 999)
+
+
+class CountingEncoder(HashingEncoder):
+    """Hashing encoder that records the texts it is asked to encode"""
+
+    def __init__(self, dimension: int = 32):
+        super().__init__(dimension)
+        self.encoded = []
+
+    def encode(self, texts):
+        self.encoded.extend(texts)
+        return super().encode(texts)
+
+
+class EmbeddingCacheTests(TempDirMixin, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache = EmbeddingCache(os.path.join(self.temp_dir, 'cache', 'embeddings.sqlite3'))
+        self.vectors = unit_vectors(3)
+        self.hashes = [sha256(f"text {i}".encode()) for i in range(3)]
+
+    def test_hits_and_misses_by_content_hash(self):
+        self.assertEqual(self.cache.get_many('hashing-32', 32, self.hashes), {})
+        self.cache.set_many('hashing-32', self.hashes[:2], self.vectors[:2])
+
+        found = self.cache.get_many('hashing-32', 32, self.hashes)
+        self.assertEqual(set(found), set(self.hashes[:2]))
+        np.testing.assert_array_equal(found[self.hashes[1]], self.vectors[1])
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (2, 4, {'hashing-32': 2}))
+
+    def test_other_encoder_does_not_reuse_entries(self):
+        self.cache.set_many('hashing-32', self.hashes, self.vectors)
+        self.assertEqual(self.cache.get_many('other-model', 32, self.hashes), {})
+        # An entry of the wrong size is a miss even under the same name
+        self.assertEqual(self.cache.get_many('hashing-32', 64, self.hashes), {})
+
+        self.cache.set_many('other-model', self.hashes[:1], unit_vectors(1, seed=1))
+        self.assertEqual(self.cache.stats()['entries'], {'hashing-32': 3, 'other-model': 1})
+        np.testing.assert_array_equal(self.cache.get_many('hashing-32', 32, self.hashes[:1])[self.hashes[0]], self.vectors[0])
+
+    def test_encode_chunks_skips_encoder_on_warm_cache(self):
+        encoder = CountingEncoder()
+        texts = ['alpha beta', 'gamma delta', 'alpha beta', 'epsilon']
+        with mock.patch('documents.embeddings.get_encoder', return_value=encoder), \
+                mock.patch('documents.embeddings.get_embedding_cache', return_value=self.cache):
+            cold = encode_chunks(texts)
+            self.assertEqual(encoder.encoded, ['alpha beta', 'gamma delta', 'epsilon'])  # Each distinct text once
+
+            encoder.encoded.clear()
+            warm = encode_chunks(texts)
+            self.assertEqual(encoder.encoded, [])
+            np.testing.assert_array_equal(warm, cold)
+            np.testing.assert_allclose(warm, HashingEncoder(32).encode(texts))
+
+            encode_chunks(['epsilon', 'zeta'])
+            self.assertEqual(encoder.encoded, ['zeta'])
+
+        other = CountingEncoder(64)
+        with mock.patch('documents.embeddings.get_encoder', return_value=other), \
+                mock.patch('documents.embeddings.get_embedding_cache', return_value=self.cache):
+            self.assertEqual(encode_chunks(texts).shape, (4, 64))
+            self.assertEqual(other.encoded, ['alpha beta', 'gamma delta', 'epsilon'])
+
+
+class SentenceSpanTests(SimpleTestCase):
+    def sentences(self, text, start=0, end=None):
+        spans = list(sentence_spans(text, start, end))
+        for span_start, span_end in spans:
+            sentence = text[span_start:span_end]
+            self.assertEqual(sentence, sentence.strip())
+        return [text[span_start:span_end] for span_start, span_end in spans]
+
+    def test_abbreviations_do_not_end_sentences(self):
+        self.assertEqual(self.sentences('Dr. Smith arrived at noon. He left.'), ['Dr. Smith arrived at noon.', 'He left.'])
+        self.assertEqual(self.sentences('Bring tools, e.g. Hammers and saws. Then stop.'),
+                         ['Bring tools, e.g. Hammers and saws.', 'Then stop.'])
+        self.assertEqual(self.sentences('The U.S. Economy grew. Rates fell.'), ['The U.S. Economy grew.', 'Rates fell.'])
+        self.assertEqual(self.sentences('J. R. R. Tolkien wrote it. Mr. And Mrs. Baggins read it.'),
+                         ['J. R. R. Tolkien wrote it.', 'Mr. And Mrs. Baggins read it.'])
+        self.assertEqual(self.sentences('See Fig. 3 for details. It shows the trend.'),
+                         ['See Fig. 3 for details.', 'It shows the trend.'])
+
+    def test_decimals_and_lowercase_continuations(self):
+        self.assertEqual(self.sentences('Pi is 3.14 roughly. It costs 2.50 dollars.'), ['Pi is 3.14 roughly.', 'It costs 2.50 dollars.'])
+        self.assertEqual(self.sentences('Version 1.2.3 shipped. see the notes. Done'), ['Version 1.2.3 shipped. see the notes.', 'Done'])
+        self.assertEqual(self.sentences('It grew by 4. 5 teams joined.'), ['It grew by 4.', '5 teams joined.'])
+
+    def test_ellipses_and_closing_quotes(self):
+        self.assertEqual(self.sentences('Wait... What now? Fine!'), ['Wait...', 'What now?', 'Fine!'])
+        self.assertEqual(self.sentences('Wait… Then go.'), ['Wait…', 'Then go.'])
+        self.assertEqual(self.sentences('He said "Stop." Then he left.'), ['He said "Stop."', 'Then he left.'])
+        self.assertEqual(self.sentences('She wrote “Done.” “Good,” he said.'),
+                         ['She wrote “Done.”', '“Good,” he said.'])
+        self.assertEqual(self.sentences('It ended (mostly.) Next came more.'), ['It ended (mostly.)', 'Next came more.'])
+
+    def test_blank_lines_and_cjk(self):
+        self.assertEqual(self.sentences('A heading\n\n  body text here. More'), ['A heading', 'body text here.', 'More'])
+        self.assertEqual(self.sentences('第一句。第二句！完'),
+                         ['第一句。', '第二句！', '完'])
+        self.assertEqual(self.sentences('   \n\t '), [])
+
+    def test_spans_map_back_to_source(self):
+        text = '  Intro. Dr. Who said "Run." Then 3.5 seconds passed...  \n\n Finally it ended.  '
+        spans = list(sentence_spans(text))
+        self.assertEqual([text[start:end] for start, end in spans],
+                         ['Intro.', 'Dr. Who said "Run."', 'Then 3.5 seconds passed...', 'Finally it ended.'])
+        self.assertEqual(spans[0], (2, 8))
+        self.assertTrue(all(a_end <= b_start for (_, a_end), (b_start, _) in zip(spans, spans[1:])))
+
+        # Offsets stay relative to the whole text when scanning a slice of it
+        start = text.index('Dr.')
+        end = text.index('Finally')
+        self.assertEqual(list(sentence_spans(text, start, end)), spans[1:3])
+
+
+class PipelineTests(SimpleTestCase):
+    def run_pipeline(self, pipeline, source, sink, timeout=10):
+        """Run the pipeline in a thread so a deadlock fails the test instead of hanging it"""
+        outcome = {}
+
+        def target():
+            try:
+                outcome['result'] = pipeline.run(source, sink)
+            except BaseException as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        thread.join(timeout)
+        self.assertFalse(thread.is_alive(), 'pipeline deadlocked')
+        self.assertFalse(any(t.name.startswith('pipeline-') for t in threading.enumerate()))
+        return outcome
+
+    def test_order_preserved_into_sink(self):
+        def jitter(batch):
+            time.sleep(random.random() * 0.002)
+            return [item * 2 for item in batch]
+
+        def regroup(batches):
+            return batched((item for batch in batches for item in batch), 7)
+
+        pipeline = Pipeline([
+            Stage('source', lambda batch: batch),
+            Stage('double', jitter, workers=4),
+            Stage('regroup', regroup, ordered=True),
+            Stage('increment', lambda batch: [item + 1 for item in batch], workers=3),
+        ], queue_size=2)
+        source = batched(range(500), 5)
+        outcome = self.run_pipeline(pipeline, source, lambda batches: [item for batch in batches for item in batch])
+        self.assertEqual(outcome['result'], [2 * item + 1 for item in range(500)])
+        timings = pipeline.timings()
+        self.assertEqual(timings['stages']['double']['items'], 500)
+        self.assertEqual(timings['stages']['persist']['batches'], math.ceil(500 / 7))
+
+    def test_stage_error_propagates_without_deadlock(self):
+        def fail(batch):
+            if batch[0] >= 30:
+                raise ValueError('bad batch')
+            return batch
+
+        # An endless source and a slow sink keep every other thread blocked on a queue when the stage fails
+        def slow_sink(batches):
+            for _ in batches:
+                time.sleep(0.01)
+
+        pipeline = Pipeline([
+            Stage('source', lambda batch: batch),
+            Stage('fail', fail, workers=2),
+            Stage('after', lambda batch: batch, workers=2),
+        ], queue_size=1)
+        outcome = self.run_pipeline(pipeline, batched(itertools.count(), 3), slow_sink)
+        self.assertIsInstance(outcome.get('error'), ValueError)
+
+        # Errors raised by the source and by the sink reach the caller as well
+        def broken_source():
+            yield [1]
+            raise KeyError('source')
+
+        outcome = self.run_pipeline(Pipeline([Stage('source', lambda batch: batch)], queue_size=1),
+                                    broken_source(), lambda batches: list(batches))
+        self.assertIsInstance(outcome.get('error'), KeyError)
+
+        def broken_sink(batches):
+            next(batches)
+            raise RuntimeError('sink')
+
+        outcome = self.run_pipeline(Pipeline([Stage('source', lambda batch: batch)], queue_size=1),
+                                    batched(itertools.count(), 3), broken_sink)
+        self.assertIsInstance(outcome.get('error'), RuntimeError)
+
+    def test_bounded_queues_apply_backpressure(self):
+        produced = []
+
+        def source():
+            for n in range(1000):
+                produced.append(n)
+                yield [n]
+
+        seen = []
+
+        def slow_sink(batches):
+            for batch in batches:
+                seen.append(batch[0])
+                time.sleep(0.05)
+                # Two channels of two batches, one batch held by each worker and one being read from the source
+                self.assertLessEqual(len(produced) - len(seen), 2 * 2 + 2 + 1)
+                if len(seen) == 5:
+                    return 'stopped early'
+
+        pipeline = Pipeline([Stage('source', lambda batch: batch), Stage('copy', list)], queue_size=2)
+        outcome = self.run_pipeline(pipeline, source(), slow_sink)
+        self.assertEqual(outcome, {'result': 'stopped early'})
+        self.assertEqual(seen, [0, 1, 2, 3, 4])
+        self.assertLess(len(produced), 20)
+        self.assertGreater(pipeline.timings()['stages']['source']['blocked_time'], 0.1)
+
+
+WORDS = (
+    'river stone quiet market letter garden window engine silver paper winter orange harbor signal '
+    'forest copper ladder candle mirror basket planet thunder meadow pocket violin canvas anchor '
+    'lantern marble saddle feather cotton glacier island jacket kettle lemon magnet needle oyster '
+    'pepper quilt rocket shadow tunnel umbrella velvet wagon yarn zebra bridge castle dragon falcon'
+).split()
+
+
+def prose(count, seed):
+    """``count`` paragraphs of random words, sharing almost no word triples with other seeds"""
+    rng = random.Random(seed)
+    return '\n\n'.join(' '.join(rng.choice(WORDS) for _ in range(12)) + '.' for _ in range(count))
+
+
+@override_settings(CHUNK_SIZE=15, CHUNK_OVERLAP=0, EMBED_ON_INGEST=False, INGESTION_AUTOSTART_WORKERS=False)
+class NearDuplicateTests(TempDirMixin, TestCase):
+    """Documents are compared by the union of their chunk signatures"""
+
+    def process(self, text, name):
+        document = self.create_document(text, name)
+        DocumentProcessor().process_document(document.pk, document.file_path)
+        document.refresh_from_db()
+        return document
+
+    def test_near_identical_documents_reported(self):
+        text = prose(30, seed=1)
+        original = self.process(text, 'original.txt')
+        paragraphs = text.split('\n\n')
+        paragraphs[10] = 'A single paragraph was rewritten for the second revision.'
+        revision = self.process('\n\n'.join(paragraphs), 'revision.txt')
+        unrelated = self.process(prose(30, seed=2), 'unrelated.txt')
+        self.assertIsNotNone(original.minhash)
+
+        matches = job_near_duplicates(original.pk)
+        self.assertEqual([match['document_id'] for match in matches], [revision.pk])
+        self.assertGreater(matches[0]['similarity'], 0.8)
+        self.assertEqual(job_near_duplicates(unrelated.pk), [])
+
+        response = self.client.get(reverse('documents:document-near-duplicates', args=[revision.pk]))
+        self.assertEqual([match['document_id'] for match in response.json()['near_duplicates']], [original.pk])
+
+        # A file is looked up without being ingested
+        upload = SimpleUploadedFile('copy.txt', prose(30, seed=2).encode())
+        response = self.client.post(reverse('documents:near-duplicate-lookup'), {'file': upload})
+        self.assertEqual(response.json()['near_duplicates'],
+                         [{'document_id': unrelated.pk, 'title': 'unrelated.txt', 'similarity': 1.0}])
+        self.assertEqual(Document.objects.count(), 3)
+
+    def test_upload_reports_near_duplicates_through_job_status(self):
+        original = self.process(prose(30, seed=3), 'original.txt')
+        upload = SimpleUploadedFile('copy.txt', prose(30, seed=3).encode() + b'\n\nOne extra closing paragraph.')
+        with override_settings(BASE_DIR=self.temp_dir):
+            response = self.client.post(reverse('documents:document-upload'), {'file': upload})
+        self.assertEqual(response.status_code, 202)
+        self.assertNotIn('near_duplicates', response.json())
+
+        status_url = response.json()['job_status_url']
+        self.assertIsNone(self.client.get(status_url).json()['job']['near_duplicates'])
+        run_job(claim_next_job('worker'), DocumentProcessor())
+        near = self.client.get(status_url).json()['job']['near_duplicates']
+        self.assertEqual([match['document_id'] for match in near], [original.pk])
+
+    def test_index_merges_and_removes(self):
+        texts = [prose(10, seed=seed) for seed in range(5)]
+        signatures = [signature(text) for text in texts]
+        index = DocumentIndex(merge_size=3)
+        index.add_many(enumerate(signatures[:3]))  # Merged into the sorted arrays
+        index.add(3, signatures[3])  # Pending
+        for document_id in range(4):
+            self.assertEqual(index.lookup(signatures[document_id]), [(document_id, 1.0)])
+        self.assertEqual(index.lookup(signatures[4]), [])
+        self.assertEqual(index.lookup(signatures[0], exclude=0), [])
+
+        index.add(0, signatures[4])  # Replacing a merged document hides its old row
+        index.remove(3)
+        self.assertEqual(index.lookup(signatures[0]), [])
+        self.assertEqual(index.lookup(signatures[3]), [])
+        self.assertEqual(index.lookup(signatures[4]), [(0, 1.0)])
+        self.assertEqual(len(index), 3)
+
+
+@override_settings(CHUNK_SIZE=15, CHUNK_OVERLAP=0, EMBED_ON_INGEST=False, INGESTION_AUTOSTART_WORKERS=False,
+                   ANSWER_CACHE_ENABLED=False)
+class BoilerplateTests(TempDirMixin, TestCase):
+    """Chunks repeated across documents are stored once and never retrieved"""
+
+    DISCLAIMER = 'Confidential notice: this report is provided for information only and carries no warranty.'
+
+    def setUp(self):
+        super().setUp()
+        self.use_temp_vector_store()
+
+    def process(self, text, name):
+        document = self.create_document(text, name)
+        DocumentProcessor().process_document(document.pk, document.file_path)
+        return document
+
+    def test_repeated_chunks_become_boilerplate(self):
+        documents = [self.process(f"{prose(3, seed)}\n\n{self.DISCLAIMER}", f"report{seed}.txt") for seed in range(3)]
+        unique = self.process(prose(3, seed=10), 'unique.txt')
+        processor = DocumentProcessor()
+        answer = processor.ask_question(documents[0].pk, 'confidential notice warranty', mode='lexical')
+        self.assertIn('Confidential notice', answer['sources'][0]['content'])
+
+        stats = detect_boilerplate(min_documents=3)
+        self.assertEqual((stats['boilerplate_created'], stats['chunks_linked']), (1, 3))
+        linked = DocumentChunk.objects.filter(boilerplate__isnull=False)
+        self.assertEqual(sorted(linked.values_list('document_id', flat=True)), [document.pk for document in documents])
+        self.assertEqual({str(chunk.chunk_text) for chunk in linked}, {''})
+        self.assertFalse(DocumentChunk.objects.filter(document=unique, boilerplate__isnull=False).exists())
+
+        for document in documents:
+            answer = processor.ask_question(document.pk, 'confidential notice warranty', mode='lexical')
+            self.assertFalse(any('Confidential' in source['content'] for source in answer['sources']))
+            self.assertEqual(processor.get_document_stats(document.pk)['boilerplate_chunks'], 1)
+
+        # Documents ingested later link the known boilerplate instead of storing it again
+        later = self.process(f"{prose(3, seed=20)}\n\n{self.DISCLAIMER}", 'later.txt')
+        chunk = DocumentChunk.objects.get(document=later, boilerplate__isnull=False)
+        self.assertEqual(str(chunk.chunk_text), '')
+        answer = processor.ask_question(later.pk, 'confidential notice warranty', mode='lexical')
+        self.assertFalse(any('Confidential' in source['content'] for source in answer['sources']))
+
+    def test_chunks_in_too_few_documents_are_kept(self):
+        for seed in range(2):
+            self.process(f"{prose(3, seed)}\n\n{self.DISCLAIMER}", f"report{seed}.txt")
+        self.assertEqual(detect_boilerplate(min_documents=3)['boilerplate_created'], 0)
+        self.assertFalse(DocumentChunk.objects.filter(boilerplate__isnull=False).exists())
+
+
+@override_settings(CHUNK_SIZE=15, CHUNK_OVERLAP=0, EMBED_ON_INGEST=False, INGESTION_AUTOSTART_WORKERS=False,
+                   EMBEDDING_ENCODER='hashing', EMBEDDING_CACHE_ENABLED=False)
+class SearchViewTests(TempDirMixin, TestCase):
+    """/api/search/ finds chunks across documents by embedding"""
+
+    def setUp(self):
+        super().setUp()
+        self.use_temp_vector_store()
+        for cached in (get_encoder, get_embedding_cache):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+        self.url = reverse('documents:search')
+
+    def search(self, data):
+        return self.client.post(self.url, data, content_type='application/json')
+
+    def embedded_document(self, text, name):
+        document = self.create_document(text, name)
+        DocumentProcessor().process_document(document.pk, document.file_path)
+        embed_stored_document(document.pk)
+        return document
+
+    def test_unavailable_without_vector_store(self):
+        with mock.patch('documents.embeddings.get_store', return_value=None):
+            response = self.search({'query': 'anything'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'error')
+
+    def test_parameters_validated(self):
+        self.assertEqual(self.client.post(self.url, 'not json', content_type='application/json').status_code, 400)
+        for data, field in [
+            ({}, 'query'),
+            ({'query': ''}, 'query'),
+            ({'query': 'x' * 1001}, 'query'),
+            ({'query': 'river', 'limit': 0}, 'limit'),
+            ({'query': 'river', 'limit': 51}, 'limit'),
+            ({'query': 'river', 'document_ids': []}, 'document_ids'),
+            ({'query': 'river', 'document_ids': [0]}, 'document_ids'),
+            ({'query': 'river', 'document_ids': 'all'}, 'document_ids'),
+        ]:
+            with self.subTest(data=data):
+                response = self.search(data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.json()['errors'])
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_results_carry_chunk_and_document_metadata(self):
+        first = self.embedded_document(prose(8, seed=4), 'first.txt')
+        second_text = prose(8, seed=5)
+        second = self.embedded_document(second_text, 'second.txt')
+        query = second_text.split('\n\n')[5]
+
+        response = self.search({'query': query, 'limit': 3})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body['status'], body['query']), ('success', query))
+        self.assertEqual(len(body['results']), 3)
+        best = body['results'][0]
+        self.assertEqual({name: best[name] for name in ('document_id', 'document_title', 'chunk_id', 'page_number', 'content')},
+                         {'document_id': second.pk, 'document_title': 'second.txt', 'chunk_id': 5,
+                          'page_number': 1, 'content': query})
+        self.assertAlmostEqual(best['similarity'], 1.0, places=2)
+        similarities = [result['similarity'] for result in body['results']]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+
+        results = self.search({'query': query, 'document_ids': [first.pk]}).json()['results']
+        self.assertEqual(len(results), 8)
+        self.assertEqual({result['document_id'] for result in results}, {first.pk})
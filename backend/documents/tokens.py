@@ -0,0 +1,55 @@
+# documents/tokens.py
+"""Token counting for chunk sizing.
+
+Uses the tiktoken encoding named by TOKENIZER_ENCODING. When the encoding cannot
+be loaded (tiktoken downloads its BPE ranks on first use, which fails offline)
+a regex word/punctuation tokenizer is used instead so ingestion keeps working.
+"""
+import re
+from functools import lru_cache
+from typing import List
+
+from django.conf import settings
+
+FALLBACK_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class RegexTokenizer:
+    """Approximate tokenizer: one token per word or punctuation character"""
+
+    name = 'regex'
+
+    def count(self, text: str) -> int:
+        return len(FALLBACK_TOKEN_RE.findall(text))
+
+    def token_starts(self, text: str) -> List[int]:
+        return [match.start() for match in FALLBACK_TOKEN_RE.finditer(text)]
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.name = encoding.name
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode_ordinary(text))
+
+    def token_starts(self, text: str) -> List[int]:
+        """Character offset at which each token of ``text`` starts"""
+        _, offsets = self.encoding.decode_with_offsets(self.encoding.encode_ordinary(text))
+        return offsets
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer():
+    try:
+        import tiktoken
+
+        return TiktokenTokenizer(tiktoken.get_encoding(settings.TOKENIZER_ENCODING))
+    except Exception as e:
+        print(f"Tokenizer: tiktoken encoding unavailable ({e}); using regex token counts")
+        return RegexTokenizer()
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count(text)
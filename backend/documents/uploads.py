@@ -0,0 +1,160 @@
+# documents/uploads.py
+"""Resumable uploads assembled from byte ranges.
+
+A client creates an ``UploadSession``, PUTs consecutive byte ranges (each with
+its SHA-256) and finalises once every byte has arrived. Parts are written
+straight into a temporary file under RESUMABLE_UPLOAD_DIR, so nothing larger
+than one read block is held in memory. After a dropped connection the client
+asks for the session's offset and resumes from there.
+"""
+import hashlib
+import os
+import re
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from .models import UploadSession
+from .storage import hash_file, move_into_place
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+# Bytes read from the request per write
+PART_READ_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """An upload request that cannot be applied; carries the HTTP status to respond with"""
+
+    def __init__(self, message: str, status: int = 400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def parse_content_range(header: str) -> Tuple[int, int, Optional[int]]:
+    """Parse ``bytes start-end/total`` into ``(start, length, total)``; ``end`` is inclusive"""
+    match = CONTENT_RANGE_RE.match(header.strip())
+    if not match:
+        raise UploadError('Content-Range must look like "bytes <start>-<end>/<total>"')
+    start, end = int(match.group(1)), int(match.group(2))
+    if end < start:
+        raise UploadError('Content-Range end is before its start')
+    total = None if match.group(3) == '*' else int(match.group(3))
+    return start, end - start + 1, total
+
+
+def create_session(filename: str, total_size: int, expected_sha256: str = '') -> UploadSession:
+    """Open a session and create its empty partial file"""
+    if total_size <= 0:
+        raise UploadError('total_size must be positive')
+    if total_size > settings.RESUMABLE_UPLOAD_MAX_SIZE:
+        raise UploadError('File is larger than the upload limit', status=413)
+
+    expire_stale_sessions()
+    os.makedirs(settings.RESUMABLE_UPLOAD_DIR, exist_ok=True)
+    session = UploadSession(
+        filename=os.path.basename(filename),
+        total_size=total_size,
+        expected_sha256=expected_sha256.lower()
+    )
+    session.temp_path = os.path.join(settings.RESUMABLE_UPLOAD_DIR, f"{session.upload_id.hex}.part")
+    open(session.temp_path, 'wb').close()
+    session.save()
+    return session
+
+
+def append_part(session: UploadSession, stream, start: int, length: int, checksum: str) -> UploadSession:
+    """Write ``length`` bytes from ``stream`` at ``start`` and advance the session offset.
+
+    The part must start exactly at the current offset and match ``checksum``
+    (SHA-256 hex); otherwise the partial file is truncated back to the offset.
+    """
+    if session.status != 'active':
+        raise UploadError(f"Upload is {session.status}", status=409)
+    if start != session.received_bytes:
+        raise UploadError('Part does not start at the current offset', status=409,
+                          offset=session.received_bytes)
+    if start + length > session.total_size:
+        raise UploadError('Part extends past the declared file size', status=416)
+    if length > settings.RESUMABLE_UPLOAD_MAX_PART_SIZE:
+        raise UploadError('Part is larger than the part size limit', status=413)
+
+    sha256 = hashlib.sha256()
+    written = 0
+    with open(session.temp_path, 'r+b') as f:
+        f.seek(start)
+        while written < length:
+            block = stream.read(min(PART_READ_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            sha256.update(block)
+            f.write(block)
+            written += len(block)
+
+        if written != length:
+            f.truncate(start)
+            raise UploadError(f"Received {written} of {length} bytes", offset=start)
+        if sha256.hexdigest() != checksum.lower():
+            f.truncate(start)
+            raise UploadError('Part checksum mismatch', status=422, offset=start)
+
+    # Only one writer may advance the offset past this part
+    advanced = UploadSession.objects.filter(
+        pk=session.pk, status='active', received_bytes=start
+    ).update(
+        received_bytes=start + length,
+        parts_received=F('parts_received') + 1,
+        updated_at=timezone.now()
+    )
+    session.refresh_from_db()
+    if not advanced:
+        raise UploadError('Upload was modified concurrently', status=409, offset=session.received_bytes)
+    return session
+
+
+def finalize_session(session: UploadSession) -> Tuple[str, str]:
+    """Verify a complete upload and move it into content-addressed storage.
+
+    Returns ``(file_path, sha256)``. The caller hands the file to ingestion and
+    records the resulting document on the session.
+    """
+    if session.status != 'active':
+        raise UploadError(f"Upload is {session.status}", status=409)
+    if session.received_bytes != session.total_size:
+        raise UploadError('Upload is incomplete', status=409, offset=session.received_bytes)
+
+    digest = hash_file(session.temp_path)
+    if session.expected_sha256 and digest != session.expected_sha256:
+        _close_session(session, 'failed', 'File checksum mismatch')
+        raise UploadError('File checksum mismatch', status=422)
+
+    file_path = move_into_place(session.temp_path, digest, session.filename)
+    session.status = 'completed'
+    session.save(update_fields=['status', 'updated_at'])
+    return file_path, digest
+
+
+def abort_session(session: UploadSession) -> None:
+    if session.status == 'active':
+        _close_session(session, 'aborted')
+
+
+def _close_session(session: UploadSession, status: str, error_message: str = '') -> None:
+    if os.path.exists(session.temp_path):
+        os.remove(session.temp_path)
+    session.status = status
+    session.error_message = error_message
+    session.save(update_fields=['status', 'error_message', 'updated_at'])
+
+
+def expire_stale_sessions() -> int:
+    """Abort sessions idle longer than RESUMABLE_UPLOAD_EXPIRY and delete their partial files"""
+    cutoff = timezone.now() - timedelta(seconds=settings.RESUMABLE_UPLOAD_EXPIRY)
+    stale = list(UploadSession.objects.filter(status='active', updated_at__lt=cutoff))
+    for session in stale:
+        _close_session(session, 'aborted', 'Upload expired')
+    return len(stale)
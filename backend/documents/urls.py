@@ -8,11 +8,27 @@ urlpatterns = [
     # Document endpoints
     path('documents/', views.DocumentListView.as_view(), name='document-list'),
     path('documents/upload/', views.DocumentUploadView.as_view(), name='document-upload'),
+    path('documents/batch-upload/', views.BatchUploadView.as_view(), name='document-batch-upload'),
     path('documents/<int:document_id>/', views.document_detail, name='document-detail'),
     path('documents/<int:document_id>/delete/', views.document_delete, name='document-delete'),
+    path('documents/<int:document_id>/replace/', views.DocumentReplaceView.as_view(), name='document-replace'),
+    path('documents/<int:document_id>/near-duplicates/', views.document_near_duplicates, name='document-near-duplicates'),
+    path('documents/near-duplicates/', views.NearDuplicateLookupView.as_view(), name='near-duplicate-lookup'),
+    
+    # Resumable uploads
+    path('uploads/', views.UploadSessionView.as_view(), name='upload-session'),
+    path('uploads/<uuid:upload_id>/', views.UploadSessionDetailView.as_view(), name='upload-session-detail'),
+    path('uploads/<uuid:upload_id>/complete/', views.UploadSessionCompleteView.as_view(), name='upload-session-complete'),
+    
+    # Ingestion job status
+    path('jobs/<int:job_id>/', views.job_status, name='job-status'),
     
     # Q&A endpoint
     path('ask/', views.QuestionAnswerView.as_view(), name='ask-question'),
+    path('ask/cache/', views.answer_cache_stats, name='answer-cache-stats'),
+    
+    # Search across documents
+    path('search/', views.SearchView.as_view(), name='search'),
     
     # Health check
     path('health/', views.health_check, name='health-check'),
@@ -0,0 +1,485 @@
+# documents/vector_store.py
+"""Vector store backends for chunk embeddings.
+
+VECTOR_STORE_BACKEND selects the backend:
+
+- 'chroma' keeps the vectors in a persistent local Chroma collection under
+  CHROMA_DB_PATH. It falls back to 'numpy' when chromadb is not installed.
+- 'numpy' keeps them in process, in memory-mapped files under
+  VECTOR_STORE_PATH, with no separate database process. Vectors are
+  float16 rows appended to fixed-size shards. Each shard has a sidecar
+  listing the rows' embedding ids and a fixed-width metadata record per row.
+  Deletes and replaced vectors only clear the row's ``alive`` flag, until
+  ``compact()`` rewrites the live rows into a new generation of shards. A
+  search multiplies blocks of rows by the query vector (a BLAS
+  matrix-vector product) and keeps the top k of each block with
+  ``argpartition``. The top k of each shard are then merged with a heap.
+  A search within some documents only reads those documents' row ranges.
+  The files are mapped shared, so every process (e.g. gunicorn workers)
+  reads the same page-cached copy of the vectors, and rows appended by one
+  process are picked up by the others on their next search.
+
+There is one collection (or store directory) per encoder, so vectors of
+different models never mix. Every vector is keyed by its chunk's
+``embedding_id`` and carries the chunk's document id, chunk index and page
+number for filtering.
+"""
+import heapq
+import json
+import os
+import re
+import shutil
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .pipeline import batched
+
+try:
+    import chromadb
+except ImportError:
+    chromadb = None
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialised within a process
+    fcntl = None
+
+# (embedding_id, cosine similarity)
+Match = Tuple[str, float]
+
+
+def collection_name(encoder_name: str) -> str:
+    """Chroma collection for an encoder's vectors (3-63 characters of [A-Za-z0-9._-])"""
+    slug = re.sub(r'[^A-Za-z0-9._-]+', '-', encoder_name).strip('-._')[:50]
+    return f"chunks-{slug or 'default'}"
+
+
+def _where(document_id: Optional[int], page_number: Optional[int],
+           document_ids: Optional[Sequence[int]] = None) -> Optional[Dict[str, Any]]:
+    conditions = []
+    if document_id is not None:
+        conditions.append({'document_id': document_id})
+    if document_ids is not None:
+        conditions.append({'document_id': {'$in': list(document_ids)}})
+    if page_number is not None:
+        conditions.append({'page_number': page_number})
+    if len(conditions) > 1:
+        return {'$and': conditions}
+    return conditions[0] if conditions else None
+
+
+class ChromaVectorStore:
+    """Chunk vectors in a persistent Chroma collection using cosine distance"""
+
+    def __init__(self, path: str, name: str):
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(name, metadata={'hnsw:space': 'cosine'})
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, metadatas: Sequence[Dict[str, Any]]):
+        batch_size = settings.VECTOR_STORE_BATCH_SIZE
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            self.collection.upsert(
+                ids=list(ids[start:end]),
+                embeddings=vectors[start:end].tolist(),
+                metadatas=list(metadatas[start:end])
+            )
+
+    def update_metadata(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        batch_size = settings.VECTOR_STORE_BATCH_SIZE
+        for start in range(0, len(ids), batch_size):
+            self.collection.update(ids=list(ids[start:start + batch_size]),
+                                   metadatas=list(metadatas[start:start + batch_size]))
+
+    def delete(self, ids: Sequence[str]):
+        for batch in batched(ids, settings.VECTOR_STORE_BATCH_SIZE):
+            self.collection.delete(ids=batch)
+
+    def delete_document(self, document_id: int):
+        self.collection.delete(where={'document_id': document_id})
+
+    def search(self, vector: np.ndarray, limit: int, document_id: Optional[int] = None,
+               page_number: Optional[int] = None, document_ids: Optional[Sequence[int]] = None) -> List[Match]:
+        """Up to ``limit`` nearest vectors, most similar first, optionally only of the given documents"""
+        result = self.collection.query(
+            query_embeddings=[vector.tolist()],
+            n_results=limit,
+            where=_where(document_id, page_number, document_ids),
+            include=['distances']
+        )
+        return [(embedding_id, 1.0 - distance) for embedding_id, distance in zip(result['ids'][0], result['distances'][0])]
+
+    def get_document_vectors(self, document_id: int) -> Tuple[List[str], np.ndarray]:
+        """Ids and float32 vectors of a document's stored chunks"""
+        result = self.collection.get(where={'document_id': document_id}, include=['embeddings'])
+        return list(result['ids']), np.asarray(result['embeddings'], dtype=np.float32)
+
+    def iter_vectors(self, batch_size: int) -> Iterator[Tuple[List[str], List[int], np.ndarray]]:
+        """Every stored vector as batches of (ids, document ids, float32 vectors)"""
+        offset = 0
+        while True:
+            result = self.collection.get(limit=batch_size, offset=offset, include=['embeddings', 'metadatas'])
+            if not result['ids']:
+                return
+            yield (list(result['ids']), [metadata['document_id'] for metadata in result['metadatas']],
+                   np.asarray(result['embeddings'], dtype=np.float32))
+            offset += len(result['ids'])
+
+
+VECTOR_DTYPE = np.dtype('<f2')
+META_DTYPE = np.dtype([('document_id', '<i8'), ('chunk_index', '<i4'), ('page_number', '<i4'), ('alive', 'u1')])
+NO_PAGE = -1
+
+# (shard number, first row, end row) of a run of one document's rows
+Span = Tuple[int, int, int]
+
+
+class _Shard:
+    """One append-only segment: float16 vectors, embedding ids (one per line) and fixed-width row metadata.
+
+    The metadata file is written last, so its length is the shard's committed row count.
+    """
+
+    def __init__(self, prefix: str, dimension: int):
+        self.vectors_path = prefix + '.vec'
+        self.ids_path = prefix + '.ids'
+        self.meta_path = prefix + '.meta'
+        self.dimension = dimension
+        self.rows = 0
+        self.vectors = np.zeros((0, dimension), dtype=VECTOR_DTYPE)
+        self.meta = np.zeros(0, dtype=META_DTYPE)
+        self.ids: List[str] = []
+        self._ids_size = 0  # Bytes of the ids file covering ``rows``
+
+    def refresh(self) -> int:
+        """Map rows appended since the last refresh, possibly by another process; returns the first new row"""
+        first = self.rows
+        try:
+            rows = os.path.getsize(self.meta_path) // META_DTYPE.itemsize
+        except FileNotFoundError:  # Not written yet, or removed by a compaction
+            return first
+        if rows <= self.rows:
+            return first
+        with open(self.ids_path, 'rb') as file:
+            file.seek(self._ids_size)
+            lines = file.read().split(b'\n')[:rows - self.rows]
+        self._ids_size += sum(len(line) + 1 for line in lines)
+        self.ids.extend(line.decode() for line in lines)
+        self.meta = np.memmap(self.meta_path, dtype=META_DTYPE, mode='r+', shape=(rows,))
+        self.vectors = np.memmap(self.vectors_path, dtype=VECTOR_DTYPE, mode='r', shape=(rows, self.dimension))
+        self.rows = rows
+        return first
+
+    def append(self, ids: Sequence[str], vectors: np.ndarray, meta: np.ndarray):
+        # Drop anything a crashed writer left past the committed rows
+        for path, size in ((self.vectors_path, self.rows * self.dimension * VECTOR_DTYPE.itemsize),
+                           (self.ids_path, self._ids_size)):
+            if os.path.exists(path) and os.path.getsize(path) > size:
+                os.truncate(path, size)
+        with open(self.vectors_path, 'ab') as file:
+            file.write(vectors.astype(VECTOR_DTYPE).tobytes())
+        with open(self.ids_path, 'ab') as file:
+            file.write(''.join(f"{embedding_id}\n" for embedding_id in ids).encode())
+        with open(self.meta_path, 'ab') as file:
+            file.write(meta.tobytes())
+
+
+class NumpyVectorStore:
+    """Chunk vectors in append-only, memory-mapped float16 shards under ``path``"""
+
+    def __init__(self, path: str, shard_rows: Optional[int] = None):
+        self.path = path
+        self.shard_rows = shard_rows or settings.VECTOR_STORE_SHARD_ROWS
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._reset(None)
+
+    def _reset(self, generation: Optional[int]):
+        self.generation = generation
+        self.dimension: Optional[int] = None
+        self.shards: List[_Shard] = []
+        self._rows: Dict[str, Tuple[int, int]] = {}  # embedding id -> (shard, row) of its live vector
+        self._spans: Dict[int, List[Span]] = defaultdict(list)  # document id -> its row runs
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return sum(int(np.count_nonzero(shard.meta['alive'])) for shard in self.shards)
+
+    def _directory(self, generation: int) -> str:
+        return os.path.join(self.path, f"g{generation}")
+
+    def _current_generation(self) -> int:
+        try:
+            with open(os.path.join(self.path, 'CURRENT')) as file:
+                return int(file.read())
+        except FileNotFoundError:
+            return 0
+
+    def _set_generation(self, generation: int):
+        temporary = os.path.join(self.path, 'CURRENT.tmp')
+        with open(temporary, 'w') as file:
+            file.write(str(generation))
+        os.replace(temporary, os.path.join(self.path, 'CURRENT'))
+
+    def _shard(self, number: int) -> _Shard:
+        return _Shard(os.path.join(self._directory(self.generation), f"shard-{number:05d}"), self.dimension)
+
+    def _refresh(self):
+        """Pick up a new generation, new shards and rows appended since the last refresh"""
+        generation = self._current_generation()
+        if generation != self.generation:
+            self._reset(generation)
+        if self.dimension is None:
+            try:
+                with open(os.path.join(self._directory(generation), 'store.json')) as file:
+                    self.dimension = json.load(file)['dimension']
+            except FileNotFoundError:
+                return
+        number = 0
+        while True:
+            if number == len(self.shards):
+                shard = self._shard(number)
+                if not os.path.exists(shard.meta_path):
+                    return
+                self.shards.append(shard)
+            shard = self.shards[number]
+            if shard.rows < self.shard_rows:  # Full shards never change size
+                self._index_rows(number, shard.refresh())
+            number += 1
+
+    def _index_rows(self, number: int, first: int):
+        shard = self.shards[number]
+        if first == shard.rows:
+            return
+        meta = shard.meta[first:]
+        for offset in np.flatnonzero(meta['alive']).tolist():
+            self._rows[shard.ids[first + offset]] = (number, first + offset)
+        documents = meta['document_id']
+        starts = np.concatenate([[0], np.flatnonzero(np.diff(documents)) + 1])
+        ends = np.concatenate([starts[1:], [len(documents)]])
+        for start, end in zip((starts + first).tolist(), (ends + first).tolist()):
+            spans = self._spans[int(documents[start - first])]
+            if spans and spans[-1][0] == number and spans[-1][2] == start:
+                spans[-1] = (number, spans[-1][1], end)
+            else:
+                spans.append((number, start, end))
+
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """Serialise writers across threads and processes and bring the maps up to date"""
+        with self._lock, open(os.path.join(self.path, 'lock'), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _tombstone(self, locations: Iterable[Tuple[int, int]]):
+        by_shard = defaultdict(list)
+        for number, row in locations:
+            by_shard[number].append(row)
+        for number, rows in by_shard.items():
+            self.shards[number].meta['alive'][rows] = 0
+            self.shards[number].meta.flush()
+
+    def upsert(self, ids: Sequence[str], vectors: np.ndarray, metadatas: Sequence[Dict[str, Any]]):
+        with self._writing():
+            if self.dimension is None:
+                self.generation = self._current_generation()
+                os.makedirs(self._directory(self.generation), exist_ok=True)
+                with open(os.path.join(self._directory(self.generation), 'store.json'), 'w') as file:
+                    json.dump({'dimension': int(vectors.shape[1])}, file)
+                self._set_generation(self.generation)
+                self.dimension = int(vectors.shape[1])
+            self._tombstone([self._rows.pop(embedding_id) for embedding_id in ids if embedding_id in self._rows])
+
+            meta = np.zeros(len(ids), dtype=META_DTYPE)
+            meta['document_id'] = [metadata['document_id'] for metadata in metadatas]
+            meta['chunk_index'] = [metadata.get('chunk_index', 0) for metadata in metadatas]
+            meta['page_number'] = [metadata.get('page_number', NO_PAGE) for metadata in metadatas]
+            meta['alive'] = 1
+            start = 0
+            while start < len(ids):
+                if not self.shards or self.shards[-1].rows >= self.shard_rows:
+                    self.shards.append(self._shard(len(self.shards)))
+                shard = self.shards[-1]
+                end = start + min(self.shard_rows - shard.rows, len(ids) - start)
+                shard.append(ids[start:end], vectors[start:end], meta[start:end])
+                self._index_rows(len(self.shards) - 1, shard.refresh())
+                start = end
+
+    def update_metadata(self, ids: Sequence[str], metadatas: Sequence[Dict[str, Any]]):
+        with self._writing():
+            touched = set()
+            for embedding_id, metadata in zip(ids, metadatas):
+                location = self._rows.get(embedding_id)
+                if location is None:
+                    continue
+                number, row = location
+                record = self.shards[number].meta[row:row + 1]
+                record['chunk_index'] = metadata.get('chunk_index', 0)
+                record['page_number'] = metadata.get('page_number', NO_PAGE)
+                touched.add(number)
+            for number in touched:
+                self.shards[number].meta.flush()
+
+    def delete(self, ids: Sequence[str]):
+        with self._writing():
+            self._tombstone([self._rows.pop(embedding_id) for embedding_id in ids if embedding_id in self._rows])
+
+    def delete_document(self, document_id: int):
+        with self._writing():
+            for number, start, end in self._spans.pop(document_id, ()):
+                shard = self.shards[number]
+                for embedding_id in shard.ids[start:end]:
+                    if self._rows.get(embedding_id, (None, -1))[0] == number and start <= self._rows[embedding_id][1] < end:
+                        del self._rows[embedding_id]
+                shard.meta['alive'][start:end] = 0
+                shard.meta.flush()
+
+    def _search_spans(self, shard: _Shard, spans: List[Tuple[int, int]], query: np.ndarray, limit: int,
+                      page_number: Optional[int]) -> List[Tuple[float, int]]:
+        """Top ``limit`` ``(score, row)`` of one shard's row ranges, best first"""
+        block = settings.VECTOR_STORE_SEARCH_BLOCK
+        # Many short runs (e.g. a list of documents) are gathered into full blocks
+        rows = np.concatenate([np.arange(start, end) for start, end in spans])
+        found_scores, found_rows = [], []
+        for block_start in range(0, len(rows), block):
+            block_rows = rows[block_start:block_start + block]
+            first, last = int(block_rows[0]), int(block_rows[-1])
+            if last - first + 1 == len(block_rows):
+                block_rows = slice(first, last + 1)  # Contiguous: read the mapped rows without a gather
+            # Converting a block to float32 keeps the product in BLAS (sgemv)
+            scores = shard.vectors[block_rows].astype(np.float32) @ query
+            meta = shard.meta[block_rows]
+            keep = meta['alive'] == 1
+            if page_number is not None:
+                keep &= meta['page_number'] == page_number
+            scores[~keep] = -np.inf
+            top = np.argpartition(scores, -limit)[-limit:] if limit < len(scores) else np.arange(len(scores))
+            top = top[np.isfinite(scores[top])]
+            found_scores.append(scores[top])
+            found_rows.append(top + first if isinstance(block_rows, slice) else block_rows[top])
+        if not found_scores:
+            return []
+        scores, rows = np.concatenate(found_scores), np.concatenate(found_rows)
+        order = np.argsort(-scores, kind='stable')[:limit]
+        return list(zip(scores[order].tolist(), rows[order].tolist()))
+
+    def search(self, vector: np.ndarray, limit: int, document_id: Optional[int] = None,
+               page_number: Optional[int] = None, document_ids: Optional[Sequence[int]] = None) -> List[Match]:
+        """Up to ``limit`` nearest live vectors by dot product, most similar first, optionally only of the given documents.
+
+        Each shard yields its own top ``limit``; the shards' lists are merged with a heap.
+        """
+        with self._lock:
+            self._refresh()
+            shards = list(self.shards)
+            if document_id is not None or document_ids is not None:
+                wanted = [document_id] if document_id is not None else document_ids
+                spans = [span for document in wanted for span in self._spans.get(document, ())]
+            else:
+                spans = [(number, 0, shard.rows) for number, shard in enumerate(shards)]
+        by_shard = defaultdict(list)
+        for number, start, end in spans:
+            by_shard[number].append((start, end))
+        query = np.asarray(vector, dtype=np.float32)
+        tops = [
+            [(score, number, row) for score, row in self._search_spans(shards[number], shard_spans, query, limit, page_number)]
+            for number, shard_spans in sorted(by_shard.items())
+        ]
+        merged = islice(heapq.merge(*tops, key=lambda match: -match[0]), limit)
+        return [(shards[number].ids[row], score) for score, number, row in merged]
+
+    def get_document_vectors(self, document_id: int) -> Tuple[List[str], np.ndarray]:
+        """Ids and float32 vectors of a document's live rows"""
+        with self._lock:
+            self._refresh()
+            ids, vectors = [], []
+            for number, start, end in self._spans.get(document_id, ()):
+                shard = self.shards[number]
+                alive = np.flatnonzero(shard.meta['alive'][start:end]) + start
+                ids.extend(shard.ids[row] for row in alive.tolist())
+                vectors.append(shard.vectors[alive].astype(np.float32))
+            if not vectors:
+                return [], np.zeros((0, self.dimension or 0), dtype=np.float32)
+            return ids, np.concatenate(vectors)
+
+    def iter_vectors(self, batch_size: int) -> Iterator[Tuple[List[str], List[int], np.ndarray]]:
+        """Every live row as batches of (ids, document ids, float32 vectors)"""
+        with self._lock:
+            self._refresh()
+            shards = list(self.shards)
+        for shard in shards:
+            for start in range(0, shard.rows, batch_size):
+                end = min(start + batch_size, shard.rows)
+                alive = np.flatnonzero(shard.meta['alive'][start:end]) + start
+                if len(alive):
+                    yield ([shard.ids[row] for row in alive.tolist()], shard.meta['document_id'][alive].tolist(),
+                           shard.vectors[alive].astype(np.float32))
+
+    def compact(self) -> Dict[str, int]:
+        """Rewrite the live rows into a new generation of shards, each document's rows contiguous"""
+        with self._writing():
+            total = sum(shard.rows for shard in self.shards)
+            if self.dimension is None or not self.shards:
+                return {'rows_before': total, 'rows_after': 0}
+            documents, numbers, rows = [], [], []
+            for number, shard in enumerate(self.shards):
+                alive = np.flatnonzero(shard.meta['alive'])
+                documents.append(shard.meta['document_id'][alive])
+                numbers.append(np.full(len(alive), number))
+                rows.append(alive)
+            documents, numbers, rows = np.concatenate(documents), np.concatenate(numbers), np.concatenate(rows)
+            order = np.lexsort((rows, numbers, documents))
+            numbers, rows = numbers[order], rows[order]
+
+            old_directory = self._directory(self.generation)
+            generation = self.generation + 1
+            shutil.rmtree(self._directory(generation), ignore_errors=True)  # Left over from a failed compaction
+            os.makedirs(self._directory(generation))
+            with open(os.path.join(self._directory(generation), 'store.json'), 'w') as file:
+                json.dump({'dimension': self.dimension}, file)
+            for number, start in enumerate(range(0, len(rows), self.shard_rows)):
+                shard = _Shard(os.path.join(self._directory(generation), f"shard-{number:05d}"), self.dimension)
+                part_numbers, part_rows = numbers[start:start + self.shard_rows], rows[start:start + self.shard_rows]
+                vectors = np.empty((len(part_rows), self.dimension), dtype=VECTOR_DTYPE)
+                meta = np.empty(len(part_rows), dtype=META_DTYPE)
+                ids = [None] * len(part_rows)
+                for source in np.unique(part_numbers).tolist():
+                    positions = np.flatnonzero(part_numbers == source)
+                    vectors[positions] = self.shards[source].vectors[part_rows[positions]]
+                    meta[positions] = self.shards[source].meta[part_rows[positions]]
+                    for position, row in zip(positions.tolist(), part_rows[positions].tolist()):
+                        ids[position] = self.shards[source].ids[row]
+                shard.append(ids, vectors, meta)
+            self._set_generation(generation)
+            # Other processes keep reading the old files they have mapped until their next refresh
+            shutil.rmtree(old_directory, ignore_errors=True)
+            self._refresh()
+            return {'rows_before': total, 'rows_after': len(rows)}
+
+
+@lru_cache(maxsize=None)
+def get_vector_store(encoder_name: str):
+    """The configured store for an encoder's vectors"""
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == 'chroma' and chromadb is None:
+        print("Vector store: chromadb is not installed; using the memory-mapped numpy store")
+        backend = 'numpy'
+    if backend == 'chroma':
+        return ChromaVectorStore(settings.CHROMA_DB_PATH, collection_name(encoder_name))
+    if backend == 'numpy':
+        return NumpyVectorStore(os.path.join(settings.VECTOR_STORE_PATH, collection_name(encoder_name)))
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND {backend!r}")
@@ -1,12 +1,99 @@
 ﻿import os
 import json
+import tempfile
+import time
 from django.conf import settings
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views import View
-from .models import Document
-from .serializers import DocumentSerializer, QuestionSerializer
+from django.urls import reverse
+from .models import Document, IngestionJob, UploadSession
+from .serializers import (
+    DocumentSerializer, IngestionJobSerializer, QuestionSerializer, SearchSerializer,
+    UploadSessionCreateSerializer, UploadSessionSerializer
+)
+from .jobs import enqueue_document, ensure_workers_started
+from .extractors import get_document_type
+from .minhash import from_bytes
+from .answer_cache import bump_generation, cache_stats, reset_stats
+from .embeddings import delete_document_vectors
+from .near_duplicates import chunks_signature, find_near_duplicates, forget_document, near_duplicate_entries
+from .storage import hash_file, resolve_import_path, store_uploaded_file
+from .uploads import UploadError, abort_session, append_part, create_session, finalize_session, parse_content_range
+
+def _ingest_stored_file(name, file_path, digest, file_size):
+    """Queue a stored file for ingestion; return ``(document, job, deduplicated)``
+
+    If a document with the same bytes already exists its chunks are reused.
+    """
+    # Identical bytes were uploaded before: reuse that document's chunks
+    existing = (
+        Document.objects.filter(content_hash=digest)
+        .exclude(processing_status='failed')
+        .first()
+    )
+    if existing is not None:
+        print("UPLOAD: Reusing existing document", existing.pk)
+        job = existing.ingestion_jobs.order_by('-created_at').first()
+        return existing, job, True
+    
+    # Create document record
+    document = Document.objects.create(
+        title=os.path.splitext(name)[0],
+        file_path=file_path,
+        document_type=get_document_type(name),
+        file_size=file_size,
+        content_hash=digest,
+        processing_status='pending'
+    )
+    
+    print("UPLOAD: Queueing document")
+    job = enqueue_document(document, file_path)
+    ensure_workers_started()
+    return document, job, False
+
+def _ingestion_response(document, job, deduplicated, **extra):
+    if deduplicated:
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Identical document already uploaded',
+            'document_id': document.pk,
+            'deduplicated': True,
+            'processing_status': document.processing_status,
+            'job_id': job.pk if job else None,
+            'job_status_url': reverse('documents:job-status', args=[job.pk]) if job else None,
+            **extra
+        })
+    
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Document uploaded and queued for processing',
+        'document_id': document.pk,
+        'deduplicated': False,
+        'job_id': job.pk,
+        'job_status_url': reverse('documents:job-status', args=[job.pk]),
+        **extra
+    }, status=202)
+
+def _near_duplicates_of_file(file_path, exclude=None, limit=None, threshold=None):
+    """Processed documents that are near-duplicates of a file; empty if the file cannot be read"""
+    from .processors import read_chunks
+    
+    try:
+        signature = chunks_signature(read_chunks(file_path).chunks)
+    except Exception as e:
+        print("NEAR DUPLICATES: Could not read file:", str(e))
+        return []
+    return near_duplicate_entries(find_near_duplicates(signature, limit, threshold, exclude))
+
+def _near_duplicate_params(params):
+    """``(limit, threshold)`` from request parameters; raises ValueError if malformed"""
+    limit = int(params['limit']) if params.get('limit') else None
+    threshold = float(params['threshold']) if params.get('threshold') else None
+    if (limit is not None and limit < 1) or (threshold is not None and not 0 <= threshold <= 1):
+        raise ValueError('limit must be positive and threshold between 0 and 1')
+    return limit, threshold
 
 @method_decorator(csrf_exempt, name='dispatch')
 class DocumentListView(View):
@@ -30,7 +117,12 @@ class DocumentListView(View):
 
 @method_decorator(csrf_exempt, name='dispatch')
 class DocumentUploadView(View):
-    """POST: Upload and process documents"""
+    """POST: Upload a document and queue it for background processing.
+
+    The response points at the ingestion job (``job_status_url``). Near-duplicates
+    of the document are not known at upload: they are looked up once the job has
+    processed it and reported as ``near_duplicates`` in the job status.
+    """
     
     def post(self, request):
         try:
@@ -44,46 +136,394 @@ class DocumentUploadView(View):
                 }, status=400)
             
             uploaded_file = request.FILES['file']
+            file_path, digest = store_uploaded_file(uploaded_file)
             
-            # Save file
-            upload_dir = os.path.join(settings.BASE_DIR, 'media', 'documents')
-            os.makedirs(upload_dir, exist_ok=True)
-            file_path = os.path.join(upload_dir, uploaded_file.name)
-            
-            with open(file_path, 'wb+') as destination:
-                for chunk in uploaded_file.chunks():
-                    destination.write(chunk)
-            
-            # Create document record
-            document = Document.objects.create(
-                title=os.path.splitext(uploaded_file.name)[0],
-                file_path=file_path,
-                document_type='txt',
-                file_size=uploaded_file.size,
-                processing_status='processing'
-            )
+            document, job, deduplicated = _ingest_stored_file(uploaded_file.name, file_path, digest, uploaded_file.size)
+            return _ingestion_response(document, job, deduplicated)
+            
+        except Exception as e:
+            print("UPLOAD ERROR:", str(e))
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchUploadView(View):
+    """POST: Upload many documents and process them in parallel.
+
+    Accepts either a multipart request with several ``files`` parts, or a JSON
+    manifest ``{"files": ["relative/path.txt", ...]}`` naming files under
+    BATCH_IMPORT_ROOT.
+    """
+    
+    def post(self, request):
+        try:
+            start_time = time.time()
+            entries = []  # (name, file_path, digest, size) or (name, error)
+            
+            if request.content_type == 'application/json':
+                try:
+                    manifest = json.loads(request.body)
+                except json.JSONDecodeError:
+                    return JsonResponse({
+                        'status': 'error',
+                        'message': 'Invalid JSON data'
+                    }, status=400)
+                
+                files = manifest.get('files') if isinstance(manifest, dict) else None
+                if not isinstance(files, list) or not all(isinstance(name, str) for name in files):
+                    return JsonResponse({
+                        'status': 'error',
+                        'message': 'Manifest must be an object with a "files" list of paths'
+                    }, status=400)
+                
+                for relative_path in files:
+                    if os.path.splitext(relative_path)[1].lower() not in settings.ALLOWED_FILE_EXTENSIONS:
+                        entries.append((relative_path, 'Unsupported file type'))
+                        continue
+                    try:
+                        file_path = resolve_import_path(relative_path)
+                        entries.append((relative_path, file_path, hash_file(file_path), os.path.getsize(file_path)))
+                    except ValueError as e:
+                        entries.append((relative_path, str(e)))
+            else:
+                for uploaded_file in request.FILES.getlist('files'):
+                    if os.path.splitext(uploaded_file.name)[1].lower() not in settings.ALLOWED_FILE_EXTENSIONS:
+                        entries.append((uploaded_file.name, 'Unsupported file type'))
+                        continue
+                    file_path, digest = store_uploaded_file(uploaded_file)
+                    entries.append((uploaded_file.name, file_path, digest, uploaded_file.size))
+            
+            if not entries:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'No files provided'
+                }, status=400)
+            
+            results = []
+            to_process = []
+            for entry in entries:
+                if len(entry) == 2:
+                    results.append({'file': entry[0], 'status': 'error', 'error': entry[1]})
+                    continue
+                
+                name, file_path, digest, size = entry
+                existing = (
+                    Document.objects.filter(content_hash=digest)
+                    .exclude(processing_status='failed')
+                    .first()
+                )
+                if existing is not None:
+                    results.append({
+                        'file': name,
+                        'status': 'success',
+                        'document_id': existing.pk,
+                        'deduplicated': True
+                    })
+                    continue
+                
+                document = Document.objects.create(
+                    title=os.path.splitext(os.path.basename(name))[0],
+                    file_path=file_path,
+                    document_type=get_document_type(name),
+                    file_size=size,
+                    content_hash=digest,
+                    processing_status='processing'
+                )
+                results.append({'file': name, 'document_id': document.pk, 'deduplicated': False})
+                to_process.append((document.pk, file_path))
             
-            print("UPLOAD: Processing document")
-            # Import processor
             from .processors import DocumentProcessor
             
             processor = DocumentProcessor()
-            result = processor.process_document(document.pk, file_path)
+            batch = processor.process_batch(to_process) if to_process else {'results': [], 'timings': {}}
+            processed = {item['document_id']: item for item in batch['results']}
+            for result in results:
+                if result.get('deduplicated') is False:
+                    result.update(processed[result['document_id']])
             
             return JsonResponse({
                 'status': 'success',
-                'message': 'Document uploaded successfully',
+                'results': results,
+                'timings': {
+                    **batch['timings'],
+                    'request_time': time.time() - start_time
+                }
+            })
+            
+        except Exception as e:
+            print("BATCH UPLOAD ERROR:", str(e))
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class DocumentReplaceView(View):
+    """POST: Replace a document's file and re-ingest only the chunks that changed"""
+    
+    def post(self, request, document_id):
+        try:
+            try:
+                document = Document.objects.get(id=document_id)
+            except Document.DoesNotExist:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Document not found'
+                }, status=404)
+            
+            if 'file' not in request.FILES:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'No file provided'
+                }, status=400)
+            
+            uploaded_file = request.FILES['file']
+            file_path, digest = store_uploaded_file(uploaded_file)
+            
+            if digest == document.content_hash and document.processing_status == 'completed':
+                return JsonResponse({
+                    'status': 'success',
+                    'message': 'Document content is unchanged',
+                    'document_id': document.pk
+                })
+            
+            document.file_path = file_path
+            document.document_type = get_document_type(uploaded_file.name)
+            document.file_size = uploaded_file.size
+            document.content_hash = digest
+            document.save(update_fields=['file_path', 'document_type', 'file_size', 'content_hash', 'updated_at'])
+            # Answers about the old file are not served once it has been replaced
+            bump_generation(document.pk)
+            
+            print("REPLACE: Queueing incremental update of document", document.pk)
+            job = enqueue_document(document, file_path, incremental=True)
+            ensure_workers_started()
+            
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Document replaced and queued for incremental processing',
                 'document_id': document.pk,
-                'processing_result': result
+                'job_id': job.pk,
+                'job_status_url': reverse('documents:job-status', args=[job.pk])
+            }, status=202)
+            
+        except Exception as e:
+            print("REPLACE ERROR:", str(e))
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionView(View):
+    """POST: Start a resumable upload
+
+    Body: ``{"filename": "big.pdf", "total_size": 5368709120, "sha256": "<optional>"}``.
+    Send the bytes with PUT requests to the returned ``upload_url``.
+    """
+    
+    def post(self, request):
+        try:
+            try:
+                data = json.loads(request.body)
+            except json.JSONDecodeError:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Invalid JSON data'
+                }, status=400)
+            
+            serializer = UploadSessionCreateSerializer(data=data)
+            if not serializer.is_valid():
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Invalid data',
+                    'errors': serializer.errors
+                }, status=400)
+            
+            filename = serializer.validated_data['filename']
+            if os.path.splitext(filename)[1].lower() not in settings.ALLOWED_FILE_EXTENSIONS:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Unsupported file type'
+                }, status=400)
+            
+            session = create_session(
+                filename,
+                serializer.validated_data['total_size'],
+                serializer.validated_data['sha256']
+            )
+            print("UPLOAD SESSION: Started", session.upload_id)
+            
+            return JsonResponse({
+                'status': 'success',
+                'upload': UploadSessionSerializer(session).data,
+                'upload_url': reverse('documents:upload-session-detail', args=[session.upload_id]),
+                'complete_url': reverse('documents:upload-session-complete', args=[session.upload_id]),
+                'max_part_size': settings.RESUMABLE_UPLOAD_MAX_PART_SIZE
+            }, status=201)
+            
+        except UploadError as e:
+            return _upload_error_response(e)
+        except Exception as e:
+            print("UPLOAD SESSION ERROR:", str(e))
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionDetailView(View):
+    """GET: Current offset, PUT: Append a byte range, DELETE: Abort the upload
+
+    A PUT body is the raw bytes of one part, with headers
+    ``Content-Range: bytes <start>-<end>/<total>`` and ``X-Part-SHA256: <hex>``.
+    """
+    
+    def get(self, request, upload_id):
+        try:
+            session = UploadSession.objects.get(upload_id=upload_id)
+        except UploadSession.DoesNotExist:
+            return _upload_not_found()
+        
+        return JsonResponse({
+            'status': 'success',
+            'upload': UploadSessionSerializer(session).data
+        })
+    
+    def put(self, request, upload_id):
+        try:
+            try:
+                session = UploadSession.objects.get(upload_id=upload_id)
+            except UploadSession.DoesNotExist:
+                return _upload_not_found()
+            
+            content_range = request.headers.get('Content-Range')
+            checksum = request.headers.get('X-Part-SHA256')
+            if not content_range or not checksum:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Content-Range and X-Part-SHA256 headers are required'
+                }, status=400)
+            
+            start, length, total = parse_content_range(content_range)
+            if total is not None and total != session.total_size:
+                raise UploadError('Content-Range total does not match the session size')
+            
+            # Read from the request stream, not request.body, so parts bypass DATA_UPLOAD_MAX_MEMORY_SIZE
+            session = append_part(session, request, start, length, checksum)
+            
+            return JsonResponse({
+                'status': 'success',
+                'upload': UploadSessionSerializer(session).data
             })
             
+        except UploadError as e:
+            return _upload_error_response(e)
         except Exception as e:
-            print("UPLOAD ERROR:", str(e))
+            print("UPLOAD PART ERROR:", str(e))
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=500)
+    
+    def delete(self, request, upload_id):
+        try:
+            session = UploadSession.objects.get(upload_id=upload_id)
+        except UploadSession.DoesNotExist:
+            return _upload_not_found()
+        
+        abort_session(session)
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Upload aborted'
+        })
+
+@method_decorator(csrf_exempt, name='dispatch')
+class UploadSessionCompleteView(View):
+    """POST: Finalise a resumable upload and queue the assembled file for ingestion"""
+    
+    def post(self, request, upload_id):
+        try:
+            try:
+                session = UploadSession.objects.get(upload_id=upload_id)
+            except UploadSession.DoesNotExist:
+                return _upload_not_found()
+            
+            file_path, digest = finalize_session(session)
+            print("UPLOAD SESSION: Completed", session.upload_id)
+            
+            document, job, deduplicated = _ingest_stored_file(
+                session.filename, file_path, digest, session.total_size
+            )
+            session.document = document
+            session.save(update_fields=['document', 'updated_at'])
+            
+            return _ingestion_response(document, job, deduplicated, upload_id=str(session.upload_id))
+            
+        except UploadError as e:
+            return _upload_error_response(e)
+        except Exception as e:
+            print("UPLOAD COMPLETE ERROR:", str(e))
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=500)
+
+@method_decorator(csrf_exempt, name='dispatch')
+class NearDuplicateLookupView(View):
+    """POST: Find processed documents that are near-duplicates of a file without ingesting it"""
+    
+    def post(self, request):
+        try:
+            if 'file' not in request.FILES:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'No file provided'
+                }, status=400)
+            try:
+                limit, threshold = _near_duplicate_params(request.POST)
+            except ValueError as e:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': str(e)
+                }, status=400)
+            
+            uploaded_file = request.FILES['file']
+            # Extractors need a path with the original extension
+            with tempfile.NamedTemporaryFile(suffix=os.path.splitext(uploaded_file.name)[1], delete=False) as temp:
+                for part in uploaded_file.chunks():
+                    temp.write(part)
+            try:
+                near_duplicates = _near_duplicates_of_file(temp.name, limit=limit, threshold=threshold)
+            finally:
+                os.remove(temp.name)
+            
+            return JsonResponse({
+                'status': 'success',
+                'near_duplicates': near_duplicates
+            })
+        except Exception as e:
+            print("NEAR DUPLICATES ERROR:", str(e))
             return JsonResponse({
                 'status': 'error',
                 'message': str(e)
             }, status=500)
 
+def _upload_not_found():
+    return JsonResponse({
+        'status': 'error',
+        'message': 'Upload not found'
+    }, status=404)
+
+def _upload_error_response(error):
+    return JsonResponse({
+        'status': 'error',
+        'message': str(error),
+        **error.extra
+    }, status=error.status)
+
 @method_decorator(csrf_exempt, name='dispatch')
 class QuestionAnswerView(View):
     """POST: Ask questions about documents"""
@@ -121,6 +561,8 @@ class QuestionAnswerView(View):
             document_id = validated_data.get('document_id')
             question = validated_data.get('question')
             num_chunks = validated_data.get('num_chunks', 3)
+            page_number = validated_data.get('page_number')
+            retrieval_mode = validated_data.get('retrieval_mode')
             # Ensure question is a valid string
             if question is None:
                 return JsonResponse({
@@ -151,7 +593,7 @@ class QuestionAnswerView(View):
             from .processors import DocumentProcessor
             
             processor = DocumentProcessor()
-            result = processor.ask_question(document.pk, question, num_chunks)
+            result = processor.ask_question(document.pk, question, num_chunks, page_number, retrieval_mode)
             
             return JsonResponse({
                 'status': 'success',
@@ -168,6 +610,67 @@ class QuestionAnswerView(View):
                 'message': str(e)
             }, status=500)
 
+@method_decorator(csrf_exempt, name='dispatch')
+class SearchView(View):
+    """POST: Find the chunks nearest to a query across all documents, or a list of documents"""
+    
+    def post(self, request):
+        try:
+            try:
+                data = json.loads(request.body)
+            except json.JSONDecodeError:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Invalid JSON data'
+                }, status=400)
+            
+            serializer = SearchSerializer(data=data)
+            if not serializer.is_valid():
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Invalid data',
+                    'errors': serializer.errors
+                }, status=400)
+            
+            query = serializer.validated_data['query']
+            from .processors import DocumentProcessor
+            
+            result = DocumentProcessor().search(
+                query, serializer.validated_data['limit'], serializer.validated_data.get('document_ids')
+            )
+            if 'error' in result:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': result['error']
+                }, status=503)
+            
+            return JsonResponse({
+                'status': 'success',
+                'query': query,
+                **result
+            })
+        except Exception as e:
+            print("SEARCH ERROR:", str(e))
+            return JsonResponse({
+                'status': 'error',
+                'message': str(e)
+            }, status=500)
+
+@csrf_exempt
+def answer_cache_stats(request):
+    """GET: Hit and miss counts of this process's ask_question cache; DELETE: reset the counts"""
+    if request.method == 'DELETE':
+        reset_stats()
+    elif request.method != 'GET':
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Method not allowed'
+        }, status=405)
+    return JsonResponse({
+        'status': 'success',
+        'cache': cache_stats()
+    })
+
 def health_check(request):
     """Health check endpoint"""
     return JsonResponse({
@@ -198,6 +701,53 @@ def document_detail(request, document_id):
             'message': str(e)
         }, status=500)
 
+def document_near_duplicates(request, document_id):
+    """GET: Processed documents that are near-duplicates of a document"""
+    try:
+        document = Document.objects.only('id', 'minhash').get(id=document_id)
+    except Document.DoesNotExist:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Document not found'
+        }, status=404)
+    if document.minhash is None:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Document has not been processed yet'
+        }, status=409)
+    try:
+        limit, threshold = _near_duplicate_params(request.GET)
+    except ValueError as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=400)
+    
+    start_time = time.perf_counter()
+    matches = find_near_duplicates(from_bytes(document.minhash), limit, threshold, exclude=document.pk)
+    lookup_time = time.perf_counter() - start_time
+    return JsonResponse({
+        'status': 'success',
+        'document_id': document.pk,
+        'near_duplicates': near_duplicate_entries(matches),
+        'lookup_time': lookup_time
+    })
+
+def job_status(request, job_id):
+    """GET: Get ingestion job status and progress"""
+    try:
+        job = IngestionJob.objects.select_related('document').get(id=job_id)
+    except IngestionJob.DoesNotExist:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'Job not found'
+        }, status=404)
+    
+    return JsonResponse({
+        'status': 'success',
+        'job': IngestionJobSerializer(job).data
+    })
+
 @csrf_exempt
 def document_delete(request, document_id):
     """DELETE: Delete a document and its chunks"""
@@ -205,6 +755,8 @@ def document_delete(request, document_id):
         try:
             document = Document.objects.get(id=document_id)
             document.delete()
+            forget_document(document_id)
+            delete_document_vectors(document_id)
             return JsonResponse({
                 'status': 'success',
                 'message': 'Document deleted'
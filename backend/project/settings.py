@@ -68,6 +68,20 @@ DATABASES = {
     }
 }
 
+# Caches; 'answers' holds ask_question results (see documents/answer_cache.py).
+# Local memory caches are per process; point 'answers' at Redis or memcached to share it between workers.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'answers': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'answers',
+        'TIMEOUT': 3600,  # Seconds an answer is kept
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # Past this a third of the entries are culled
+    },
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -134,16 +148,95 @@ LM_STUDIO_URL = 'http://localhost:1234/v1/chat/completions'
 FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024  # 10MB
 
+# Resumable uploads (files larger than the in-memory limits, sent as byte ranges)
+RESUMABLE_UPLOAD_DIR = os.path.join(MEDIA_ROOT, 'uploads')  # Partial files are assembled here
+RESUMABLE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024 * 1024  # 20GB
+RESUMABLE_UPLOAD_MAX_PART_SIZE = 64 * 1024 * 1024  # Largest byte range accepted by one PUT
+RESUMABLE_UPLOAD_EXPIRY = 24 * 60 * 60  # Seconds an idle session is kept before its partial file is removed
+
+# Ingestion job queue
+INGESTION_WORKERS = 2  # Worker processes started by `manage.py run_ingestion_workers`
+INGESTION_POLL_INTERVAL = 1.0  # Seconds an idle worker waits before polling again
+INGESTION_JOB_TIMEOUT = 60 * 60  # Seconds before a job stuck in 'processing' is requeued
+INGESTION_AUTOSTART_WORKERS = DEBUG  # Run worker threads inside the web process (development)
+
+# Batch ingestion
+BATCH_PROCESS_WORKERS = None  # Extraction/chunking processes; None uses one per CPU core
+BATCH_IMPORT_ROOT = os.path.join(MEDIA_ROOT, 'imports')  # Batch manifests may only reference files under here
+
+# Staged ingestion pipeline (extract -> normalise -> chunk -> embed -> persist)
+INGESTION_PIPELINE_QUEUE_SIZE = 8  # Batches buffered between two stages before the upstream stage blocks
+INGESTION_PIPELINE_BATCH_SIZE = 256  # Paragraphs or chunks handed between stages at a time
+INGESTION_STAGE_WORKERS = {'normalise': 1, 'embed': 1}  # Threads per order-independent stage
+
+# PDF extraction
+PDF_PARALLEL_MIN_PAGES = 16  # PDFs with fewer pages are extracted serially
+PDF_PAGES_PER_TASK = 8  # Minimum pages handed to one extraction worker
+
 # Allowed file extensions
 ALLOWED_FILE_EXTENSIONS = ['.txt', '.pdf', '.docx', '.md']
 
 # Chunking configuration
-CHUNK_SIZE = 1000
-CHUNK_OVERLAP = 200
+CHUNK_SIZE = 1000  # Maximum tokens per chunk
+CHUNK_OVERLAP = 200  # Tokens of trailing paragraphs repeated at the start of the next chunk
+TOKENIZER_ENCODING = 'cl100k_base'  # tiktoken encoding used to count tokens
 MAX_CHUNKS_FOR_CONTEXT = 5
+CHUNK_BULK_BATCH_SIZE = 500  # Chunks inserted per bulk_create statement
+STREAMING_CHUNK_THRESHOLD = 10 * 1024 * 1024  # Files larger than this (bytes) are chunked while streaming
+
+# Boilerplate detection (MinHash signatures, LSH lookup)
+MINHASH_NUM_PERM = 64  # Hash functions per signature
+MINHASH_BANDS = 16  # LSH bands; MINHASH_NUM_PERM must be a multiple
+MINHASH_SHINGLE_SIZE = 3  # Words per shingle
+BOILERPLATE_SIMILARITY = 0.8  # Estimated Jaccard similarity for a chunk to count as a copy
+BOILERPLATE_MIN_DOCUMENTS = 3  # Near-duplicate chunks in at least this many documents become boilerplate
+
+# Document-level near-duplicate lookup (same signatures, one per document)
+NEAR_DUPLICATE_THRESHOLD = 0.5  # Minimum estimated similarity reported; 16 bands of 4 rows find ~90% of pairs at 0.6, ~99% at 0.7
+NEAR_DUPLICATE_LIMIT = 5  # Matches returned per lookup
+NEAR_DUPLICATE_CHECK_ON_INGEST = True  # Look up a document's near-duplicates when its ingestion job finishes; reported by the job status
+NEAR_DUPLICATE_MERGE_SIZE = 1000  # Recently added documents kept aside before merging into the sorted index
+NEAR_DUPLICATE_SYNC_INTERVAL = 5  # Seconds between checks for documents processed by other processes
+
+# BM25 ranking; weights are computed at indexing time, so run `manage.py rebuild_index` after changing these
+BM25_K1 = 1.2  # Term frequency saturation
+BM25_B = 0.75  # Chunk length normalisation
+
+# Chunk text compression at rest
+CHUNK_TEXT_CODEC = 'zstd'  # 'zstd', 'zlib' or 'none'; zstd falls back to zlib when zstandard is not installed
+CHUNK_TEXT_COMPRESSION_LEVEL = None  # None uses the codec default (zstd 3, zlib 6)
+CHUNK_TEXT_USE_DICTIONARY = True  # Use the newest dictionary from `manage.py train_compression_dictionary`
+CHUNK_TEXT_MIN_COMPRESS_SIZE = 64  # Chunks shorter than this (bytes) are stored uncompressed
 
 # Vector database configuration
 CHROMA_DB_PATH = os.path.join(BASE_DIR, 'chroma_db')
 
 # Embedding model configuration
-EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
\ No newline at end of file
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+EMBEDDING_ENCODER = 'auto'  # 'sentence-transformers', 'hashing' (deterministic offline stand-in) or 'auto' (the former if the model loads)
+EMBEDDING_DEVICE = None  # sentence-transformers device, e.g. 'cuda'; None picks automatically
+EMBEDDING_BATCH_SIZE = 256  # Chunks per encoder call
+EMBEDDING_HASHING_DIMENSION = 384  # Vector size of the hashing stand-in
+EMBED_ON_INGEST = True  # Embed chunks while processing documents (needs a vector store)
+EMBEDDING_CACHE_ENABLED = True  # Reuse vectors of chunk text embedded before instead of encoding it again
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, 'embedding_cache.sqlite3')  # SQLite file keyed by (encoder, content hash)
+VECTOR_STORE_BACKEND = 'chroma'  # 'chroma' or 'numpy' (in-process memory-mapped shards); see documents/vector_store.py
+VECTOR_STORE_BATCH_SIZE = 5000  # Vectors per upsert/delete call (chroma)
+VECTOR_STORE_PATH = os.path.join(BASE_DIR, 'vector_store')  # Shards of the numpy backend
+VECTOR_STORE_SHARD_ROWS = 1 << 20  # Vectors per numpy shard file
+VECTOR_STORE_SEARCH_BLOCK = 16384  # Rows converted to float32 and multiplied per step of a numpy search
+ASK_RETRIEVAL_MODE = 'lexical'  # Default ask_question retriever: 'lexical' (BM25), 'semantic' or 'hybrid' (both, rank-fused)
+HYBRID_CANDIDATES = 20  # Chunks each retriever contributes to a hybrid ranking
+RRF_K = 60  # Reciprocal rank fusion constant; larger values flatten the weight of top ranks
+RETRIEVAL_THREADS = 4  # Threads running the semantic leg of hybrid questions
+ANSWER_CACHE_ENABLED = True  # Cache ask_question results; size and lifetime are set in CACHES
+ANSWER_CACHE_ALIAS = 'answers'
+
+# HNSW approximate nearest-neighbour index for corpus-wide semantic search (see documents/hnsw.py)
+HNSW_ENABLED = False  # Use the index once built with `manage.py build_hnsw_index`
+HNSW_INDEX_PATH = os.path.join(BASE_DIR, 'hnsw_index')
+HNSW_M = 16  # Links per node on the upper levels (2 * M on level 0); more improves recall at the cost of memory and build time
+HNSW_EF_CONSTRUCTION = 100  # Search width while inserting
+HNSW_EF_SEARCH = 64  # Search width per query (at least the result count); raises recall and latency
+HNSW_SYNC_INTERVAL = 5  # Seconds between checks for documents embedded by other processes
+HNSW_SAVE_INTERVAL = 300  # Minimum seconds between saves of a changed index to disk
\ No newline at end of file
@@ -63,13 +63,8 @@ function App() {
         await fetchDocuments(); // Refresh the list
         setCurrentPage('dashboard');
         
-        // Show success message
-        const processingResult = response.data.processing_result;
-        if (processingResult.status === 'success') {
-          alert(`Document uploaded and processed successfully! Created ${processingResult.chunks_created} chunks.`);
-        } else {
-          alert('Document uploaded but processing failed. Please try again.');
-        }
+        // Processing runs in the background; the dashboard shows its status
+        alert('Document uploaded! It is being processed in the background.');
       } else {
         setError(response.data.message);
       }